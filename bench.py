@@ -0,0 +1,349 @@
+# bench.py
+
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import chess
+from engines import helpers
+from engines.incremental import IncrementalBoard
+from engines.search_stats import SearchStats, new_profiler, report_profile
+from game.engine_specs import make_engine, parse_spec, reset_engines
+
+# === Bộ benchmark search lặp lại được ===
+# Chạy từng engine trên cùng bộ vị trí EPD (benchmarks/positions.epd) với giới hạn cố định
+# (depth / số simulation / movetime ghi trong spec), mỗi vị trí bắt đầu từ trạng thái sạch (reset_engines).
+# Ghi lại: wall time, nodes, nodes / giây, số lần evaluate_board, bộ nhớ đỉnh (tracemalloc, chạy riêng một
+# lượt vì tracemalloc làm chậm search), time-to-depth của Negamax. Spec chạy đúng như ghi: "Negamax:depth=4" là
+# một vòng độ sâu cố định (time-to-depth chỉ có depth đó), còn time-to-depth từng vòng lấy từ case iterative
+# deepening riêng (spec có movetime, ghi "mode": "iterative"). Kết quả ra JSON; so với baseline
+# (JSON của lần chạy trước) và báo regression khi chậm hơn quá ngưỡng.
+# Chế độ perft: đếm nút cây nước đi hợp lệ để đo tốc độ sinh nước (chess.Board và IncrementalBoard).
+# Chế độ --stats / --profile: in SearchStats từng vị trí (cutoff, TT, seldepth, PV, thời gian theo phase)
+# và chạy cả bộ vị trí dưới cProfile hoặc profiler lấy mẫu (engines/search_stats.py); không đo wall time.
+#
+# Nodes theo engine: Minimax / Negamax = số node đã duyệt, MCTS / MCTS_supervised = số simulation,
+# Greedy = số nước đã thử (mỗi nước một lần đánh giá).
+# Evals = số lần gọi evaluate_board. MCTS với fast_playout (mặc định) đánh giá lá bằng playout.material_score,
+# không qua evaluate_board, nên evals ghi None ("n/a") thay vì 0.
+
+DEFAULT_EPD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "positions.epd")
+
+DEFAULT_SUITE = [
+    "Greedy",
+    "Minimax:depth=3",
+    "Negamax:depth=4",
+    # Case iterative deepening riêng để đo time-to-depth từng vòng (movetime đủ lớn để xong depth 4)
+    "Negamax:depth=4,movetime=60",
+    "MCTS:n_simulations=200,seed=0,reuse_tree=False",
+    "MCTS_supervised:n_simulations=32,reuse_tree=False",
+]
+
+# Ngưỡng regression mặc định: chậm hơn baseline 10%
+DEFAULT_THRESHOLD = 0.10
+
+# (fen, số nút perft theo depth 1, 2, 3, ...) — các vị trí perft chuẩn
+PERFT_POSITIONS = [
+    (chess.STARTING_FEN, (20, 400, 8902, 197281)),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", (48, 2039, 97862)),
+    ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", (14, 191, 2812, 43238)),
+    ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", (6, 264, 9467)),
+    ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", (44, 1486, 62379)),
+]
+
+
+def load_epd(path: str = DEFAULT_EPD) -> list:
+    """
+    [(id, fen), ...] từ file EPD (opcode id nếu có, không thì số thứ tự dòng).
+    """
+    positions = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            board, ops = chess.Board.from_epd(line)
+            positions.append((str(ops.get("id", len(positions) + 1)), board.fen()))
+    return positions
+
+
+# Module giữ số node (MCTS: số simulation) của lần search gần nhất; engine khác đếm bằng số lần đánh giá
+NODE_COUNTERS = {"Minimax": "engines.minimax", "Negamax": "engines.negamax", "MCTS": "engines.mcts",
+                 "MCTS_supervised": "engines.mcts_supervised"}
+
+
+def _nodes(name: str, evaluations: int) -> int:
+    module = sys.modules.get(NODE_COUNTERS.get(name, ""))
+    return module.nodes if module is not None else evaluations
+
+
+def _counts_evals(name: str, params: dict) -> bool:
+    # MCTS với fast_playout không gọi evaluate_board: số evals luôn là 0, không có nghĩa
+    return not (name == "MCTS" and params.get("fast_playout", True))
+
+
+def run_position(spec: str, fen: str) -> dict:
+    """
+    Chạy spec (đúng như ghi) trên một vị trí từ trạng thái sạch. Trả về move, wall_s, nodes,
+    evals (None nếu engine không đánh giá lá bằng evaluate_board) và với Negamax thêm mode
+    ("iterative" nếu spec có movetime, ngược lại "fixed") cùng time_to_depth ({depth: giây}, lấy qua on_iteration:
+    mỗi vòng iterative deepening, hoặc một lần cho vòng độ sâu cố định).
+    """
+    name, params = parse_spec(spec)
+    time_to_depth = {}
+    if name == "Negamax":
+        params["on_iteration"] = lambda depth, move, value: \
+            time_to_depth.__setitem__(depth, time.perf_counter() - start)
+    engine = make_engine(name, **params)
+    reset_engines(engine)
+    board = chess.Board(fen)
+    helpers.evaluations = 0
+    start = time.perf_counter()
+    move = engine(board)
+    wall = time.perf_counter() - start
+    evaluations = helpers.evaluations
+    result = {
+        "move": move.uci() if move is not None else None,
+        "wall_s": wall,
+        "nodes": _nodes(name, evaluations),
+        "evals": evaluations if _counts_evals(name, params) else None,
+    }
+    if name == "Negamax":
+        result["mode"] = "iterative" if params.get("movetime") is not None else "fixed"
+        result["time_to_depth"] = time_to_depth
+    return result
+
+
+def run_case(spec: str, positions: list, repeat: int = 1, memory: bool = True) -> dict:
+    """
+    Một engine trên mọi vị trí. Wall time mỗi vị trí lấy min của `repeat` lần chạy.
+    memory=True: chạy thêm một lượt dưới tracemalloc để lấy bộ nhớ đỉnh (KB) mỗi vị trí.
+    """
+    per_position = {}
+    for pos_id, fen in positions:
+        runs = [run_position(spec, fen) for _ in range(repeat)]
+        best = min(runs, key=lambda r: r["wall_s"])
+        if memory:
+            tracemalloc.start()
+            run_position(spec, fen)
+            best["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+        per_position[pos_id] = best
+
+    wall = sum(r["wall_s"] for r in per_position.values())
+    nodes = sum(r["nodes"] for r in per_position.values())
+    case = {
+        "wall_s": wall,
+        "nodes": nodes,
+        "nps": nodes / wall if wall > 0 else 0.0,
+        "evals": _sum_evals(per_position.values()),
+        "positions": per_position,
+    }
+    if memory:
+        case["peak_kb"] = max(r["peak_kb"] for r in per_position.values())
+    depths = {}
+    for r in per_position.values():
+        for depth, seconds in r.get("time_to_depth", {}).items():
+            depths[depth] = depths.get(depth, 0.0) + seconds
+    if depths:
+        case["mode"] = next(iter(per_position.values()))["mode"]
+        case["time_to_depth"] = depths
+    return case
+
+
+def _sum_evals(runs) -> int:
+    evals = [r["evals"] for r in runs]
+    return None if None in evals else sum(evals)
+
+
+def inspect_case(spec: str, positions: list, profiler: str = None, output: str = None) -> list:
+    """
+    Chạy spec trên mọi vị trí với SearchStats và in từng dòng thống kê; profiler ("cprofile" / "sampling")
+    thì các lần search (không gồm reset_engines) được profile chung, kết quả ghi ra output nếu có.
+    Trả về [stats.as_dict(), ...].
+    """
+    name, params = parse_spec(spec)
+    prof = new_profiler(profiler) if profiler else contextlib.nullcontext()
+    collected = []
+    for pos_id, fen in positions:
+        stats = SearchStats(f"{spec} [{pos_id}]")
+        engine = make_engine(name, stats=stats, **params)
+        reset_engines(engine)
+        board = chess.Board(fen)
+        with prof:
+            engine(board)
+        print(stats)
+        collected.append(stats.as_dict())
+    if profiler:
+        report_profile(prof, output)
+    return collected
+
+
+# --- Perft ---
+def perft(board: chess.Board, depth: int) -> int:
+    """
+    Số nút lá của cây nước đi hợp lệ độ sâu depth (push / pop trên chính board).
+    """
+    if depth == 1:
+        return board.legal_moves.count()
+    total = 0
+    for move in board.legal_moves:
+        board.push(move)
+        total += perft(board, depth - 1)
+        board.pop()
+    return total
+
+
+def run_perft(depth: int = 3) -> dict:
+    """
+    Perft trên PERFT_POSITIONS với chess.Board và IncrementalBoard; kiểm tra số nút với giá trị chuẩn.
+    Trả về {tên lớp board: {"nodes", "wall_s", "nps"}}; raise AssertionError nếu sai số nút.
+    """
+    results = {}
+    for cls in (chess.Board, IncrementalBoard):
+        nodes, wall = 0, 0.0
+        for fen, expected in PERFT_POSITIONS:
+            d = min(depth, len(expected))
+            board = cls(fen)
+            start = time.perf_counter()
+            count = perft(board, d)
+            wall += time.perf_counter() - start
+            assert count == expected[d - 1], f"perft({fen}, {d}) = {count}, cần {expected[d - 1]}"
+            nodes += count
+        results[cls.__name__] = {"depth": depth, "nodes": nodes, "wall_s": wall, "nps": nodes / wall}
+    return results
+
+
+# --- Báo cáo / baseline ---
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "python_chess": chess.__version__,
+        "commit": commit or None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    So kết quả với baseline. Trả về list dòng regression (rỗng = không có).
+    Search: wall time tăng quá threshold; perft (cùng depth): nps giảm quá threshold.
+    Số node / nước đi khác baseline được in ra để biết search đã đổi hành vi (không tính là regression).
+    """
+    regressions = []
+    for spec, case in results.get("search", {}).items():
+        base = baseline.get("search", {}).get(spec)
+        if base is None or "skipped" in case or "skipped" in base:
+            continue
+        ratio = case["wall_s"] / base["wall_s"] if base["wall_s"] > 0 else 1.0
+        print(f"{spec:50s} wall {base['wall_s']:8.3f}s -> {case['wall_s']:8.3f}s ({ratio - 1:+.1%})")
+        if case["nodes"] != base["nodes"]:
+            print(f"{'':50s} nodes {base['nodes']} -> {case['nodes']} (search thay đổi)")
+        changed = [pos for pos, r in case["positions"].items()
+                   if pos in base["positions"] and r["move"] != base["positions"][pos]["move"]]
+        if changed:
+            print(f"{'':50s} nước đi khác ở: {', '.join(changed)}")
+        if ratio > 1 + threshold:
+            regressions.append(f"{spec}: chậm hơn {ratio - 1:.1%} (ngưỡng {threshold:.0%})")
+    for name, case in results.get("perft", {}).items():
+        base = baseline.get("perft", {}).get(name)
+        if base is None or base.get("depth") != case["depth"]:
+            continue  # nps chỉ so được khi cùng depth
+        ratio = case["nps"] / base["nps"]
+        print(f"perft {name:44s} nps {base['nps']:10.0f} -> {case['nps']:10.0f} ({ratio - 1:+.1%})")
+        if ratio < 1 - threshold:
+            regressions.append(f"perft {name}: nps giảm {1 - ratio:.1%} (ngưỡng {threshold:.0%})")
+    return regressions
+
+
+def benchmark(specs=None, epd: str = DEFAULT_EPD, repeat: int = 1, memory: bool = True,
+              perft_depth: int = None, search: bool = True) -> dict:
+    """
+    Chạy cả bộ: search với từng spec (mặc định DEFAULT_SUITE) và perft (nếu perft_depth).
+    Engine không dựng được (ví dụ thiếu file model) được ghi "skipped" thay vì làm hỏng cả bộ.
+    """
+    results = {"environment": environment(), "search": {}}
+    if search:
+        positions = load_epd(epd)
+        results["epd"] = os.path.basename(epd)
+        for spec in specs or DEFAULT_SUITE:
+            try:
+                case = run_case(spec, positions, repeat, memory)
+            except (FileNotFoundError, ImportError) as e:
+                print(f"{spec:50s} bỏ qua: {e}")
+                results["search"][spec] = {"skipped": str(e)}
+                continue
+            results["search"][spec] = case
+            extra = f" peak {case['peak_kb']:8.0f} KB" if memory else ""
+            evals = f"{case['evals']:9d}" if case["evals"] is not None else f"{'n/a':>9s}"
+            print(f"{spec:50s} {case['wall_s']:8.3f}s {case['nodes']:9d} nodes {case['nps']:9.0f} nodes/s "
+                  f"{evals} evals{extra}")
+            if "time_to_depth" in case:
+                mode = "iterative deepening" if case["mode"] == "iterative" else "depth cố định"
+                print(f"{'':50s} time-to-depth ({mode}): " +
+                      ", ".join(f"d{d} {s:.3f}s" for d, s in sorted(case["time_to_depth"].items())))
+    if perft_depth:
+        results["perft"] = run_perft(perft_depth)
+        for name, r in results["perft"].items():
+            print(f"perft d{perft_depth} {name:40s} {r['nodes']:9d} nodes {r['wall_s']:8.3f}s {r['nps']:10.0f} nodes/s")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark search / perft, ghi JSON và so với baseline")
+    parser.add_argument("specs", nargs="*", help="spec engine (mặc định: DEFAULT_SUITE), ví dụ \"Negamax:depth=5\"")
+    parser.add_argument("--epd", default=DEFAULT_EPD)
+    parser.add_argument("--repeat", type=int, default=1, help="số lần chạy mỗi vị trí, lấy min wall time")
+    parser.add_argument("--no-memory", action="store_true", help="bỏ lượt đo bộ nhớ đỉnh (tracemalloc)")
+    parser.add_argument("--perft", type=int, default=None, metavar="DEPTH", help="chạy thêm perft độ sâu DEPTH")
+    parser.add_argument("--perft-only", action="store_true", help="chỉ chạy perft (mặc định depth 3)")
+    parser.add_argument("--json", default=None, help="ghi kết quả ra file JSON")
+    parser.add_argument("--baseline", default=None, help="JSON của lần chạy trước để so sánh")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--stats", action="store_true", help="in thống kê search từng vị trí thay vì benchmark")
+    parser.add_argument("--profile", choices=("cprofile", "sampling"), default=None,
+                        help="chạy --stats dưới profiler")
+    parser.add_argument("--profile-out", default=None,
+                        help="file kết quả profile (thêm -<engine> trước đuôi file khi có nhiều spec)")
+    args = parser.parse_args()
+
+    if args.stats or args.profile:
+        specs = args.specs or DEFAULT_SUITE
+        positions = load_epd(args.epd)
+        collected = {}
+        for spec in specs:
+            output = args.profile_out
+            if output and len(specs) > 1:
+                root, ext = os.path.splitext(output)
+                output = f"{root}-{parse_spec(spec)[0]}{ext}"
+            collected[spec] = inspect_case(spec, positions, args.profile, output)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(collected, f, indent=2)
+        sys.exit(0)
+
+    perft_depth = args.perft or (3 if args.perft_only else None)
+    results = benchmark(args.specs, args.epd, args.repeat, not args.no_memory, perft_depth,
+                        search=not args.perft_only)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("REGRESSION:", line)
+        sys.exit(1 if regressions else 0)
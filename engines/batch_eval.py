@@ -0,0 +1,100 @@
+# engines/batch_eval.py
+
+import time
+import chess
+import numpy as np
+from engines.incremental import SCORE_TABLES
+
+# Thứ tự 12 bitboard giống board_to_tensor: (piece_type - 1) + (0 nếu White, 6 nếu Black)
+PLANE_ORDER = [(pt, chess.WHITE) for pt in chess.PIECE_TYPES] + [(pt, chess.BLACK) for pt in chess.PIECE_TYPES]
+
+# Bảng điểm material + PST (White perspective) dạng (12*64,), chỉ số = plane * 64 + square
+WEIGHTS = np.array([SCORE_TABLES[color][pt][sq] for pt, color in PLANE_ORDER for sq in chess.SQUARES],
+                   dtype=np.int64)
+
+
+def board_to_bitboards(board: chess.Board) -> list:
+    """
+    12 bitboard (int 64 bit) của board theo PLANE_ORDER.
+    """
+    return [board.pieces_mask(pt, color) for pt, color in PLANE_ORDER]
+
+
+def boards_to_bitboards(boards) -> np.ndarray:
+    """
+    Gom N board thành mảng (N, 12) uint64.
+    """
+    return np.array([board_to_bitboards(b) for b in boards], dtype=np.uint64).reshape(-1, 12)
+
+
+def unpack_bitboards(bitboards: np.ndarray) -> np.ndarray:
+    """
+    (N, 12) uint64 → (N, 12, 64) uint8, phần tử [n, p, sq] = 1 nếu plane p có quân ở ô sq.
+    """
+    bb = np.ascontiguousarray(bitboards, dtype='<u8')
+    # Mỗi uint64 → 8 byte little-endian → 64 bit, bit i = ô i (a1 = 0 ... h8 = 63)
+    bits = np.unpackbits(bb.view(np.uint8), bitorder='little')
+    return bits.reshape(bb.shape[0], 12, 64)
+
+
+def evaluate_bitboards(bitboards: np.ndarray) -> np.ndarray:
+    """
+    Điểm material + PST (White perspective, centipawn) cho N vị trí cùng lúc.
+    bitboards: mảng (N, 12) uint64 theo PLANE_ORDER.
+    Trả về mảng (N,) int64, trùng với evaluate_board cho vị trí chưa kết thúc.
+    """
+    bits = unpack_bitboards(bitboards).reshape(-1, 12 * 64)
+    return bits @ WEIGHTS
+
+
+def evaluate_boards(boards) -> np.ndarray:
+    """
+    Tiện ích: evaluate_bitboards trên danh sách chess.Board.
+    """
+    return evaluate_bitboards(boards_to_bitboards(boards))
+
+
+def benchmark(sizes=(1, 64, 4096), repeat: float = 1.0, seed: int = 0):
+    """
+    Đo thông lượng (vị trí / giây) của evaluate_bitboards so với evaluate_board từng vị trí.
+    Vị trí lấy từ các ván đi ngẫu nhiên (cố định seed).
+    """
+    import random
+    from engines.helpers import material_pst_score
+
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < max(sizes):
+        b = chess.Board()
+        for _ in range(rng.randint(0, 80)):
+            moves = list(b.legal_moves)
+            if not moves:
+                break
+            b.push(rng.choice(moves))
+        boards.append(b)
+
+    results = []
+    for n in sizes:
+        bitboards = boards_to_bitboards(boards[:n])
+        assert (evaluate_bitboards(bitboards) == [material_pst_score(b) for b in boards[:n]]).all()
+
+        calls, start = 0, time.perf_counter()
+        while time.perf_counter() - start < repeat:
+            evaluate_bitboards(bitboards)
+            calls += 1
+        batch_rate = calls * n / (time.perf_counter() - start)
+
+        calls, start = 0, time.perf_counter()
+        while time.perf_counter() - start < repeat:
+            for b in boards[:n]:
+                material_pst_score(b)
+            calls += 1
+        scalar_rate = calls * n / (time.perf_counter() - start)
+
+        results.append((n, batch_rate, scalar_rate))
+        print(f"N={n:5d}: batch {batch_rate:12.0f} pos/s | từng vị trí {scalar_rate:10.0f} pos/s")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
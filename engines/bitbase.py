@@ -0,0 +1,782 @@
+# engines/bitbase.py
+
+import mmap
+import os
+import time
+import chess
+import numpy as np
+
+# === Bitbase tàn cuộc 3 và 4 quân sinh bằng phân tích ngược (retrograde) ===
+# 3 quân (KQK, KRK, KPK): bên mạnh (có thêm Q / R / P) luôn được quy về Trắng (lật bàn nếu bên mạnh là Đen).
+# 4 quân (TABLES4): hai quân ngoài hai vua; bảng lưu theo bố cục của TABLES4, chất liệu ngược màu thì lật bàn.
+# Mỗi vị trí một byte:
+#   0        : hoà
+#   1..254   : giá trị - 1 = số nửa nước tới chiếu hết khi chơi tối ưu (DTM);
+#              DTM lẻ → bên đang đi thắng, DTM chẵn → bên đang đi thua (0 = đang bị chiếu hết)
+#   255      : vị trí không hợp lệ
+# Chỉ số dùng đối xứng để bảng gọn hơn:
+#   KQK / KRK: 8 phép đối xứng, vua Trắng đưa về tam giác a1-d1-d4 (10 ô) → 10*64*64*2 byte
+#   KPK      : đối xứng trái-phải, tốt đưa về cột a-d (24 ô) → 24*64*64*2 byte
+#   4 quân   : lật trái-phải / trên-dưới đưa vua Trắng về ô a1-d4 (16 ô) → 16*64^3*2 byte (8 MB);
+#              có tốt chỉ lật trái-phải, vua Trắng ở cột a-d (32 ô) → 16 MB. Không dùng đối xứng
+#              đường chéo để mỗi vị trí có đúng một chỉ số (phân tích ngược đếm nước theo chỉ số).
+# File: bitbases/<tên>.bin, đọc bằng mmap (không nạp vào RAM cho tới khi được chạm tới).
+
+BITBASE_DIR = "bitbases"
+TABLES = {"KQK": chess.QUEEN, "KRK": chess.ROOK, "KPK": chess.PAWN}
+# Bảng 4 quân: (màu, loại) của quân 1 và quân 2. Cả hai bên đều có thể thắng (vd. Xe thắng Hậu trong KQKR).
+# Tập bảng khép kín: mọi nước ăn quân / phong cấp đều dẫn tới bảng khác trong danh sách
+# (hoặc chất liệu không đủ chiếu hết), nên không có vị trí nào phải đoán giá trị.
+TABLES4 = {
+    "KQKR": ((chess.WHITE, chess.QUEEN), (chess.BLACK, chess.ROOK)),
+    "KRKR": ((chess.WHITE, chess.ROOK), (chess.BLACK, chess.ROOK)),
+    "KRKB": ((chess.WHITE, chess.ROOK), (chess.BLACK, chess.BISHOP)),
+    "KRKN": ((chess.WHITE, chess.ROOK), (chess.BLACK, chess.KNIGHT)),
+    "KBNK": ((chess.WHITE, chess.BISHOP), (chess.WHITE, chess.KNIGHT)),
+    "KRKP": ((chess.WHITE, chess.ROOK), (chess.BLACK, chess.PAWN)),
+}
+# Bảng sau cần bảng trước cho các nước ăn quân / phong cấp (KPK: KQK / KRK; KRKP: KQKR, KRKR, KRKB, KRKN...)
+GENERATION_ORDER = ("KQK", "KRK", "KPK", "KQKR", "KRKR", "KRKB", "KRKN", "KBNK", "KRKP")
+
+# Số quân nhiều nhất (kể cả hai vua) có bảng: engine chỉ tra khi popcount(occupied) <= MAX_PIECES
+MAX_PIECES = 4
+
+DRAW = 0
+ILLEGAL = 255
+MAX_DTM = 253
+
+# Điểm (centipawn) của vị trí thắng theo bitbase: lớn hơn mọi điểm material + PST
+# nhưng nhỏ hơn điểm chiếu hết thật và INFINITY của minimax; trừ DTM để ưu tiên thắng nhanh
+BITBASE_WIN = 5_000
+
+TRIANGLE = [sq for sq in chess.SQUARES if chess.square_file(sq) <= 3 and chess.square_rank(sq) <= chess.square_file(sq)]
+TRIANGLE_INDEX = {sq: i for i, sq in enumerate(TRIANGLE)}
+# Ô tốt hợp lệ ở cột a-d: hàng 2..7
+PAWN_SQUARES = [sq for sq in chess.SQUARES if chess.square_file(sq) <= 3 and 1 <= chess.square_rank(sq) <= 6]
+PAWN_INDEX = {sq: i for i, sq in enumerate(PAWN_SQUARES)}
+# Ô của vua Trắng trong bảng 4 quân: a1-d4 (không tốt), cột a-d (có tốt)
+QUADRANT = [sq for sq in chess.SQUARES if chess.square_file(sq) <= 3 and chess.square_rank(sq) <= 3]
+QUADRANT_INDEX = {sq: i for i, sq in enumerate(QUADRANT)}
+HALF = [sq for sq in chess.SQUARES if chess.square_file(sq) <= 3]
+HALF_INDEX = {sq: i for i, sq in enumerate(HALF)}
+PAWN_TABLES4 = {name for name, men in TABLES4.items() if any(pt == chess.PAWN for _, pt in men)}
+
+# Chất liệu (các cặp (màu, loại) đã sắp xếp) → (tên bảng 4 quân, có phải lật màu không)
+MATERIAL4 = {}
+for _name, (_m1, _m2) in TABLES4.items():
+    MATERIAL4.setdefault(tuple(sorted((_m1, _m2))), (_name, False))
+    MATERIAL4.setdefault(tuple(sorted(((not _m1[0], _m1[1]), (not _m2[0], _m2[1])))), (_name, True))
+
+
+def table_size(piece_type: int) -> int:
+    return (len(PAWN_SQUARES) if piece_type == chess.PAWN else len(TRIANGLE)) * 64 * 64 * 2
+
+
+def table_size4(name: str) -> int:
+    return len(HALF if name in PAWN_TABLES4 else QUADRANT) * 64 ** 3 * 2
+
+
+def _file_size(name: str) -> int:
+    return table_size(TABLES[name]) if name in TABLES else table_size4(name)
+
+
+def _swap_diagonal(sq: int) -> int:
+    return ((sq & 7) << 3) | (sq >> 3)
+
+
+def index_of(piece_type: int, wk: int, bk: int, x: int, white_to_move: bool) -> int:
+    """
+    Chỉ số của vị trí (vua Trắng wk, vua Đen bk, quân Trắng x) trong bảng, sau khi chuẩn hoá đối xứng.
+    """
+    stm = 0 if white_to_move else 1
+    if piece_type == chess.PAWN:
+        if x & 7 > 3:
+            wk, bk, x = wk ^ 7, bk ^ 7, x ^ 7
+        return ((PAWN_INDEX[x] * 64 + wk) * 64 + bk) * 2 + stm
+    if wk & 7 > 3:
+        wk, bk, x = wk ^ 7, bk ^ 7, x ^ 7
+    if wk >> 3 > 3:
+        wk, bk, x = wk ^ 56, bk ^ 56, x ^ 56
+    if wk >> 3 > wk & 7:
+        wk, bk, x = _swap_diagonal(wk), _swap_diagonal(bk), _swap_diagonal(x)
+    return ((TRIANGLE_INDEX[wk] * 64 + bk) * 64 + x) * 2 + stm
+
+
+def index4(name: str, wk: int, bk: int, a: int, b: int, white_to_move: bool) -> int:
+    """
+    Chỉ số của vị trí 4 quân trong bảng name (a, b: ô của quân 1, quân 2 theo TABLES4[name]).
+    """
+    if wk & 7 > 3:
+        wk, bk, a, b = wk ^ 7, bk ^ 7, a ^ 7, b ^ 7
+    if name in PAWN_TABLES4:
+        k = HALF_INDEX[wk]
+    else:
+        if wk >> 3 > 3:
+            wk, bk, a, b = wk ^ 56, bk ^ 56, a ^ 56, b ^ 56
+        k = QUADRANT_INDEX[wk]
+    return ((((k * 64 + bk) * 64 + a) * 64 + b) << 1) | (0 if white_to_move else 1)
+
+
+def decode_index(piece_type: int, index: int):
+    """
+    Ngược với index_of: (wk, bk, x, white_to_move) của vị trí chuẩn hoá.
+    """
+    index, stm = divmod(index, 2)
+    if piece_type == chess.PAWN:
+        index, bk = divmod(index, 64)
+        x_index, wk = divmod(index, 64)
+        return wk, bk, PAWN_SQUARES[x_index], stm == 0
+    index, x = divmod(index, 64)
+    wk_index, bk = divmod(index, 64)
+    return TRIANGLE[wk_index], bk, x, stm == 0
+
+
+def _attacks(piece_type: int, sq: int, occupied: int) -> int:
+    if piece_type == chess.PAWN:
+        return chess.BB_PAWN_ATTACKS[chess.WHITE][sq]
+    attacks = chess.BB_RANK_ATTACKS[sq][chess.BB_RANK_MASKS[sq] & occupied] \
+        | chess.BB_FILE_ATTACKS[sq][chess.BB_FILE_MASKS[sq] & occupied]
+    if piece_type == chess.QUEEN:
+        attacks |= chess.BB_DIAG_ATTACKS[sq][chess.BB_DIAG_MASKS[sq] & occupied]
+    return attacks
+
+
+# === Sinh bảng ===
+
+def _successors(piece_type: int, wk: int, bk: int, x: int, white_to_move: bool, promotion_tables: dict):
+    """
+    Phân tích một vị trí. Trả về None nếu không hợp lệ, ngược lại (succ, exits, draw_exit, in_check):
+    - succ: chỉ số các vị trí kế tiếp trong cùng bảng
+    - exits: giá trị byte (bảng khác) của vị trí sau khi phong cấp — chỉ với KPK
+    - draw_exit: có nước dẫn tới hoà ngay (Đen ăn quân → KK)
+    - in_check: bên đi đang bị chiếu
+    """
+    if wk == bk or wk == x or bk == x or chess.BB_KING_ATTACKS[wk] & chess.BB_SQUARES[bk]:
+        return None
+    wk_bb, bk_bb, x_bb = chess.BB_SQUARES[wk], chess.BB_SQUARES[bk], chess.BB_SQUARES[x]
+    occupied = wk_bb | bk_bb | x_bb
+    black_in_check = bool(_attacks(piece_type, x, occupied) & bk_bb)
+    if white_to_move and black_in_check:
+        return None
+
+    succ, exits, draw_exit = [], [], False
+    if white_to_move:
+        for to in chess.scan_forward(chess.BB_KING_ATTACKS[wk] & ~x_bb & ~chess.BB_KING_ATTACKS[bk]):
+            succ.append(index_of(piece_type, to, bk, x, False))
+        if piece_type == chess.PAWN:
+            to = x + 8
+            if not occupied & chess.BB_SQUARES[to]:
+                if to >= chess.A8:
+                    for promoted in (chess.QUEEN, chess.ROOK):
+                        exits.append(promotion_tables[promoted][index_of(promoted, wk, bk, to, False)])
+                else:
+                    succ.append(index_of(piece_type, wk, bk, to, False))
+                    if x < chess.A3 and not occupied & chess.BB_SQUARES[to + 8]:
+                        succ.append(index_of(piece_type, wk, bk, to + 8, False))
+        else:
+            for to in chess.scan_forward(_attacks(piece_type, x, occupied) & ~wk_bb & ~bk_bb):
+                succ.append(index_of(piece_type, wk, bk, to, False))
+    else:
+        for to in chess.scan_forward(chess.BB_KING_ATTACKS[bk] & ~chess.BB_KING_ATTACKS[wk]):
+            if to == x:
+                draw_exit = True  # ăn quân không được vua bảo vệ → chỉ còn hai vua
+            elif not _attacks(piece_type, x, wk_bb | chess.BB_SQUARES[to] | x_bb) & chess.BB_SQUARES[to]:
+                succ.append(index_of(piece_type, wk, to, x, True))
+    return succ, exits, draw_exit, black_in_check if not white_to_move else False
+
+
+def generate(name: str, promotion_tables: dict = None, verbose: bool = True) -> np.ndarray:
+    """
+    Sinh bảng name ("KQK", "KRK", "KPK") bằng phân tích ngược theo từng mức DTM.
+    promotion_tables: {QUEEN: bảng KQK, ROOK: bảng KRK} (cần cho KPK).
+    Trả về mảng uint8 theo bố cục ở đầu file.
+    """
+    piece_type = TABLES[name]
+    size = table_size(piece_type)
+    start = time.perf_counter()
+
+    legal = np.zeros(size, dtype=bool)
+    white_to_move = np.zeros(size, dtype=bool)
+    mated = np.zeros(size, dtype=bool)
+    blocked = np.zeros(size, dtype=bool)      # Đen có nước ăn quân → không bao giờ thua
+    exit_dtm = np.full(size, -1, dtype=np.int32)  # Trắng: DTM nhỏ nhất qua nước phong cấp thắng
+    counts = np.zeros(size, dtype=np.int32)
+    succ_all = []
+    for index in range(size):
+        wk, bk, x, wtm = decode_index(piece_type, index)
+        white_to_move[index] = wtm
+        result = _successors(piece_type, wk, bk, x, wtm, promotion_tables)
+        if result is None:
+            continue
+        succ, exits, draw_exit, in_check = result
+        legal[index] = True
+        blocked[index] = draw_exit
+        counts[index] = len(succ)
+        succ_all.extend(succ)
+        wins = [value - 1 for value in exits if value not in (DRAW, ILLEGAL)]
+        if wins:
+            exit_dtm[index] = min(wins)
+        if not wtm and not succ and not draw_exit and in_check:
+            mated[index] = True
+
+    owner = np.repeat(np.arange(size, dtype=np.int32), counts)
+    succ_index = np.array(succ_all, dtype=np.int32)
+    dtm = np.full(size, -1, dtype=np.int32)
+    dtm[mated] = 0
+    black_can_lose = legal & ~white_to_move & ~blocked & (counts > 0)
+
+    # Dừng khi hai mức liên tiếp không có vị trí mới và không còn nước phong cấp nào chờ xử lý
+    last_exit = int(exit_dtm.max())
+    level, idle = 0, 0
+    while (idle < 2 or level <= last_exit + 1) and level < MAX_DTM:
+        level += 1
+        succ_dtm = dtm[succ_index]
+        if level % 2:
+            # Trắng đi: thắng ở mức level nếu có nước tới vị trí Đen thua ở mức level - 1
+            hit = np.bincount(owner[succ_dtm == level - 1], minlength=size) > 0
+            new = legal & white_to_move & (dtm < 0) & (hit | (exit_dtm == level - 1))
+        else:
+            # Đen đi: thua ở mức level khi mọi nước đều dẫn tới vị trí Trắng thắng (đã biết)
+            unresolved = np.bincount(owner[succ_dtm < 0], minlength=size)
+            new = black_can_lose & (dtm < 0) & (unresolved == 0)
+        dtm[new] = level
+        idle = 0 if new.any() else idle + 1
+
+    table = np.where(dtm >= 0, dtm + 1, DRAW).astype(np.uint8)
+    table[~legal] = ILLEGAL
+    if verbose:
+        print(f"{name}: {size} chỉ số, {int(legal.sum())} vị trí hợp lệ, "
+              f"{int((dtm >= 0).sum())} thắng, DTM tối đa {int(dtm.max())} nửa nước, "
+              f"{time.perf_counter() - start:.1f}s")
+    return table
+
+
+# === Sinh bảng 4 quân (numpy, theo lô vị trí) ===
+# Mỗi bên đi một mảng theo "slot" = chỉ số / 2. Thay vì lưu danh sách nước đi của từng vị trí
+# (hàng trăm triệu phần tử), các vị trí mới được giải ở mức trước được "đi lùi" (unmove) để ra
+# vị trí trước đó: thắng ở mức lẻ, còn ở mức chẵn thì giảm số nước chưa giải; hết nước chưa giải → thua.
+# Nước ăn quân / phong cấp rời bảng: giá trị lấy từ bảng đã sinh (exit), tính một lần lúc đầu.
+
+CHUNK = 1 << 20
+NO_EXIT = 1000
+
+KING_STEPS = [(df, dr) for df in (-1, 0, 1) for dr in (-1, 0, 1) if df or dr]
+KNIGHT_STEPS = [(1, 2), (2, 1), (-1, 2), (-2, 1), (1, -2), (2, -1), (-1, -2), (-2, -1)]
+ROOK_DIRS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+SLIDES = {chess.BISHOP: BISHOP_DIRS, chess.ROOK: ROOK_DIRS, chess.QUEEN: ROOK_DIRS + BISHOP_DIRS}
+PROMOTIONS = (chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT)
+
+_geometry = {}
+
+
+def _geo(name: str) -> np.ndarray:
+    """
+    Bảng tra numpy dựng một lần: bit của ô, ô giữa hai ô, ô vua / mã / tốt tấn công, cùng hàng / chéo,
+    chỉ số vua / tốt trong các bảng.
+    """
+    if not _geometry:
+        sq = np.arange(64)
+        df = np.abs((sq[:, None] & 7) - (sq[None, :] & 7))
+        dr = np.abs((sq[:, None] >> 3) - (sq[None, :] >> 3))
+        _geometry["bit"] = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+        _geometry["between"] = np.array([[chess.between(a, b) for b in chess.SQUARES] for a in chess.SQUARES],
+                                        dtype=np.uint64)
+        _geometry["king"] = np.maximum(df, dr) == 1
+        _geometry["knight"] = df * dr == 2
+        _geometry["rook"] = (df == 0) != (dr == 0)
+        _geometry["bishop"] = (df == dr) & (df > 0)
+        for color in chess.COLORS:
+            _geometry["pawn", color] = np.array([[bool(chess.BB_PAWN_ATTACKS[color][a] & chess.BB_SQUARES[b])
+                                                  for b in chess.SQUARES] for a in chess.SQUARES])
+        for key, squares in (("quadrant", QUADRANT), ("half", HALF), ("triangle", TRIANGLE),
+                             ("pawn_index", PAWN_SQUARES)):
+            index = np.full(64, -1, dtype=np.int64)
+            index[squares] = np.arange(len(squares))
+            _geometry[key] = index
+            _geometry[key + "_squares"] = np.array(squares, dtype=np.int64)
+    return _geometry[name]
+
+
+def _hits(piece_type: int, color: bool, frm: np.ndarray, target: np.ndarray, occupied: np.ndarray) -> np.ndarray:
+    """
+    Quân piece_type màu color ở frm có tấn công ô target không (occupied: bitboard các quân, uint64).
+    """
+    if piece_type == chess.KING:
+        return _geo("king")[frm, target]
+    if piece_type == chess.KNIGHT:
+        return _geo("knight")[frm, target]
+    if piece_type == chess.PAWN:
+        return _geo(("pawn", color))[frm, target]
+    if piece_type == chess.ROOK:
+        line = _geo("rook")[frm, target]
+    elif piece_type == chess.BISHOP:
+        line = _geo("bishop")[frm, target]
+    else:
+        line = _geo("rook")[frm, target] | _geo("bishop")[frm, target]
+    return line & ((_geo("between")[frm, target] & occupied) == 0)
+
+
+def _king_attacked(men: list, coords: list, color: bool, occupied: np.ndarray) -> np.ndarray:
+    """
+    Vua màu color có bị quân của bên kia tấn công không. men[0] / men[1] luôn là vua Trắng / Đen.
+    """
+    king = coords[0 if color == chess.WHITE else 1]
+    attacked = np.zeros(len(king), dtype=bool)
+    for (c, pt), sq in zip(men, coords):
+        if c != color:
+            attacked |= _hits(pt, c, sq, king, occupied)
+    return attacked
+
+
+def _occupied(coords: list) -> np.ndarray:
+    bit = _geo("bit")
+    occupied = bit[coords[0]]
+    for sq in coords[1:]:
+        occupied = occupied | bit[sq]
+    return occupied
+
+
+def _slots4(name: str, wk, bk, a, b) -> np.ndarray:
+    # index4 cho cả mảng, không có bit lượt đi
+    flip = (wk & 7) > 3
+    wk, bk, a, b = (np.where(flip, s ^ 7, s) for s in (wk, bk, a, b))
+    if name in PAWN_TABLES4:
+        k = _geo("half")[wk]
+    else:
+        flip = wk > 31
+        wk, bk, a, b = (np.where(flip, s ^ 56, s) for s in (wk, bk, a, b))
+        k = _geo("quadrant")[wk]
+    return (k << 18) | (bk << 12) | (a << 6) | b
+
+
+def _decode4(name: str, slots: np.ndarray) -> list:
+    kings = _geo("half_squares" if name in PAWN_TABLES4 else "quadrant_squares")
+    return [kings[slots >> 18], (slots >> 12) & 63, (slots >> 6) & 63, slots & 63]
+
+
+def _index3(piece_type: int, wk, bk, x, white_to_move: bool) -> np.ndarray:
+    # index_of cho cả mảng
+    stm = 0 if white_to_move else 1
+    if piece_type == chess.PAWN:
+        flip = (x & 7) > 3
+        wk, bk, x = (np.where(flip, s ^ 7, s) for s in (wk, bk, x))
+        return ((_geo("pawn_index")[x] * 64 + wk) * 64 + bk) * 2 + stm
+    flip = (wk & 7) > 3
+    wk, bk, x = (np.where(flip, s ^ 7, s) for s in (wk, bk, x))
+    flip = wk > 31
+    wk, bk, x = (np.where(flip, s ^ 56, s) for s in (wk, bk, x))
+    swap = (wk >> 3) > (wk & 7)
+    wk, bk, x = (np.where(swap, ((s & 7) << 3) | (s >> 3), s) for s in (wk, bk, x))
+    return ((_geo("triangle")[wk] * 64 + bk) * 64 + x) * 2 + stm
+
+
+def _lookup(men: list, coords: list, white_to_move: bool, tables: dict) -> np.ndarray:
+    """
+    Giá trị byte (góc nhìn bên đi) của các vị trí men / coords (2..4 quân) từ các bảng đã sinh.
+    """
+    n = len(coords[0])
+    wk, bk = coords[0], coords[1]
+    pieces = [(c, pt, sq) for (c, pt), sq in zip(men[2:], coords[2:])]
+    if not pieces or (len(pieces) == 1 and pieces[0][1] in (chess.BISHOP, chess.KNIGHT)):
+        return np.zeros(n, dtype=np.uint8)  # không đủ chất liệu chiếu hết
+    if len(pieces) == 1:
+        color, pt, x = pieces[0]
+        if color == chess.BLACK:
+            wk, bk, x, white_to_move = bk ^ 56, wk ^ 56, x ^ 56, not white_to_move
+        return tables["K" + chess.piece_symbol(pt).upper() + "K"][_index3(pt, wk, bk, x, white_to_move)]
+    name, flip = MATERIAL4[tuple(sorted((c, pt) for c, pt, _ in pieces))]
+    if flip:
+        wk, bk, white_to_move = bk ^ 56, wk ^ 56, not white_to_move
+        pieces = [(not c, pt, sq ^ 56) for c, pt, sq in pieces]
+    if (pieces[0][0], pieces[0][1]) != TABLES4[name][0]:
+        pieces.reverse()
+    slots = _slots4(name, wk, bk, pieces[0][2], pieces[1][2])
+    return tables[name][(slots << 1) | (0 if white_to_move else 1)]
+
+
+def _exits(men: list, coords: list, mover: bool, legal: np.ndarray, tables: dict):
+    """
+    Các nước rời bảng (ăn quân, phong cấp) của bên mover ở các vị trí coords.
+    Trả về (win, loss, escape, has_exit):
+    - win: DTM nhỏ nhất khi thắng qua nước rời bảng (NO_EXIT nếu không có)
+    - loss: DTM lớn nhất của các nước rời bảng bị thua (-1 nếu không có)
+    - escape: có nước rời bảng hoà / thắng → vị trí không thể thua
+    - has_exit: có ít nhất một nước rời bảng hợp lệ
+    """
+    n = len(legal)
+    win = np.full(n, NO_EXIT, dtype=np.int16)
+    loss = np.full(n, -1, dtype=np.int16)
+    escape = np.zeros(n, dtype=bool)
+    has_exit = np.zeros(n, dtype=bool)
+    occupied = _occupied(coords)
+    last_rank = 7 if mover == chess.WHITE else 0
+
+    def record(sel, child_men, child_coords, child_occupied):
+        ok = ~_king_attacked(child_men, child_coords, mover, child_occupied)
+        sel = sel[ok]
+        values = _lookup(child_men, [c[ok] for c in child_coords], mover != chess.WHITE, tables)
+        if (values == ILLEGAL).any():
+            raise ValueError("exit tới vị trí không hợp lệ")
+        dtm = values.astype(np.int16) - 1
+        draw = values == DRAW
+        has_exit[sel] = True
+        escape[sel[draw | (dtm % 2 == 0)]] = True
+        lost = ~draw & (dtm % 2 == 0)  # bên kia thua sau nước này
+        win[sel[lost]] = np.minimum(win[sel[lost]], dtm[lost] + 1)
+        won = ~draw & (dtm % 2 == 1)
+        loss[sel[won]] = np.maximum(loss[sel[won]], dtm[won] + 1)
+
+    for i, (color, pt) in enumerate(men):
+        if color != mover:
+            continue
+        # Ăn quân (không phải vua) của bên kia
+        for j in (2, 3):
+            if j >= len(men) or men[j][0] == mover:
+                continue
+            sel = np.flatnonzero(legal & _hits(pt, color, coords[i], coords[j], occupied))
+            if not len(sel):
+                continue
+            moved = [c[sel] for c in coords]
+            moved[i] = moved[j]
+            child_occupied = occupied[sel] & ~_geo("bit")[coords[i][sel]]
+            rest = [k for k in range(len(men)) if k != j]
+            child_coords = [moved[k] for k in rest]
+            promoting = (moved[i] >> 3 == last_rank) if pt == chess.PAWN else np.zeros(len(sel), dtype=bool)
+            for promoted in ((None,) if pt != chess.PAWN else (None,) + PROMOTIONS):
+                part = promoting if promoted is not None else ~promoting
+                if not part.any():
+                    continue
+                child_men = [men[k] if k != i or promoted is None else (color, promoted) for k in rest]
+                record(sel[part], child_men, [c[part] for c in child_coords], child_occupied[part])
+        # Tốt đi thẳng lên hàng cuối
+        if pt == chess.PAWN:
+            to = coords[i] + (8 if color == chess.WHITE else -8)
+            free = legal & (to >> 3 == last_rank)
+            for k, sq in enumerate(coords):
+                if k != i:
+                    free &= sq != to
+            sel = np.flatnonzero(free)
+            if not len(sel):
+                continue
+            child_coords = [c[sel] for c in coords]
+            child_coords[i] = to[sel]
+            child_occupied = (occupied[sel] & ~_geo("bit")[coords[i][sel]]) | _geo("bit")[to[sel]]
+            for promoted in PROMOTIONS:
+                child_men = [m if k != i else (color, promoted) for k, m in enumerate(men)]
+                record(sel, child_men, child_coords, child_occupied)
+    return win, loss, escape, has_exit
+
+
+def _unmoves(name: str, men: list, coords: list, mover: bool) -> np.ndarray:
+    """
+    Slot của mọi vị trí (bên mover đi) dẫn tới coords bằng một nước không ăn quân, không phong cấp
+    (chưa lọc vị trí không hợp lệ). Mỗi cặp (vị trí trước, vị trí sau) xuất hiện đúng một lần.
+    """
+    out = []
+    for axis, (color, pt) in enumerate(men):
+        if color != mover:
+            continue
+        to = coords[axis]
+        others = [sq for k, sq in enumerate(coords) if k != axis]
+
+        def vacant(sel, sq):
+            ok = np.ones(len(sel), dtype=bool)
+            for other in others:
+                ok &= other[sel] != sq
+            return ok
+
+        def emit(sel, frm):
+            moved = [c[sel] for c in coords]
+            moved[axis] = frm
+            out.append(_slots4(name, *moved))
+
+        if pt == chess.PAWN:
+            step = 8 if color == chess.WHITE else -8
+            rank = to >> 3
+            sel = np.flatnonzero(rank >= 2 if color == chess.WHITE else rank <= 5)
+            frm = to[sel] - step
+            ok = vacant(sel, frm)
+            emit(sel[ok], frm[ok])
+            # Đi hai ô từ hàng xuất phát: ô giữa cũng phải trống
+            sel = np.flatnonzero(rank == (3 if color == chess.WHITE else 4))
+            mid = to[sel] - step
+            ok = vacant(sel, mid) & vacant(sel, mid - step)
+            emit(sel[ok], mid[ok] - step)
+        elif pt in (chess.KING, chess.KNIGHT):
+            for df, dr in (KING_STEPS if pt == chess.KING else KNIGHT_STEPS):
+                f, r = (to & 7) - df, (to >> 3) - dr
+                sel = np.flatnonzero((f >= 0) & (f < 8) & (r >= 0) & (r < 8))
+                frm = r[sel] * 8 + f[sel]
+                ok = vacant(sel, frm)
+                emit(sel[ok], frm[ok])
+        else:
+            for df, dr in SLIDES[pt]:
+                sel, f, r = np.arange(len(to)), to & 7, to >> 3
+                while len(sel):
+                    f, r = f - df, r - dr
+                    ok = (f >= 0) & (f < 8) & (r >= 0) & (r < 8)
+                    sel, f, r = sel[ok], f[ok], r[ok]
+                    frm = r * 8 + f
+                    # Gặp quân khác thì tia dừng
+                    ok = vacant(sel, frm)
+                    sel, f, r, frm = sel[ok], f[ok], r[ok], frm[ok]
+                    emit(sel, frm)
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+
+def _predecessors(name: str, men: list, slots: np.ndarray, mover: bool, legal: np.ndarray) -> np.ndarray:
+    # _unmoves theo lô, chỉ giữ vị trí trước hợp lệ
+    out = []
+    for lo in range(0, len(slots), CHUNK):
+        preds = _unmoves(name, men, _decode4(name, slots[lo:lo + CHUNK]), mover)
+        out.append(preds[legal[preds]])
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+
+def generate4(name: str, tables: dict, verbose: bool = True) -> np.ndarray:
+    """
+    Sinh bảng 4 quân name (TABLES4) bằng phân tích ngược theo từng mức DTM.
+    tables: {tên: mảng uint8} các bảng đã sinh mà nước ăn quân / phong cấp dẫn tới.
+    Trả về mảng uint8 theo bố cục ở đầu file.
+    """
+    men = [(chess.WHITE, chess.KING), (chess.BLACK, chess.KING)] + list(TABLES4[name])
+    n = table_size4(name) // 2
+    start = time.perf_counter()
+
+    legal, in_check, counts, exit_win, exit_loss, escape, has_exit = ({} for _ in range(7))
+    for color in chess.COLORS:
+        legal[color] = np.zeros(n, dtype=bool)
+        in_check[color] = np.zeros(n, dtype=bool)
+        counts[color] = np.zeros(n, dtype=np.int32)
+        exit_win[color] = np.zeros(n, dtype=np.int16)
+        exit_loss[color] = np.zeros(n, dtype=np.int16)
+        escape[color] = np.zeros(n, dtype=bool)
+        has_exit[color] = np.zeros(n, dtype=bool)
+    for lo in range(0, n, CHUNK):
+        hi = min(n, lo + CHUNK)
+        coords = _decode4(name, np.arange(lo, hi, dtype=np.int64))
+        wk, bk, a, b = coords
+        ok = (wk != bk) & (wk != a) & (wk != b) & (bk != a) & (bk != b) & (a != b) & ~_geo("king")[wk, bk]
+        for (_, pt), sq in zip(men[2:], (a, b)):
+            if pt == chess.PAWN:
+                ok &= (sq >= 8) & (sq < 56)
+        occupied = _occupied(coords)
+        for color in chess.COLORS:
+            check = _king_attacked(men, coords, color, occupied)
+            # Bên không đi đang bị chiếu → không hợp lệ
+            legal[color][lo:hi] = ok & ~_king_attacked(men, coords, not color, occupied)
+            in_check[color][lo:hi] = check
+            exit_win[color][lo:hi], exit_loss[color][lo:hi], escape[color][lo:hi], has_exit[color][lo:hi] = \
+                _exits(men, coords, color, legal[color][lo:hi], tables)
+    # Số nước trong bảng của mỗi vị trí = số cách đi lùi từ vị trí sau hợp lệ
+    for color in chess.COLORS:
+        preds = _predecessors(name, men, np.flatnonzero(legal[not color]), color, legal[color])
+        counts[color] += np.bincount(preds, minlength=n).astype(np.int32)
+
+    dtm, frontier, can_lose = {}, {}, {}
+    for color in chess.COLORS:
+        dtm[color] = np.full(n, -1, dtype=np.int16)
+        mated = legal[color] & (counts[color] == 0) & ~has_exit[color] & in_check[color]
+        dtm[color][mated] = 0
+        frontier[color] = np.flatnonzero(mated)
+        # Hết nước mà không bị chiếu là hết nước đi (hoà), không bao giờ thua
+        can_lose[color] = legal[color] & ((counts[color] > 0) | has_exit[color]) & ~escape[color]
+    last_exit = max(max(int(w[w < NO_EXIT].max(initial=-1)), int(l.max())) for w, l in
+                    zip(exit_win.values(), exit_loss.values()))
+
+    # Dừng khi hai mức liên tiếp không có vị trí mới và không còn nước rời bảng nào chờ xử lý
+    level, idle = 0, 0
+    while (idle < 2 or level <= last_exit) and level < MAX_DTM:
+        level += 1
+        found = {}
+        for color in chess.COLORS:
+            preds = _predecessors(name, men, frontier[not color], color, legal[color])
+            if level % 2:
+                # Thắng ở mức level nếu có nước tới vị trí bên kia thua ở mức level - 1
+                new = exit_win[color] == level
+                new[preds] = True
+            else:
+                # Thua ở mức level khi mọi nước đều dẫn tới vị trí bên kia thắng (đã biết)
+                counts[color] -= np.bincount(preds, minlength=n).astype(np.int32)
+                new = can_lose[color] & (counts[color] == 0) & (exit_loss[color] <= level)
+            found[color] = np.flatnonzero(new & (dtm[color] < 0))
+            dtm[color][found[color]] = level
+        frontier = found
+        idle = 0 if any(len(f) for f in found.values()) else idle + 1
+
+    table = np.empty(2 * n, dtype=np.uint8)
+    for color in chess.COLORS:
+        values = np.where(dtm[color] >= 0, dtm[color] + 1, DRAW).astype(np.uint8)
+        values[~legal[color]] = ILLEGAL
+        table[(0 if color == chess.WHITE else 1)::2] = values
+    if verbose:
+        white = dtm[chess.WHITE][legal[chess.WHITE]]
+        print(f"{name}: {2 * n} chỉ số, {int(legal[chess.WHITE].sum() + legal[chess.BLACK].sum())} vị trí hợp lệ, "
+              f"Trắng đi: {int((white % 2 == 1).sum())} thắng / {int(((white >= 0) & (white % 2 == 0)).sum())} "
+              f"thua, DTM tối đa khi Trắng đi thắng {int(white[white % 2 == 1].max(initial=0))} nửa nước, "
+              f"{time.perf_counter() - start:.1f}s")
+    return table
+
+
+def generate_all(directory: str = BITBASE_DIR, verbose: bool = True) -> dict:
+    """
+    Sinh và ghi tất cả các bảng vào directory. Trả về {tên: (giây, byte)}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tables, report = {}, {}
+    for name in GENERATION_ORDER:
+        start = time.perf_counter()
+        if name in TABLES4:
+            table = generate4(name, tables, verbose)
+        else:
+            table = generate(name, {chess.QUEEN: tables.get("KQK"), chess.ROOK: tables.get("KRK")}, verbose)
+        path = os.path.join(directory, name + ".bin")
+        table.tofile(path)
+        tables[name] = table
+        report[name] = (time.perf_counter() - start, os.path.getsize(path))
+    return report
+
+
+# === Tra bảng ===
+
+_tables = {}
+
+
+def _load(name: str, directory: str = BITBASE_DIR):
+    """
+    mmap bảng name (đọc chỉ một lần), None nếu chưa sinh file.
+    """
+    key = (name, directory)
+    if key not in _tables:
+        path = os.path.join(directory, name + ".bin")
+        table = None
+        if os.path.exists(path) and os.path.getsize(path) == _file_size(name):
+            with open(path, "rb") as f:
+                table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _tables[key] = table
+    return _tables[key]
+
+
+def probe(board: chess.Board, directory: str = BITBASE_DIR):
+    """
+    Tra bitbase cho board có 3 quân (K + Q/R/P vs K) hoặc 4 quân với chất liệu trong TABLES4.
+    Trả về (wdl, dtm) theo góc nhìn bên đang đi: wdl = 1 thắng / 0 hoà / -1 thua,
+    dtm = số nửa nước tới chiếu hết (0 nếu hoà). None nếu không tra được
+    (chất liệu khác, còn quyền nhập thành / bắt tốt qua đường, hoặc chưa sinh bảng).
+    """
+    n_pieces = chess.popcount(board.occupied)
+    if n_pieces == 4:
+        return _probe4(board, directory)
+    if n_pieces != 3 or board.castling_rights:
+        return None
+    strong = board.occupied & ~board.kings
+    piece_type = board.piece_type_at(chess.lsb(strong))
+    name = "K" + chess.piece_symbol(piece_type).upper() + "K"
+    if name not in TABLES:
+        return None
+    table = _load(name, directory)
+    if table is None:
+        return None
+
+    white_strong = bool(board.occupied_co[chess.WHITE] & strong)
+    wk = board.king(white_strong)
+    bk = board.king(not white_strong)
+    x = chess.lsb(strong)
+    strong_to_move = board.turn == white_strong
+    if not white_strong:
+        # Lật bàn để bên mạnh thành Trắng
+        wk, bk, x = wk ^ 56, bk ^ 56, x ^ 56
+    value = table[index_of(piece_type, wk, bk, x, strong_to_move)]
+    if value == DRAW or value == ILLEGAL:
+        return 0, 0
+    return (1 if strong_to_move else -1), value - 1
+
+
+def _probe4(board: chess.Board, directory: str):
+    if board.castling_rights or board.has_legal_en_passant():
+        return None
+    pieces = [(board.color_at(sq), board.piece_type_at(sq), sq)
+              for sq in chess.scan_forward(board.occupied & ~board.kings)]
+    entry = MATERIAL4.get(tuple(sorted((color, pt) for color, pt, _ in pieces)))
+    if entry is None:
+        return None
+    name, flip = entry
+    table = _load(name, directory)
+    if table is None:
+        return None
+
+    wk, bk = board.king(chess.WHITE), board.king(chess.BLACK)
+    white_to_move = board.turn == chess.WHITE
+    if flip:
+        wk, bk, white_to_move = bk ^ 56, wk ^ 56, not white_to_move
+        pieces = [(not color, pt, sq ^ 56) for color, pt, sq in pieces]
+    if (pieces[0][0], pieces[0][1]) != TABLES4[name][0]:
+        pieces.reverse()
+    value = table[index4(name, wk, bk, pieces[0][2], pieces[1][2], white_to_move)]
+    if value == DRAW or value == ILLEGAL:
+        return 0, 0
+    dtm = value - 1
+    return (1 if dtm % 2 else -1), dtm
+
+
+def score(board: chess.Board):
+    """
+    Điểm White perspective (centipawn) từ bitbase, None nếu không tra được.
+    Thắng: ±(BITBASE_WIN - dtm), hoà: 0.
+    """
+    result = probe(board)
+    if result is None:
+        return None
+    wdl, dtm = result
+    if wdl == 0:
+        return 0
+    value = BITBASE_WIN - dtm
+    return value if (wdl > 0) == (board.turn == chess.WHITE) else -value
+
+
+def outcome(board: chess.Board):
+    """
+    Kết quả White perspective theo bitbase (+1 / 0 / -1), None nếu không tra được.
+    Cùng thang với kết quả rollout của MCTS.
+    """
+    value = score(board)
+    if value is None:
+        return None
+    return (value > 0) - (value < 0)
+
+
+def benchmark(directory: str = BITBASE_DIR, n_probes: int = 20000, seed: int = 0):
+    """
+    Sinh bảng (nếu chưa có) rồi đo thời gian tra (µs / lần) trên vị trí ngẫu nhiên.
+    """
+    import random
+
+    if any(_load(name, directory) is None for name in GENERATION_ORDER):
+        for name, (seconds, nbytes) in generate_all(directory).items():
+            print(f"{name}: sinh {seconds:.1f}s, {nbytes} byte")
+        _tables.clear()
+    rng = random.Random(seed)
+    for name in GENERATION_ORDER:
+        men = TABLES4[name] if name in TABLES4 else ((chess.WHITE, TABLES[name]),)
+        boards = []
+        while len(boards) < 500:
+            board = chess.Board(None)
+            squares = rng.sample(range(8, 56), 2 + len(men))
+            # Đổi màu ngẫu nhiên để tra cả hai hướng của bảng
+            swap = rng.random() < 0.5
+            board.set_piece_at(squares[0], chess.Piece(chess.KING, chess.WHITE))
+            board.set_piece_at(squares[1], chess.Piece(chess.KING, chess.BLACK))
+            for sq, (color, piece_type) in zip(squares[2:], men):
+                board.set_piece_at(sq, chess.Piece(piece_type, color != swap))
+            board.turn = rng.random() < 0.5
+            if board.is_valid():
+                boards.append(board)
+        start = time.perf_counter()
+        for i in range(n_probes):
+            probe(boards[i % len(boards)], directory)
+        print(f"{name}: {(time.perf_counter() - start) / n_probes * 1e6:5.1f} µs / lần tra, "
+              f"file {os.path.getsize(os.path.join(directory, name + '.bin'))} byte")
+
+if __name__ == "__main__":
+    benchmark()
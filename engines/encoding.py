@@ -0,0 +1,143 @@
+# engines/encoding.py
+
+import time
+import chess
+import numpy as np
+from multiprocessing import shared_memory
+from engines.batch_eval import board_to_bitboards, boards_to_bitboards
+
+# === Mã hoá board → planes (12,8,8) float32 cho mạng nơ-ron, từ 12 bitboard ===
+# Cùng quy ước với helpers.board_to_tensor: plane = (piece_type - 1) + (0 nếu White, 6 nếu Black),
+# planes[plane][7 - rank][file] = 1.0.
+# Ghi bitboard dạng big-endian thì byte đầu tiên là rank 8 (hàng 0 của plane), và unpackbits
+# bitorder='little' trên từng byte cho bit 0 = file a → ra đúng thứ tự [7 - rank][file], không cần lật.
+
+PLANES_SHAPE = (12, 8, 8)
+PLANES_BYTES = 12 * 8 * 8 * 4
+
+
+def bitboards_to_planes(bitboards: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    (N, 12) uint64 → (N, 12, 8, 8) float32. out: mảng (N, 12, 8, 8) float32 để ghi vào (không cấp phát).
+    """
+    bb = np.ascontiguousarray(bitboards, dtype='>u8')
+    bits = np.unpackbits(bb.view(np.uint8), bitorder='little').reshape(bb.shape[0], *PLANES_SHAPE)
+    if out is None:
+        return bits.astype(np.float32)
+    np.copyto(out, bits, casting='unsafe')
+    return out
+
+
+def board_to_planes(board: chess.Board) -> np.ndarray:
+    """
+    Giống hệt helpers.board_to_tensor (từng byte), nhưng dựng từ bitboard thay vì duyệt piece_map().
+    """
+    bb = np.array(board_to_bitboards(board), dtype='>u8')
+    return np.unpackbits(bb.view(np.uint8), bitorder='little').reshape(PLANES_SHAPE).astype(np.float32)
+
+
+def boards_to_planes(boards, out: np.ndarray = None) -> np.ndarray:
+    """
+    Mã hoá N board thành (N, 12, 8, 8) float32; out (nếu có) phải đủ chỗ cho N board,
+    kết quả là out[:N].
+    """
+    bitboards = boards_to_bitboards(boards)
+    if out is None:
+        return bitboards_to_planes(bitboards)
+    return bitboards_to_planes(bitboards, out[:len(bitboards)])
+
+
+class PlaneBuffer:
+    """
+    Buffer (capacity, 12, 8, 8) float32 cấp phát một lần, dùng lại cho nhiều batch.
+
+    - memory="numpy": mảng numpy thường.
+    - memory="pinned": tensor torch ở pinned memory (copy sang GPU nhanh, non_blocking=True được);
+      .array là view numpy của cùng vùng nhớ, .tensor là tensor torch. Cần CUDA.
+    - memory="shared": multiprocessing.shared_memory; process khác gắn vào bằng
+      PlaneBuffer(capacity, "shared", name=buf.name). Process tạo ra chịu trách nhiệm unlink (close()).
+    """
+
+    def __init__(self, capacity: int, memory: str = "numpy", name: str = None):
+        self.capacity = capacity
+        self.memory = memory
+        self.tensor = None
+        self.shm = None
+        self.owner = False
+        shape = (capacity, *PLANES_SHAPE)
+        if memory == "numpy":
+            self.array = np.zeros(shape, dtype=np.float32)
+        elif memory == "pinned":
+            import torch
+            self.tensor = torch.zeros(shape, dtype=torch.float32).pin_memory()
+            self.array = self.tensor.numpy()
+        elif memory == "shared":
+            if name is None:
+                self.shm = shared_memory.SharedMemory(create=True, size=capacity * PLANES_BYTES)
+                self.owner = True
+            else:
+                self.shm = shared_memory.SharedMemory(name=name)
+            self.array = np.ndarray(shape, dtype=np.float32, buffer=self.shm.buf)
+        else:
+            raise ValueError(f"memory không hợp lệ: {memory!r} (numpy / pinned / shared)")
+
+    @property
+    def name(self):
+        return self.shm.name if self.shm is not None else None
+
+    def encode(self, boards) -> np.ndarray:
+        """
+        Ghi boards vào đầu buffer, trả về view (N, 12, 8, 8). Raise ValueError nếu vượt capacity.
+        """
+        if len(boards) > self.capacity:
+            raise ValueError(f"{len(boards)} board vượt capacity {self.capacity}")
+        return boards_to_planes(boards, self.array)
+
+    def close(self):
+        if self.shm is not None:
+            self.array = None
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+            self.shm = None
+
+
+def benchmark(sizes=(1, 64, 1024), repeat: float = 1.0, seed: int = 0):
+    """
+    Đo số lần mã hoá / giây: helpers.board_to_tensor, board_to_planes và boards_to_planes theo batch.
+    """
+    import random
+    from engines.helpers import board_to_tensor
+
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < max(sizes):
+        b = chess.Board()
+        for _ in range(rng.randint(0, 80)):
+            moves = list(b.legal_moves)
+            if not moves:
+                break
+            b.push(rng.choice(moves))
+        boards.append(b)
+    for b in boards:
+        assert board_to_planes(b).tobytes() == board_to_tensor(b).tobytes()
+
+    def rate(func, n):
+        calls, start = 0, time.perf_counter()
+        while time.perf_counter() - start < repeat:
+            func()
+            calls += 1
+        return calls * n / (time.perf_counter() - start)
+
+    n = max(sizes)
+    print(f"board_to_tensor (piece_map) : {rate(lambda: [board_to_tensor(b) for b in boards], n):10.0f} board/s")
+    print(f"board_to_planes (bitboard)  : {rate(lambda: [board_to_planes(b) for b in boards], n):10.0f} board/s")
+    buffer = PlaneBuffer(n)
+    for size in sizes:
+        batch = boards[:size]
+        assert buffer.encode(batch).tobytes() == np.stack([board_to_tensor(b) for b in batch]).tobytes()
+        print(f"boards_to_planes N={size:5d}  : {rate(lambda: buffer.encode(batch), size):10.0f} board/s")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,238 @@
+# engines/eval_cache.py
+
+import chess
+from array import array
+from multiprocessing import shared_memory
+from engines.helpers import static_evaluate
+from engines.transposition import compute_key
+
+# === Cache kết quả đánh giá tĩnh (static_evaluate) theo khoá Zobrist ===
+# Greedy / minimax / negamax có biến EVAL_CACHE (mặc định None = không cache), ví dụ
+# negamax.EVAL_CACHE = minimax.EVAL_CACHE = EvalCache(max_mb=4) để dùng chung giữa hai engine.
+# evaluate_board chỉ dùng cache khi board là chess.Board thường (engine chạy với incremental=False);
+# IncrementalBoard (mặc định) luôn bỏ qua cache.
+# Chỉ phần không phụ thuộc lịch sử được cache; claim hoà (lặp lại / luật 50 nước) vẫn do
+# evaluate_board kiểm tra trên board thật.
+#
+# Khi nào nên bật (đo trên một core, python -m engines.eval_cache và các engine khác):
+#   - Chỉ có lợi khi engine search trên chess.Board thường (incremental=False): negamax d3 đấu greedy
+#     1.51s → 1.36s (hit rate 0.39), vì static_evaluate khi đó phải quét 64 ô.
+#   - Với IncrementalBoard cache làm chậm hơn: điểm material + PST đã có sẵn O(1), tính khoá Zobrist (~8 us)
+#     đắt ngang phần được tiết kiệm (negamax 0.74s → 0.92s, minimax d3 0.47s → 0.54s) → bị bỏ qua.
+#   - Greedy qua nhiều ván (hit rate 0.06) và lá rollout của MCTS (hit rate ~0) gần như không trúng cache,
+#     nên MCTS / MCTS_supervised không có EVAL_CACHE.
+#
+# Bố cục: bảng set-associative, mỗi bucket WAYS slot, bucket = key & mask.
+# Mỗi slot gồm 2 số uint64 (key ^ data, data) như bảng chuyển vị, cộng 1 byte bit tham chiếu;
+# mỗi bucket có thêm 1 byte kim đồng hồ. Thay thế theo CLOCK (second chance) trong bucket:
+# entry được đọc lại có bit tham chiếu = 1 và được bỏ qua một vòng trước khi bị loại.
+
+WAYS = 4
+SLOT_BYTES = 8 + 8 + 1
+BUCKET_BYTES = WAYS * SLOT_BYTES + 1
+
+# Bố cục data: bit 0..31 = value + VALUE_OFFSET (int32 có dấu), bit 32 = slot đang dùng
+VALUE_OFFSET = 1 << 31
+VALID = 1 << 32
+
+
+def buckets_for(max_mb: float) -> int:
+    """
+    Số bucket (luỹ thừa của 2 lớn nhất) vừa với giới hạn max_mb.
+    """
+    n_buckets = max(1, int(max_mb * 1024 * 1024) // BUCKET_BYTES)
+    return 1 << (n_buckets.bit_length() - 1)
+
+
+class EvalCache:
+    """
+    Cache đánh giá kích thước cố định (không vượt max_mb), đánh chỉ số bằng khoá Zobrist.
+    Đọc / ghi không cần khoá: entry ghi dở (bởi thread khác) không qua được kiểm tra key ^ data
+    và chỉ bị coi như miss.
+    """
+
+    def __init__(self, max_mb: float = 4):
+        self.n_buckets = buckets_for(max_mb)
+        self.size = self.n_buckets * WAYS
+        self.mask = self.n_buckets - 1
+        self.keys, self.data, self.refs, self.hands = self._allocate()
+        self.reset_stats()
+
+    def _allocate(self):
+        return (array('Q', bytes(8 * self.size)), array('Q', bytes(8 * self.size)),
+                bytearray(self.size), bytearray(self.n_buckets))
+
+    # --- Thống kê ---
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "memory_bytes": self.n_buckets * BUCKET_BYTES,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+    def clear(self):
+        for i in range(self.size):
+            self.keys[i] = 0
+            self.data[i] = 0
+            self.refs[i] = 0
+        for i in range(self.n_buckets):
+            self.hands[i] = 0
+        self.reset_stats()
+
+    # --- Đọc / ghi ---
+    def probe(self, key: int):
+        """
+        Giá trị đã cache của key, None nếu không có.
+        """
+        base = (key & self.mask) * WAYS
+        for slot in range(base, base + WAYS):
+            data = self.data[slot]
+            if data and (self.keys[slot] ^ data) == key:
+                self.refs[slot] = 1
+                self.hits += 1
+                return (data & 0xFFFFFFFF) - VALUE_OFFSET
+        self.misses += 1
+        return None
+
+    def store(self, key: int, value: int):
+        bucket = key & self.mask
+        base = bucket * WAYS
+        target = None
+        for slot in range(base, base + WAYS):
+            data = self.data[slot]
+            if data == 0 or (self.keys[slot] ^ data) == key:
+                target = slot
+                break
+        if target is None:
+            # Bucket đầy: quay kim, xoá bit tham chiếu cho tới khi gặp slot chưa được đọc lại
+            hand = self.hands[bucket]
+            while self.refs[base + hand]:
+                self.refs[base + hand] = 0
+                hand = (hand + 1) % WAYS
+            target = base + hand
+            self.hands[bucket] = (hand + 1) % WAYS
+            self.evictions += 1
+
+        data = ((value + VALUE_OFFSET) & 0xFFFFFFFF) | VALID
+        self.refs[target] = 0
+        self.keys[target] = key ^ data
+        self.data[target] = data
+        self.stores += 1
+
+    def evaluate(self, board: chess.Board) -> int:
+        """
+        static_evaluate(board), lấy từ cache nếu vị trí đã được đánh giá.
+        """
+        key = compute_key(board)
+        value = self.probe(key)
+        if value is None:
+            value = static_evaluate(board)
+            self.store(key, value)
+        return value
+
+
+class SharedEvalCache(EvalCache):
+    """
+    EvalCache nằm trong shared memory, dùng chung giữa nhiều process (và thread).
+    Cùng cơ chế kiểm tra key ^ data như SharedTranspositionTable nên không cần khoá;
+    hai process ghi cùng slot một lúc chỉ làm mất entry đó.
+
+    - name=None: tạo vùng nhớ mới (process chủ, chịu trách nhiệm unlink()).
+    - name=...: gắn vào vùng nhớ đã có, n_buckets phải khớp.
+    Bộ đếm thống kê là riêng của từng process.
+    """
+
+    def __init__(self, max_mb: float = 4, name: str = None, n_buckets: int = None):
+        self.name = name
+        self._buckets_hint = n_buckets
+        super().__init__(max_mb)
+
+    def _allocate(self):
+        if self._buckets_hint is not None:
+            self.n_buckets = self._buckets_hint
+            self.size = self.n_buckets * WAYS
+            self.mask = self.n_buckets - 1
+        nbytes = self.n_buckets * BUCKET_BYTES
+        if self.name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.name = self.shm.name
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+            self.owner = False
+        buf = self.shm.buf
+        words = 8 * self.size
+        return (buf[:words].cast('Q'), buf[words:2 * words].cast('Q'),
+                buf[2 * words:2 * words + self.size], buf[2 * words + self.size:nbytes])
+
+    def clear(self):
+        self.shm.buf[:self.n_buckets * BUCKET_BYTES] = bytes(self.n_buckets * BUCKET_BYTES)
+        self.reset_stats()
+
+    def close(self):
+        """
+        Giải phóng view vào shared memory; process chủ đồng thời unlink vùng nhớ.
+        """
+        for view in (self.keys, self.data, self.refs, self.hands):
+            view.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __getstate__(self):
+        raise TypeError("Truyền (cache.name, cache.n_buckets) sang process khác rồi tạo "
+                        "SharedEvalCache(name=..., n_buckets=...)")
+
+
+def benchmark(n_games: int = 3, depth: int = 3, max_mb: float = 4):
+    """
+    Đo thời gian và hit rate của negamax (Trắng) đấu greedy (Đen) trong vài ván ngắn,
+    có / không có cache, với board thường và IncrementalBoard. Nước đi phải giống nhau.
+    """
+    import time
+    from engines import negamax, greedy
+
+    for incremental in (False, True):
+        games = []
+        for cache in (None, EvalCache(max_mb)):
+            negamax.EVAL_CACHE = greedy.EVAL_CACHE = cache
+            start = time.perf_counter()
+            moves = []
+            for game in range(n_games):
+                board = chess.Board()
+                negamax.TT.clear()
+                while not board.is_game_over() and board.ply() < 2 * (6 + game):
+                    if board.turn == chess.WHITE:
+                        move = negamax.get_best_move(board, depth=depth, incremental=incremental)
+                    else:
+                        move = greedy.greedy_move(board, incremental=incremental)
+                    board.push(move)
+                    moves.append(move)
+            games.append(moves)
+            elapsed = time.perf_counter() - start
+            label = ("incremental" if incremental else "board thường") + \
+                (", không cache" if cache is None else f", cache {max_mb} MB")
+            extra = "" if cache is None else (f"  hits={cache.hits} misses={cache.misses} "
+                                              f"hit_rate={cache.hit_rate:.2f} evictions={cache.evictions}")
+            print(f"{label:30s}: {elapsed:6.2f}s{extra}")
+        assert games[0] == games[1]
+    negamax.EVAL_CACHE = greedy.EVAL_CACHE = None
+
+
+if __name__ == "__main__":
+    benchmark()
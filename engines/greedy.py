@@ -1,15 +1,33 @@
 # engines/greedy.py
 
+import sys
 import chess
 from engines.helpers import evaluate_board  # import hàm đánh giá tổng hợp
+from engines.incremental import as_incremental
+from engines.search_stats import collect
 
-def greedy_move(board: chess.Board) -> chess.Move:
+# Cache đánh giá (engines/eval_cache.py), None = không dùng; gán để bật (chỉ có tác dụng khi incremental=False)
+EVAL_CACHE = None
+
+def greedy_move(board: chess.Board, incremental: bool = True, stats=None) -> chess.Move:
     """
     Trả về nước đi greedy dựa trên hàm đánh giá evaluate_board:
     - Duyệt qua tất cả nước đi hợp lệ, thử đẩy lên board tạm
     - Tính giá trị đánh giá của board mới (từ White perspective)
     - Chọn nước đi tốt nhất: nếu đến lượt White thì maximize, nếu đến lượt Black thì minimize
+    - incremental: dùng IncrementalBoard, điểm material + PST sau mỗi push có sẵn (O(1))
+    - stats: engines.search_stats.SearchStats để nhận thống kê (số nước đã thử, thời gian eval)
     """
+    if stats is not None:
+        stats.engine = stats.engine or "Greedy"
+        with collect(stats, cache=EVAL_CACHE, phases=[(sys.modules[__name__], "evaluate_board", "eval")]):
+            move = greedy_move(board, incremental)
+        stats.nodes += board.legal_moves.count()
+        stats.depth = stats.seldepth = 1
+        stats.pv = [move] if move is not None else []
+        return move
+    if incremental:
+        board = as_incremental(board)
     best_move = None
 
     # Giá trị khởi tạo tùy vào bên đang đi (White maximize, Black minimize)
@@ -20,7 +38,7 @@ def greedy_move(board: chess.Board) -> chess.Move:
 
     for move in board.legal_moves:
         board.push(move)
-        value = evaluate_board(board)
+        value = evaluate_board(board, EVAL_CACHE)
         board.pop()
 
         # Nếu đến lượt White (maximize)
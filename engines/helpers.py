@@ -141,18 +141,10 @@ def get_pst_value(piece: chess.Piece, square: int) -> int:
 
 
 # === 4. Hàm đánh giá tổng hợp: material + PST ===
-def evaluate_board(board: chess.Board) -> int:
+def material_pst_score(board: chess.Board) -> int:
     """
-    Trả về giá trị đánh giá của board từ White perspective (đơn vị centipawn).
-    Giá trị dương → ưu thế White, âm → ưu thế Black.
+    Điểm material + PST (White perspective), quét toàn bộ 64 ô.
     """
-    if board.is_checkmate():
-        # Nếu checkmate, chắc chắn bên đang bị chiếu tướng / chuẩn bị chịu thua
-        # Thường gán một giá cực lớn (so với depth) để ai không lựa chọn hướng dẫn đến checkmate.
-        return -999_999 if board.turn == chess.WHITE else 999_999
-    if board.is_stalemate() or board.is_insufficient_material() or board.can_claim_draw():
-        return 0  # hoà
-
     value = 0
     # 1) Điểm vật chất
     for piece_type in PIECE_VALUES:
@@ -167,6 +159,61 @@ def evaluate_board(board: chess.Board) -> int:
 
     return value
 
+
+# Claim hoà (lặp lại 3 lần, kể cả claim ở nước kế tiếp; luật 50 nước) chỉ có thể xảy ra khi
+# đã có ít nhất 7 nửa nước liên tiếp không bắt quân / đi tốt → dưới ngưỡng này bỏ qua
+# can_claim_draw() (hàm này push/pop thử mọi nước hợp lệ nên rất đắt).
+MIN_CLAIM_DRAW_PLIES = 7
+
+MATE_SCORE = 999_999
+
+# Số lần gọi evaluate_board kể từ lần đặt lại gần nhất (gán helpers.evaluations = 0 trước khi đo)
+evaluations = 0
+
+
+def static_evaluate(board: chess.Board) -> int:
+    """
+    Phần đánh giá chỉ phụ thuộc vị trí (không phụ thuộc lịch sử nước đi):
+    chiếu hết, hết nước, không đủ quân chiếu hết, material + PST. White perspective.
+    Nếu board là engines.incremental.IncrementalBoard thì phần material + PST
+    lấy từ điểm đã cập nhật sẵn (O(1)) thay vì quét lại 64 ô.
+    """
+    if board.is_checkmate():
+        # Nếu checkmate, chắc chắn bên đang bị chiếu tướng / chuẩn bị chịu thua
+        # Thường gán một giá cực lớn (so với depth) để ai không lựa chọn hướng dẫn đến checkmate.
+        return -MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE
+    if board.is_stalemate() or board.is_insufficient_material():
+        return 0  # hoà
+
+    value = getattr(board, "pst_score", None)
+    if value is None:
+        return material_pst_score(board)
+    if board.check_eval:
+        # Chế độ kiểm tra: điểm cập nhật tăng dần phải khớp với quét toàn bộ
+        full = material_pst_score(board)
+        assert value == full, f"incremental eval {value} != full eval {full} ({board.fen()})"
+    return value
+
+
+def evaluate_board(board: chess.Board, cache=None) -> int:
+    """
+    Trả về giá trị đánh giá của board từ White perspective (đơn vị centipawn).
+    Giá trị dương → ưu thế White, âm → ưu thế Black.
+    - cache: engines.eval_cache.EvalCache (hoặc SharedEvalCache) để dùng lại static_evaluate
+      của vị trí đã gặp (theo khoá Zobrist); claim hoà theo lịch sử luôn được kiểm tra lại.
+      Chỉ dùng với chess.Board thường: IncrementalBoard đã có điểm O(1), tính khoá còn đắt hơn nên bỏ qua cache.
+    """
+    global evaluations
+    evaluations += 1
+    if cache is None or hasattr(board, "pst_score"):
+        value = static_evaluate(board)
+    else:
+        value = cache.evaluate(board)
+    if abs(value) != MATE_SCORE and board.halfmove_clock >= MIN_CLAIM_DRAW_PLIES \
+            and board.can_claim_draw():
+        return 0  # hoà (lặp lại 3 lần / luật 50 nước)
+    return value
+
 def board_to_tensor(board: chess.Board):
     """
     Chuyển chess.Board sang tensor shape (12,8,8), dtype float32.
@@ -0,0 +1,171 @@
+# engines/incremental.py
+
+import chess
+from engines.helpers import PIECE_VALUES, get_pst_value, material_pst_score
+
+# === 1. Bảng điểm phẳng 64 ô cho từng (màu, loại quân): material + PST, White perspective ===
+# SCORE_TABLES[color][piece_type][square]; piece_type = 0 không dùng
+SCORE_TABLES = [[None] * 7, [None] * 7]
+for _color in chess.COLORS:
+    _sign = 1 if _color == chess.WHITE else -1
+    for _piece_type in chess.PIECE_TYPES:
+        _piece = chess.Piece(_piece_type, _color)
+        SCORE_TABLES[_color][_piece_type] = [
+            _sign * PIECE_VALUES[_piece_type] + get_pst_value(_piece, sq) for sq in chess.SQUARES
+        ]
+
+
+def move_delta(board: chess.Board, move: chess.Move) -> int:
+    """
+    Thay đổi của điểm material + PST khi đi move trên board (trước khi push).
+    Xử lý bắt quân, phong cấp, nhập thành và bắt tốt qua đường.
+    """
+    turn = board.turn
+    from_sq = move.from_square
+    to_sq = move.to_square
+    piece_type = board.piece_type_at(from_sq)
+    table = SCORE_TABLES[turn]
+    delta = -table[piece_type][from_sq]
+
+    if piece_type == chess.KING:
+        # Nhập thành: kiểu chuẩn (e1g1) hoặc kiểu Chess960 (vua "bắt" xe cùng màu)
+        own_rook = board.occupied_co[turn] & chess.BB_SQUARES[to_sq]
+        file_diff = chess.square_file(to_sq) - chess.square_file(from_sq)
+        if own_rook or abs(file_diff) > 1:
+            kingside = file_diff > 0
+            back_rank = 0 if turn == chess.WHITE else 56
+            if own_rook:
+                rook_from = to_sq
+            else:
+                rook_from = back_rank + (7 if kingside else 0)
+            king_to = back_rank + (6 if kingside else 2)
+            rook_to = back_rank + (5 if kingside else 3)
+            return delta + table[chess.KING][king_to] \
+                - table[chess.ROOK][rook_from] + table[chess.ROOK][rook_to]
+
+    captured = board.piece_type_at(to_sq)
+    if captured:
+        delta -= SCORE_TABLES[not turn][captured][to_sq]
+    elif piece_type == chess.PAWN and to_sq == board.ep_square:
+        # Bắt tốt qua đường: tốt bị bắt nằm sau ô đích
+        capture_sq = to_sq - 8 if turn == chess.WHITE else to_sq + 8
+        delta -= SCORE_TABLES[not turn][chess.PAWN][capture_sq]
+
+    return delta + table[move.promotion or piece_type][to_sq]
+
+
+class IncrementalBoard(chess.Board):
+    """
+    chess.Board duy trì sẵn điểm material + PST (pst_score, White perspective):
+    - push: cộng delta của nước đi (O(1)), lưu điểm cũ vào stack.
+    - pop: lấy lại điểm cũ từ stack.
+    Các hàm thay đổi bàn cờ khác (set_fen, set_piece_at, ...) tính lại từ đầu.
+
+    evaluate_board() nhận ra board loại này và dùng luôn pst_score.
+    check_eval=True: mỗi lần đánh giá đều so sánh với cách quét toàn bộ (assert).
+    """
+
+    def __init__(self, fen=chess.STARTING_FEN, *, chess960: bool = False, check_eval: bool = False):
+        self.check_eval = check_eval
+        self.pst_score = 0
+        self._score_stack = []
+        self._frozen = False
+        super().__init__(fen, chess960=chess960)
+        self.refresh()
+
+    @classmethod
+    def from_board(cls, board: chess.Board, check_eval: bool = False) -> 'IncrementalBoard':
+        """
+        Tạo IncrementalBoard từ một chess.Board thường (giữ nguyên move stack).
+        """
+        if isinstance(board, cls):
+            return board
+        inc = cls(None, chess960=board.chess960, check_eval=check_eval)
+        inc.pawns, inc.knights, inc.bishops = board.pawns, board.knights, board.bishops
+        inc.rooks, inc.queens, inc.kings = board.rooks, board.queens, board.kings
+        inc.occupied_co[chess.WHITE] = board.occupied_co[chess.WHITE]
+        inc.occupied_co[chess.BLACK] = board.occupied_co[chess.BLACK]
+        inc.occupied = board.occupied
+        inc.promoted = board.promoted
+        inc.turn = board.turn
+        inc.castling_rights = board.castling_rights
+        inc.ep_square = board.ep_square
+        inc.halfmove_clock = board.halfmove_clock
+        inc.fullmove_number = board.fullmove_number
+        inc.move_stack = board.move_stack.copy()
+        inc._stack = board._stack.copy()
+        inc.refresh()
+        return inc
+
+    def refresh(self):
+        """
+        Tính lại pst_score từ đầu. Điểm của các nước trước đó chưa biết sẽ là None
+        (pop tới đó thì tính lại).
+        """
+        self.pst_score = material_pst_score(self)
+        n = len(self.move_stack)
+        stack = self._score_stack[:n]
+        self._score_stack = stack + [None] * (n - len(stack))
+
+    def push(self, move: chess.Move) -> None:
+        if self._frozen:
+            return super().push(move)
+        self._score_stack.append(self.pst_score)
+        if move and not move.drop:
+            self.pst_score += move_delta(self, move)
+        super().push(move)
+
+    def pop(self) -> chess.Move:
+        if self._frozen:
+            return super().pop()
+        move = super().pop()
+        score = self._score_stack.pop()
+        if score is None:
+            self.pst_score = material_pst_score(self)
+        else:
+            self.pst_score = score
+        return move
+
+    def can_claim_draw(self) -> bool:
+        # Kiểm tra lặp lại 3 lần push/pop thử rồi trả bàn cờ về đúng trạng thái cũ,
+        # nên bỏ qua cập nhật điểm trong lúc đó (evaluate_board gọi hàm này ở mọi lá)
+        self._frozen = True
+        try:
+            return super().can_claim_draw()
+        finally:
+            self._frozen = False
+
+    def copy(self, *, stack=True) -> 'IncrementalBoard':
+        board = super().copy(stack=stack)
+        board.check_eval = self.check_eval
+        board.pst_score = self.pst_score
+        n = len(board.move_stack)
+        board._score_stack = self._score_stack[len(self._score_stack) - n:] if n else []
+        return board
+
+
+def _refreshing(name):
+    base = getattr(chess.Board, name)
+
+    def method(self, *args, **kwargs):
+        result = base(self, *args, **kwargs)
+        self.refresh()
+        return result
+
+    method.__name__ = name
+    method.__doc__ = base.__doc__
+    return method
+
+
+# Các hàm thay đổi bàn cờ không qua push/pop → tính lại điểm sau khi gọi
+for _name in ("reset", "reset_board", "clear", "clear_board", "set_fen", "set_board_fen",
+              "set_piece_at", "remove_piece_at", "set_piece_map", "set_chess960_pos",
+              "apply_transform", "apply_mirror"):
+    setattr(IncrementalBoard, _name, _refreshing(_name))
+
+
+def as_incremental(board: chess.Board, check_eval: bool = False) -> IncrementalBoard:
+    """
+    Trả về IncrementalBoard tương đương board (chính board nếu đã là IncrementalBoard).
+    """
+    return IncrementalBoard.from_board(board, check_eval=check_eval)
@@ -1,67 +1,101 @@
 # engines/mcts.py
 
+import atexit
+import sys
+import warnings
 import chess
 import math
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from engines import bitbase
 from engines.greedy import greedy_move  # hàm greedy_move
 from engines.helpers import evaluate_board  # heuristic evaluation
+from engines.incremental import IncrementalBoard, as_incremental
+from engines.playout import fast_simulate
+from engines.search_stats import collect
 import random
 
-
 class MCTSNode:
-    def __init__(self, board: chess.Board, parent=None, move=None):
-        self.board = board
+    """
+    Node gọn cho UCT: không giữ board (vị trí được dựng lại bằng push/pop dọc đường chọn).
+    - untried: các nước chưa thử, mã hoá from | to << 6 | promotion << 12 trong array('H')
+      (thứ tự ngược để pop() ở cuối), tạo lần đầu cần tới, thành () khi đã thử hết
+    - terminal: cache kết quả is_game_over() của vị trí node
+      (cây không có transposition nên lịch sử tới node luôn giống nhau)
+    """
+    __slots__ = ('parent', 'move', 'children', 'visits', 'value_sum', 'untried', 'terminal')
+
+    def __init__(self, parent=None, move=None):
         self.parent = parent
         self.move = move
         self.children = []
         self.visits = 0
         self.value_sum = 0.0
+        self.untried = None
+        self.terminal = None
 
-    def is_fully_expanded(self) -> bool:
-        return len(self.children) == len(list(self.board.legal_moves))
-
-    def expand(self):
-        # Mở rộng một nước chưa thử
-        tried = {c.move for c in self.children}
-        for mv in self.board.legal_moves:
-            if mv not in tried:
-                nb = self.board.copy()
-                nb.push(mv)
-                child = MCTSNode(nb, parent=self, move=mv)
-                self.children.append(child)
-                return child
-        return None
+    def is_terminal(self, board: chess.Board) -> bool:
+        if self.terminal is None:
+            self.terminal = board.is_game_over()
+        return self.terminal
+
+    def is_fully_expanded(self, board: chess.Board) -> bool:
+        if self.untried is None:
+            self.untried = array('H', [mv.from_square | (mv.to_square << 6) | ((mv.promotion or 0) << 12)
+                                       for mv in board.legal_moves][::-1])
+        return not self.untried
+
+    def expand(self, board: chess.Board):
+        # Mở rộng một nước chưa thử; board (đang ở vị trí của node) được push nước đó
+        if self.is_fully_expanded(board):
+            return None
+        code = self.untried.pop()
+        if not self.untried:
+            self.untried = ()
+        mv = chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+        child = MCTSNode(parent=self, move=mv)
+        self.children.append(child)
+        board.push(mv)
+        return child
 
     def best_child(self, c_param: float = 1.4) -> 'MCTSNode':
         best, best_score = None, -float('inf')
+        log_visits = math.log(self.visits)
         for c in self.children:
             if c.visits == 0:
                 score = float('inf')
             else:
                 exploitation = c.value_sum / c.visits
-                exploration = c_param * math.sqrt(math.log(self.visits) / c.visits)
+                exploration = c_param * math.sqrt(log_visits / c.visits)
                 score = exploitation + exploration
             if score > best_score:
                 best_score, best = score, c
         return best
 
     def backpropagate(self, reward: float):
-        self.visits += 1
-        self.value_sum += reward
-        if self.parent:
-            self.parent.backpropagate(-reward)
+        node = self
+        while node is not None:
+            node.visits += 1
+            node.value_sum += reward
+            node = node.parent
+            reward = -reward
 
 
-def select_node(root: MCTSNode, c_param: float) -> MCTSNode:
+def select_node(root: MCTSNode, board: chess.Board, c_param: float) -> MCTSNode:
+    """
+    Đi từ gốc xuống lá theo UCT; board (đang ở vị trí gốc) được push dọc đường đi.
+    """
     node = root
     # selection until leaf
-    while not node.board.is_game_over():
-        if not node.is_fully_expanded():
+    while not node.is_terminal(board):
+        if not node.is_fully_expanded(board):
             return node
         node = node.best_child(c_param)
+        board.push(node.move)
     return node
 
 
-def simulate(node_board: chess.Board, max_depth: int = 20) -> float:
+def simulate(node_board: chess.Board, max_depth: int = 20, rng=random) -> float:
     # Kết hợp greedy rollout và heuristic khi đạt max_depth
     b = node_board.copy()
     depth = 0
@@ -69,7 +103,7 @@ def simulate(node_board: chess.Board, max_depth: int = 20) -> float:
         legal_moves = list(b.legal_moves)
         if not legal_moves:
             break
-        mv = random.choice(legal_moves)
+        mv = rng.choice(legal_moves)
         b.push(mv)
         depth += 1
     # Nếu game_over thì kết quả +-1 hoặc 0, ngược lại dùng đánh giá nhanh
@@ -85,17 +119,391 @@ def simulate(node_board: chess.Board, max_depth: int = 20) -> float:
     return max(-1.0, min(1.0, score_cp / 1000.0))
 
 
+class SearchTree:
+    """
+    Cây của lần gọi trước (dùng lại khi reuse_tree=True): gốc và board ở gốc của cây đó.
+    Mặc định các lần gọi dùng chung TREE của module; hai engine chạy xen kẽ trong cùng process
+    (hai bên của một ván, game/engine_specs.make_engine) mỗi engine cần một SearchTree riêng (tree=...).
+    """
+
+    def __init__(self):
+        self.root = None
+        self.board = None
+
+    def reset(self):
+        self.root = None
+        self.board = None
+
+
+TREE = SearchTree()
+
+# Số simulation của lần search gần nhất (cùng vai trò với negamax.nodes)
+nodes = 0
+
+
+def reset_tree():
+    TREE.reset()
+
+
+def reuse_root(old_root: MCTSNode, old_board: chess.Board, board: chess.Board):
+    """
+    Tìm node ứng với vị trí board trong cây cũ bằng cách đi theo các nước đã chơi
+    kể từ gốc cũ (thường là nước của engine + nước trả lời của đối thủ).
+    Trả về node đó (đã tách khỏi cây, phần còn lại bị bỏ) hoặc None nếu không khớp.
+    """
+    if old_root is None:
+        return None
+    old_stack = old_board.move_stack
+    n = len(old_stack)
+    if len(board.move_stack) < n or board.move_stack[:n] != old_stack:
+        return None
+    if board.root().board_fen() != old_board.root().board_fen():
+        return None
+    node = old_root
+    for mv in board.move_stack[n:]:
+        node = next((c for c in node.children if c.move == mv), None)
+        if node is None:
+            return None
+    node.parent = None
+    node.move = None
+    return node
+
+
+# === Rollout song song bằng process pool (GIL không cho chạy song song bằng thread) ===
+_pool = None
+_pool_workers = 0
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+    _pool, _pool_workers = None, 0
+
+
+atexit.register(shutdown_pool)
+
+
+def _rebuild_board(fen: str, moves_uci: list, incremental: bool) -> chess.Board:
+    board = chess.Board(fen)
+    if incremental:
+        board = as_incremental(board)
+    for uci in moves_uci:
+        board.push_uci(uci)
+    return board
+
+
+def _board_args(board: chess.Board, history: bool = True):
+    """
+    Vị trí gửi sang worker: (FEN, danh sách nước UCI). Chỉ gửi đoạn lịch sử từ nước bắt quân / đi tốt
+    gần nhất (halfmove_clock nửa nước): vị trí trước đó không thể lặp lại, nên luật lặp lại vẫn đúng
+    mà không phải gửi và push_uci lại cả ván. history=False (fast_simulate bỏ qua lịch sử): chỉ FEN.
+    """
+    if not history:
+        return board.fen(), []
+    n = min(board.halfmove_clock, len(board.move_stack))
+    tail = board.move_stack[len(board.move_stack) - n:]
+    return board.copy(stack=n).root().fen(), [mv.uci() for mv in tail]
+
+
+def _root_parallel_worker(fen: str, moves_uci: list, n_simulations: int, c_param: float,
+                          incremental: bool, seed: int, fast_playout: bool = False) -> dict:
+    # Một cây độc lập trong worker; trả về visits của các con ở gốc
+    board = _rebuild_board(fen, moves_uci, incremental)
+    root = MCTSNode()
+    _search(root, board, n_simulations, c_param, random.Random(seed), fast_playout=fast_playout)
+    return {c.move.uci(): c.visits for c in root.children}
+
+
+def _leaf_worker(fen: str, moves_uci: list, n_rollouts: int, incremental: bool, seed: int,
+                 fast_playout: bool = False) -> list:
+    # n_rollouts rollout từ cùng một lá (dựng board một lần), seed riêng cho mỗi lá
+    board = _rebuild_board(fen, moves_uci, incremental)
+    rollout = fast_simulate if fast_playout else simulate
+    rng = random.Random(seed)
+    return [rollout(board, rng=rng) for _ in range(n_rollouts)]
+
+
+# Số rollout mỗi lá ở chế độ leaf-parallel: một task cho worker gồm ngần ấy rollout,
+# để chi phí gửi task / dựng board (cỡ 0.7 ms, tương đương một rollout nhanh) chia cho nhiều rollout
+LEAF_ROLLOUTS = 8
+# Virtual loss cho mỗi rollout đang chờ (thang reward [-1, 1])
+VIRTUAL_LOSS = 1.0
+
+
+def apply_virtual_loss(node: MCTSNode, n: int, virtual_loss: float = VIRTUAL_LOSS):
+    # Tạm coi đường gốc → node như đã được thăm n lần và thua, để lá tiếp theo trong đợt đi nhánh khác
+    while node is not None:
+        node.visits += n
+        node.value_sum -= n * virtual_loss
+        node = node.parent
+
+
+def revert_virtual_loss(node: MCTSNode, n: int, virtual_loss: float = VIRTUAL_LOSS):
+    while node is not None:
+        node.visits -= n
+        node.value_sum += n * virtual_loss
+        node = node.parent
+
+
+def _search(root: MCTSNode, board: chess.Board, n_simulations: int, c_param: float, rng=random,
+            pool: ProcessPoolExecutor = None, workers: int = 1, seed: int = 0, fast_playout: bool = False,
+            leaf_rollouts: int = LEAF_ROLLOUTS):
+    """
+    Vòng lặp UCT chính trên một board dùng chung (push khi đi xuống, pop về gốc sau mỗi simulation).
+    - pool: leaf-parallel (_search_leaf_parallel), n_simulations vẫn là tổng số rollout.
+    - fast_playout: rollout bằng playout.fast_simulate thay vì simulate.
+    """
+    if pool is not None:
+        return _search_leaf_parallel(root, board, n_simulations, c_param, rng, pool, workers, seed,
+                                     fast_playout, leaf_rollouts)
+    rollout = fast_simulate if fast_playout else simulate
+    root_len = len(board.move_stack)
+    for _ in range(n_simulations):
+        leaf = select_node(root, board, c_param)
+        child = leaf.expand(board) if not leaf.is_terminal(board) else leaf
+        exact = bitbase.outcome(board) if chess.popcount(board.occupied) <= bitbase.MAX_PIECES else None
+        # Tàn cuộc có trong bitbase: dùng kết quả chính xác thay cho rollout
+        child.backpropagate(exact if exact is not None else rollout(board, rng=rng))
+        while len(board.move_stack) > root_len:
+            board.pop()
+
+
+def _search_leaf_parallel(root, board, n_simulations, c_param, rng, pool, workers, seed, fast_playout,
+                          leaf_rollouts):
+    """
+    Leaf-parallel theo đợt: mỗi đợt chọn tối đa `workers` lá (virtual loss trên đường đi để các lá khác
+    nhau), gửi mỗi lá một task leaf_rollouts rollout, rồi backprop từng rollout như một lần thăm theo thứ tự
+    gửi (kết quả không phụ thuộc thứ tự worker xong việc → lặp lại được với cùng seed).
+    Lá game over / có trong bitbase tính ngay trong process chính.
+    """
+    rollout = fast_simulate if fast_playout else simulate
+    incremental = isinstance(board, IncrementalBoard)
+    root_len = len(board.move_stack)
+    done = task_id = 0
+    while done < n_simulations:
+        jobs = []
+        while len(jobs) < workers and done < n_simulations:
+            leaf = select_node(root, board, c_param)
+            terminal = leaf.is_terminal(board)
+            child = leaf.expand(board) if not terminal else leaf
+            exact = bitbase.outcome(board) if chess.popcount(board.occupied) <= bitbase.MAX_PIECES else None
+            if terminal or exact is not None:
+                jobs.append((child, 0, [exact if exact is not None else rollout(board, rng=rng)]))
+                done += 1
+            else:
+                n = min(leaf_rollouts, n_simulations - done)
+                fen, moves_uci = _board_args(board, history=not fast_playout)
+                future = pool.submit(_leaf_worker, fen, moves_uci, n, incremental,
+                                     seed * 1_000_003 + task_id, fast_playout)
+                task_id += 1
+                apply_virtual_loss(child, n)
+                jobs.append((child, n, future))
+                done += n
+            while len(board.move_stack) > root_len:
+                board.pop()
+        for child, n, result in jobs:
+            if n:
+                revert_virtual_loss(child, n)
+                result = result.result()
+            for reward in result:
+                child.backpropagate(reward)
+
+
 def run_mcts(root_board: chess.Board,
              n_simulations: int = 100,
-             c_param: float = 1.4) -> chess.Move:
-    root = MCTSNode(root_board.copy())
-    for _ in range(n_simulations):
-        leaf = select_node(root, c_param)
-        child = leaf.expand() if not leaf.board.is_game_over() else leaf
-        reward = simulate(child.board)
-        child.backpropagate(reward)
+             c_param: float = 1.4,
+             incremental: bool = True,
+             reuse_tree: bool = False,
+             workers: int = 1,
+             parallel: str = "root",
+             seed: int = None,
+             fast_playout: bool = True,
+             stats=None,
+             tree: SearchTree = None) -> chess.Move:
+    """
+    - incremental: các node / rollout dùng IncrementalBoard → đánh giá lá không quét lại 64 ô
+    - reuse_tree: giữ cây giữa các lần gọi; nếu vị trí hiện tại nằm trong cây cũ thì
+      tiếp tục từ subtree đó (giữ nguyên visits / value), ngược lại tạo gốc mới.
+    - workers: > 1 để chạy rollout song song trên process pool:
+        parallel="root": mỗi worker một cây độc lập với n_simulations / workers simulation,
+                         cộng visits ở gốc rồi chọn nước nhiều visits nhất. Không giữ cây: cây cũ
+                         của reuse_tree bị xoá, reuse_tree=True chỉ cho RuntimeWarning.
+        parallel="leaf": một cây, mỗi đợt `workers` lá (virtual loss), mỗi lá LEAF_ROLLOUTS rollout
+                         trong một task (n_simulations là tổng số rollout). Chỉ đáng dùng khi rollout
+                         chậm (fast_playout=False) và có nhiều core thật; xem benchmark_parallel.
+    - seed: cố định seed cho rollout (kết quả lặp lại được, kể cả khi chạy song song).
+    - fast_playout: rollout nhanh (engines/playout.py) trên bản sao không có move stack,
+      bỏ kiểm tra lặp lại nước trong rollout; False = simulate như cũ.
+    - stats: engines.search_stats.SearchStats để nhận thống kê (simulation, độ sâu cây, PV theo visits,
+      thời gian rollout / movegen); None = không thu thập.
+    - tree: SearchTree giữ cây cho reuse_tree (mặc định TREE của module).
+    Sau khi search, số simulation đọc qua mcts.nodes.
+    """
+    if stats is not None:
+        return _search_with_stats(stats, root_board, n_simulations, c_param, incremental, reuse_tree,
+                                  workers, parallel, seed, fast_playout, tree)
+    return _run_mcts(root_board, n_simulations, c_param, incremental, reuse_tree, workers, parallel,
+                     seed, fast_playout, tree)[0]
+
+
+def _run_mcts(root_board, n_simulations, c_param, incremental, reuse_tree, workers, parallel, seed,
+              fast_playout, tree=None):
+    # Trả về (best_move, gốc cây); gốc là None với root-parallel (mỗi worker một cây riêng)
+    global nodes
+    tree = tree if tree is not None else TREE
+    nodes = 0
+    if incremental:
+        root_board = as_incremental(root_board)
+    if seed is None:
+        rng = random
+        seed = random.randrange(1 << 31) if workers > 1 else 0
+    else:
+        rng = random.Random(seed)
+
+    if workers > 1 and parallel == "root":
+        if reuse_tree:
+            warnings.warn("run_mcts: reuse_tree bị bỏ qua với parallel=\"root\"", RuntimeWarning, stacklevel=3)
+        # Cây cũ không còn khớp với các nước tiếp theo: xoá để lần gọi reuse_tree sau không dùng lại nó
+        tree.reset()
+        pool = get_pool(workers)
+        root_fen, moves_uci = _board_args(root_board)
+        per_worker = [n_simulations // workers + (1 if i < n_simulations % workers else 0)
+                      for i in range(workers)]
+        futures = [pool.submit(_root_parallel_worker, root_fen, moves_uci, n, c_param, incremental, seed + i,
+                               fast_playout)
+                   for i, n in enumerate(per_worker) if n > 0]
+        visits = {}
+        nodes = n_simulations
+        for fut in futures:
+            for uci, n in fut.result().items():
+                visits[uci] = visits.get(uci, 0) + n
+        if not visits:
+            return None, None
+        # Phá hoà theo thứ tự nước đi hợp lệ để kết quả không phụ thuộc thứ tự worker
+        order = {mv.uci(): i for i, mv in enumerate(root_board.legal_moves)}
+        best = max(visits, key=lambda uci: (visits[uci], -order[uci]))
+        return chess.Move.from_uci(best), None
+    root = reuse_root(tree.root, tree.board, root_board) if reuse_tree else None
+    if root is None:
+        root = MCTSNode()
+    # Một board duy nhất cho cả lần search: push khi đi xuống, pop về gốc sau mỗi simulation
+    board = root_board.copy()
+    if reuse_tree:
+        tree.root, tree.board = root, root_board.copy()
+    else:
+        tree.reset()
+    if workers > 1 and parallel == "leaf":
+        _search(root, board, n_simulations, c_param, rng, get_pool(workers), workers, seed, fast_playout)
+    else:
+        _search(root, board, n_simulations, c_param, rng, fast_playout=fast_playout)
+    nodes = n_simulations
     if not root.children:
-        return None
+        return None, root
     # chọn con có visits cao nhất
     best = max(root.children, key=lambda c: c.visits)
-    return best.move
+    return best.move, root
+
+
+def _search_with_stats(stats, root_board, n_simulations, c_param, incremental, reuse_tree, workers,
+                       parallel, seed, fast_playout, tree):
+    # run_mcts với stats: đo thời gian rollout / sinh nước bằng cách tạm bọc hàm của module và MCTSNode
+    module = sys.modules[__name__]
+    phases = [(module, "fast_simulate", "rollout"), (module, "simulate", "rollout"),
+              (MCTSNode, "is_fully_expanded", "movegen")]
+    stats.engine = stats.engine or "MCTS"
+    with collect(stats, phases=phases):
+        move, root = _run_mcts(root_board, n_simulations, c_param, incremental, reuse_tree, workers,
+                               parallel, seed, fast_playout, tree)
+    stats.nodes += nodes
+    if root is not None:
+        # PV: đi theo con nhiều visits nhất; seldepth: độ sâu lớn nhất của cây
+        pv, node = [], root
+        while node.children:
+            node = max(node.children, key=lambda c: c.visits)
+            pv.append(node.move)
+        stats.pv = pv
+        stats.depth = len(pv)
+        stack, deepest = [(root, 0)], 0
+        while stack:
+            node, d = stack.pop()
+            deepest = max(deepest, d)
+            stack.extend((c, d + 1) for c in node.children)
+        stats.seldepth = max(stats.seldepth, deepest)
+        if root.children:
+            best = max(root.children, key=lambda c: c.visits)
+            stats.value = best.value_sum / best.visits if best.visits else 0.0
+    elif move is not None:
+        stats.pv, stats.depth = [move], 1
+    return move
+
+
+def benchmark(n_simulations=(200, 1000), fen: str = None, seed: int = 0):
+    """
+    Đo số simulation / giây và số byte bộ nhớ / node của cây (tracemalloc).
+    """
+    import time
+    import tracemalloc
+
+    board = chess.Board(fen) if fen else chess.Board(
+        "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 b kq - 3 5")
+    for n in n_simulations:
+        random.seed(seed)
+        start = time.perf_counter()
+        run_mcts(board, n)
+        sims_per_sec = n / (time.perf_counter() - start)
+
+        random.seed(seed)
+        tracemalloc.start()
+        run_mcts(board, n, reuse_tree=True)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stack, n_nodes = [TREE.root], 0
+        while stack:
+            node = stack.pop()
+            n_nodes += 1
+            stack.extend(node.children)
+        reset_tree()
+        print(f"{n:6d} simulations: {sims_per_sec:7.1f} sim/s, {n_nodes} nodes, "
+              f"{current / n_nodes:7.0f} bytes/node")
+
+
+def benchmark_parallel(worker_counts=(1, 2, 4, 8), n_simulations: int = 800, fen: str = None, seed: int = 0,
+                       fast_playout: bool = True):
+    """
+    Đo rollout / giây của chế độ root-parallel và leaf-parallel theo số worker, so với 1 process.
+    Tăng tốc chỉ có ý nghĩa khi số worker không vượt số core thật (os.cpu_count()).
+    """
+    import os
+    import time
+
+    board = chess.Board(fen) if fen else chess.Board(
+        "r1bqkb1r/1ppp1ppp/p1n2n2/4p3/B3P3/5N2/PPPP1PPP/RNBQ1RK1 b kq - 3 5")
+    print(f"{os.cpu_count()} core, fast_playout={fast_playout}")
+    start = time.perf_counter()
+    move = run_mcts(board, n_simulations, seed=seed, fast_playout=fast_playout)
+    serial = n_simulations / (time.perf_counter() - start)
+    print(f"1 process       : {serial:7.1f} rollout/s          {move}")
+    for workers in worker_counts:
+        get_pool(workers)  # không tính thời gian tạo process
+        for parallel in ("root", "leaf"):
+            start = time.perf_counter()
+            move = run_mcts(board, n_simulations, workers=workers, parallel=parallel, seed=seed,
+                            fast_playout=fast_playout)
+            speed = n_simulations / (time.perf_counter() - start)
+            print(f"{parallel} x{workers:<2d}        : {speed:7.1f} rollout/s  x{speed / serial:4.2f}  {move}")
+    shutdown_pool()
+
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_parallel()
@@ -1,14 +1,20 @@
+import sys
 import chess
-import torch
 import math, numpy as np
 import random
-from engines.helpers import board_to_tensor,evaluate_board
-from engines.network_model import PolicyNet   # cần chứa đúng định nghĩa của PolicyNet
+from engines import bitbase
+from engines.helpers import evaluate_board
+from engines.encoding import board_to_planes, boards_to_planes
+from engines.incremental import as_incremental
+from engines.mcts import SearchTree
+from engines.model_registry import get_model, predict, DEFAULT_MODEL_PATH
+from engines.search_stats import collect
 
-DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = PolicyNet(num_res_blocks=20, num_channels=256, action_size=4096).to(DEVICE)
-model.load_state_dict(torch.load("models/policy_supervised_final.pt", map_location=DEVICE))
-model.eval()
+# Model chỉ được nạp ở lần search đầu tiên (engines/model_registry.py), không nạp lúc import
+MODEL_PATH = DEFAULT_MODEL_PATH
+
+def load_model(path=None):
+    return get_model(path or MODEL_PATH)
 
 def move_to_index(move: chess.Move) -> int:
     return move.from_square * 64 + move.to_square
@@ -24,13 +30,22 @@ class MCTSNode:
         self.Q = {}
         self.children = {}
         self._is_expanded = False
+        # Giá trị từ value head (White perspective, như leaf_reward), None nếu model không có value head
+        self.value = None
+
+    def expand(self, model=None):
+        board_np = board_to_planes(self.board)  # numpy.ndarray shape (12,8,8)
+        logits, values = predict(model if model is not None else load_model(), board_np[None])    # (1,4096)
+        self.expand_from_logits(logits.reshape(-1))
+        if values is not None:
+            self.set_value(float(values[0]))
+
+    def set_value(self, value: float):
+        # value head đã cho giá trị theo White perspective (train.py học pgn_dataset.value_targets)
+        self.value = value
 
-    def expand(self):
-        board_np = board_to_tensor(self.board)  # numpy.ndarray shape (12,8,8)
-        board_tensor = torch.from_numpy(board_np).unsqueeze(0).to(DEVICE)  # (1,12,8,8) trên device
-        with torch.no_grad():
-            logits = model(board_tensor)    # (1,4096)
-        logits = logits.cpu().numpy().reshape(-1)
+    def expand_from_logits(self, logits: np.ndarray):
+        # logits: (4096,) của vị trí này (đã tính sẵn, ví dụ từ một batch)
         legal_moves = list(self.board.legal_moves)
         random.shuffle(legal_moves)
         indices = [move_to_index(m) for m in legal_moves]
@@ -56,52 +71,250 @@ def select_child(node: MCTSNode, c_puct=1.0):
             best_score, best_move = U, a
     return best_move
 
-def backpropagate(node: MCTSNode, reward: float):
+def backpropagate(node: MCTSNode, reward: float, virtual_loss: float = None):
+    # virtual_loss: nếu đường đi đã được apply_virtual_loss thì N đã được cộng sẵn,
+    # chỉ cần trả lại phần W bị trừ và cộng reward
     current, v = node, reward
     while current.parent is not None:
         parent = current.parent
         move = current.move_from_parent
-        parent.N[move] += 1
-        parent.W[move] += v
+        if virtual_loss is None:
+            parent.N[move] += 1
+            parent.W[move] += v
+        else:
+            parent.W[move] += v + virtual_loss
         parent.Q[move] = parent.W[move] / parent.N[move]
         current = parent
         v = -v  # Đảo reward cho lượt khác
 
-def run_mcts_supervised(root_board: chess.Board, n_simulations=400, c_puct=1.4):
-    root = MCTSNode(root_board.copy())
-    root.expand()
-    for _ in range(n_simulations):
-        node = root
-        # 1. Selection
-        while node._is_expanded and not node.board.is_game_over():
-            a = select_child(node, c_puct)
-            next_board = node.board.copy()
-            next_board.push(a)
-            if a in node.children:
-                node = node.children[a]
-            else:
-                child = MCTSNode(next_board, parent=node, move_from_parent=a)
-                node.children[a] = child
-                node = child
-
-        # 2. Expansion (nếu chưa game over)
-        if not node.board.is_game_over():
-            node.expand()
-            # Dùng heuristic nhỏ cho reward giai đoạn leaf: 0 (hòa)
-            # Tính giá trị centipawn rồi chuẩn hóa thành reward ∈ [−1, 1]
-            score = evaluate_board(node.board)  # ví dụ ± vài trăm
-            # Chọn K ≈ 1000 (có thể điều chỉnh tùy tập dữ liệu centipawn thực tế)
-            reward = math.tanh(score / 1000.0)
+def apply_virtual_loss(node: MCTSNode, virtual_loss: float):
+    """
+    Tạm coi mọi cạnh trên đường gốc → node như vừa được thăm và thua (N += 1, W -= virtual_loss)
+    để các lần chọn lá tiếp theo trong cùng batch đi sang nhánh khác.
+    """
+    current = node
+    while current.parent is not None:
+        parent = current.parent
+        move = current.move_from_parent
+        parent.N[move] += 1
+        parent.W[move] -= virtual_loss
+        parent.Q[move] = parent.W[move] / parent.N[move]
+        current = parent
+
+def select_leaf(root: MCTSNode, c_puct: float) -> MCTSNode:
+    # Đi từ gốc theo PUCT tới node chưa expand hoặc game over (tạo node con khi cần)
+    node = root
+    while node._is_expanded and not node.board.is_game_over():
+        a = select_child(node, c_puct)
+        next_board = node.board.copy()
+        next_board.push(a)
+        if a in node.children:
+            node = node.children[a]
         else:
-            res = node.board.result()
-            if res == "1-0": reward = 1.0
-            elif res == "0-1": reward = -1.0
-            else: reward = 0.0
+            child = MCTSNode(next_board, parent=node, move_from_parent=a)
+            node.children[a] = child
+            node = child
+    return node
 
-        # 3. Backpropagation
-        backpropagate(node, reward)
+def leaf_reward(node: MCTSNode) -> float:
+    if chess.popcount(node.board.occupied) <= bitbase.MAX_PIECES:
+        exact = bitbase.outcome(node.board)
+        if exact is not None:
+            return float(exact)
+    if not node.board.is_game_over():
+        if node.value is not None:
+            # Value head: đã có từ cùng lần forward với prior, không cần evaluate_board
+            return node.value
+        # Tính giá trị centipawn rồi chuẩn hóa thành reward ∈ [−1, 1]
+        score = evaluate_board(node.board)  # ví dụ ± vài trăm
+        # Chọn K ≈ 1000 (có thể điều chỉnh tùy tập dữ liệu centipawn thực tế)
+        return math.tanh(score / 1000.0)
+    res = node.board.result()
+    if res == "1-0": return 1.0
+    if res == "0-1": return -1.0
+    return 0.0
+
+def expand_batch(nodes: list, model=None):
+    """
+    Expand nhiều lá bằng một lần gọi model: (K,12,8,8) → (K,4096) (+ value (K,) nếu có value head).
+    """
+    batch = boards_to_planes([n.board for n in nodes])
+    logits, values = predict(model if model is not None else load_model(), batch)
+    for i, node in enumerate(nodes):
+        node.expand_from_logits(logits[i])
+        if values is not None:
+            node.set_value(float(values[i]))
+
+def run_batched_simulations(root: MCTSNode, n_simulations: int, c_puct: float,
+                            batch_size: int, virtual_loss: float = 1.0, model=None, should_stop=None):
+    """
+    Mỗi bước chọn tối đa batch_size lá (virtual loss để các lá khác nhau), expand tất cả
+    bằng một lần gọi model, rồi backprop từng lá. Lá game over được backprop ngay.
+    """
+    done = 0
+    while done < n_simulations:
+        if should_stop is not None and should_stop():
+            break
+        pending = []
+        pending_ids = set()
+        while len(pending) < min(batch_size, n_simulations - done):
+            leaf = select_leaf(root, c_puct)
+            if leaf.board.is_game_over():
+                backpropagate(leaf, leaf_reward(leaf))
+                done += 1
+                if done >= n_simulations:
+                    break
+                continue
+            if id(leaf) in pending_ids:
+                # Va chạm: lá này đã chờ trong batch → chạy batch luôn
+                break
+            apply_virtual_loss(leaf, virtual_loss)
+            pending.append(leaf)
+            pending_ids.add(id(leaf))
+        if not pending:
+            continue
+        expand_batch(pending, model)
+        for leaf in pending:
+            backpropagate(leaf, leaf_reward(leaf), virtual_loss)
+        done += len(pending)
+
+# Cây của lần gọi run_mcts_supervised trước (dùng lại khi reuse_tree=True); engine riêng truyền tree=SearchTree()
+TREE = SearchTree()
+# Số simulation của lần search gần nhất
+nodes = 0
+
+def reset_tree():
+    TREE.reset()
+
+def reuse_root(old_root: MCTSNode, board: chess.Board):
+    """
+    Đi theo các nước đã chơi kể từ gốc cũ để tìm node của vị trí board.
+    Trả về node đó (tách khỏi cây cũ) hoặc None nếu vị trí không nằm trong cây.
+    """
+    if old_root is None:
+        return None
+    old_stack = old_root.board.move_stack
+    n = len(old_stack)
+    if len(board.move_stack) < n or board.move_stack[:n] != old_stack:
+        return None
+    node = old_root
+    for mv in board.move_stack[n:]:
+        node = node.children.get(mv)
+        if node is None:
+            return None
+    if node.board.fen() != board.fen():
+        return None
+    node.parent = None
+    node.move_from_parent = None
+    return node
+
+def run_mcts_supervised(root_board: chess.Board, n_simulations=400, c_puct=1.4, incremental=True,
+                        reuse_tree=False, batch_size=1, virtual_loss=1.0, model=None, should_stop=None,
+                        stats=None, tree=None):
+    """
+    - model: PolicyNet dùng cho search; None = model_registry.get_model(MODEL_PATH)
+      (nạp lần đầu, sau đó dùng lại bản đã cache). Model có value head thì giá trị lá lấy từ
+      cùng lần forward với prior thay cho evaluate_board + tanh.
+    - batch_size: > 1 để chọn nhiều lá mỗi bước (virtual loss) và expand bằng một lần
+      gọi model cho cả batch; 1 = mỗi simulation một lần gọi model như cũ.
+    - incremental: các node dùng IncrementalBoard → evaluate_board ở lá không quét lại 64 ô
+    - reuse_tree: giữ cây giữa các lần gọi; subtree của vị trí hiện tại giữ nguyên
+      P/N/W/Q, phần còn lại bị bỏ. Vị trí không khớp thì tạo gốc mới.
+    - should_stop: hàm không tham số, trả về True để dừng sớm (kiểm tra trước mỗi simulation / batch);
+      best move lấy theo số visit tới lúc dừng.
+    - stats: engines.search_stats.SearchStats để nhận thống kê (simulation, độ sâu cây, PV theo visits,
+      thời gian inference / eval / sinh nước + prior); None = không thu thập.
+    - tree: engines.mcts.SearchTree giữ cây cho reuse_tree (mặc định TREE của module).
+    Sau khi search, số simulation đã chạy đọc qua mcts_supervised.nodes.
+    """
+    if stats is not None:
+        return _search_with_stats(stats, root_board, n_simulations, c_puct, incremental, reuse_tree,
+                                  batch_size, virtual_loss, model, should_stop, tree)
+    return _run(root_board, n_simulations, c_puct, incremental, reuse_tree, batch_size, virtual_loss,
+                model, should_stop, tree)[:2]
+
+def _run(root_board, n_simulations, c_puct, incremental, reuse_tree, batch_size, virtual_loss, model,
+         should_stop, tree=None):
+    # Trả về (best_move, pi_vec, gốc cây, số simulation đã chạy)
+    global nodes
+    tree = tree if tree is not None else TREE
+    nodes = 0
+    if incremental:
+        root_board = as_incremental(root_board)
+    root = reuse_root(tree.root, root_board) if reuse_tree else None
+    if root is None:
+        root = MCTSNode(root_board.copy())
+    tree.root = root if reuse_tree else None
+    if model is None:
+        model = load_model()
+    if not root._is_expanded:
+        root.expand(model)
+    visits_before = sum(root.N.values())
+    if batch_size > 1:
+        run_batched_simulations(root, n_simulations, c_puct, batch_size, virtual_loss, model, should_stop)
+    else:
+        for _ in range(n_simulations):
+            if should_stop is not None and should_stop():
+                break
+            # 1. Selection
+            node = select_leaf(root, c_puct)
+
+            # 2. Expansion (nếu chưa game over)
+            if not node.board.is_game_over():
+                node.expand(model)
+            # Dùng heuristic nhỏ cho reward giai đoạn leaf
+            reward = leaf_reward(node)
+
+            # 3. Backpropagation
+            backpropagate(node, reward)
 
     # Lấy best move = argmax visits
     pi_vec = {move: root.N[move] for move in root.N}
     best_move = max(pi_vec, key=lambda m: pi_vec[m])
-    return best_move,pi_vec
\ No newline at end of file
+    nodes = sum(root.N.values()) - visits_before
+    return best_move, pi_vec, root, nodes
+
+def _search_with_stats(stats, root_board, n_simulations, c_puct, incremental, reuse_tree, batch_size,
+                       virtual_loss, model, should_stop, tree):
+    # run_mcts_supervised với stats: đo thời gian bằng cách tạm bọc hàm của module và MCTSNode
+    module = sys.modules[__name__]
+    phases = [(module, "predict", "inference"), (module, "evaluate_board", "eval"),
+              (MCTSNode, "expand_from_logits", "movegen")]
+    stats.engine = stats.engine or "MCTS_supervised"
+    with collect(stats, phases=phases):
+        best_move, pi_vec, root, simulations = _run(root_board, n_simulations, c_puct, incremental, reuse_tree,
+                                                    batch_size, virtual_loss, model, should_stop, tree)
+    stats.nodes += simulations
+    # PV: đi theo nước nhiều visits nhất; seldepth: độ sâu lớn nhất của cây
+    pv, node = [], root
+    while node.N and node.children:
+        move = max(node.N, key=lambda m: node.N[m])
+        if move not in node.children:
+            break
+        pv.append(move)
+        node = node.children[move]
+    stats.pv = pv or [best_move]
+    stats.depth = len(stats.pv)
+    stack, deepest = [(root, 0)], 0
+    while stack:
+        node, d = stack.pop()
+        deepest = max(deepest, d)
+        stack.extend((c, d + 1) for c in node.children.values())
+    stats.seldepth = max(stats.seldepth, deepest)
+    stats.value = float(root.Q[best_move])
+    return best_move, pi_vec
+
+def benchmark(batch_sizes=(1, 4, 8, 16, 32, 64), n_simulations=256, fen=None):
+    """
+    Đo simulation / giây theo batch_size K (cùng số simulation, cây mới mỗi lần).
+    """
+    import time
+    board = chess.Board(fen) if fen else chess.Board()
+    for k in batch_sizes:
+        start = time.perf_counter()
+        run_mcts_supervised(board, n_simulations=n_simulations, batch_size=k)
+        elapsed = time.perf_counter() - start
+        print(f"K={k:3d}: {n_simulations / elapsed:8.1f} sim/s")
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,11 +1,43 @@
 # engines/minimax.py
 
+import sys
 import chess
+from engines import bitbase
+from engines.search_stats import collect
 from engines.helpers import evaluate_board
+from engines.incremental import as_incremental
+from engines.move_ordering import MoveOrderer
+from engines.transposition import TranspositionTable, compute_key, principal_variation, EXACT, LOWERBOUND, UPPERBOUND
 
 INFINITY = 10_000
 
-def minimax_ab(board: chess.Board, depth: int, alpha: int, beta: int, maximizing_player: bool) -> int:
+# Bảng chuyển vị mặc định, giữ lại giữa các nước đi của cùng một ván
+TT = TranspositionTable(max_mb=16)
+# Killer / history mặc định (dùng chung giữa các lần search)
+ORDERER = MoveOrderer()
+# Cache đánh giá (engines/eval_cache.py), None = không dùng; gán để bật (chỉ có tác dụng khi incremental=False)
+EVAL_CACHE = None
+
+# Số node đã duyệt, số lần cắt nhánh, ply sâu nhất đã tới và giá trị (White perspective)
+# của nước được chọn trong lần search gần nhất
+nodes = 0
+cutoffs = 0
+seldepth = 0
+best_value = None
+
+
+def order_moves(board: chess.Board, tt_move=None):
+    """
+    Khi không dùng MoveOrderer: đưa best move lấy từ bảng chuyển vị (nếu hợp lệ) lên đầu,
+    các nước còn lại giữ nguyên thứ tự.
+    """
+    if tt_move is None or not board.is_legal(tt_move):
+        return board.legal_moves
+    return [tt_move] + [mv for mv in board.legal_moves if mv != tt_move]
+
+
+def minimax_ab(board: chess.Board, depth: int, alpha: int, beta: int, maximizing_player: bool,
+               tt: TranspositionTable = None, orderer: MoveOrderer = None, ply: int = 0) -> int:
     """
     Minimax với cắt tỉa alpha-beta.
     - board: trạng thái bàn cờ hiện tại.
@@ -13,53 +45,148 @@ def minimax_ab(board: chess.Board, depth: int, alpha: int, beta: int, maximizing
     - alpha: best giá trị trắng (maximizer) đã tìm được ở các node anh em bên trái.
     - beta: best giá trị đen (minimizer) đã tìm được ở các node anh em bên trái.
     - maximizing_player: True nếu đang xét node maximize (trắng), False nếu node minimize (đen).
+    - tt: bảng chuyển vị (None = không dùng). Score lưu theo góc nhìn White.
+    - orderer: MoveOrderer (MVV-LVA, killer, history); None = chỉ đưa nước từ TT lên đầu.
+    - ply: khoảng cách tới gốc (dùng cho killer move).
     Trả về giá trị đánh giá của node đó.
     """
+    global nodes, cutoffs, seldepth
+    nodes += 1
+    if ply > seldepth:
+        seldepth = ply
+    # Tàn cuộc 3-4 quân có trong bitbase: giá trị chính xác, không cần search tiếp
+    if chess.popcount(board.occupied) <= bitbase.MAX_PIECES:
+        value = bitbase.score(board)
+        if value is not None:
+            return value
     # Nếu dừng điều kiện cơ bản (độ sâu = 0 hoặc game over), trả về giá trị đánh giá
     if depth == 0 or board.is_game_over():
-        return evaluate_board(board)
+        return evaluate_board(board, EVAL_CACHE)
 
+    # Tra bảng chuyển vị: cắt sớm nếu entry đủ sâu, và lấy best move để thử trước
+    tt_move = None
+    if tt is not None:
+        alpha_orig, beta_orig = alpha, beta
+        key = compute_key(board)
+        entry = tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_score, tt_flag, tt_move = entry
+            if tt_depth >= depth:
+                if tt_flag == EXACT:
+                    return tt_score
+                if tt_flag == LOWERBOUND and tt_score > alpha:
+                    alpha = tt_score
+                elif tt_flag == UPPERBOUND and tt_score < beta:
+                    beta = tt_score
+                if alpha >= beta:
+                    return tt_score
+
+    if orderer is not None:
+        moves = orderer.order(board, ply, tt_move)
+    else:
+        moves = order_moves(board, tt_move)
+
+    best_move = None
     if maximizing_player:
         max_eval = -INFINITY
-        for move in board.legal_moves:
+        for move in moves:
             board.push(move)
-            eval = minimax_ab(board, depth - 1, alpha, beta, False)
+            eval = minimax_ab(board, depth - 1, alpha, beta, False, tt, orderer, ply + 1)
             board.pop()
 
             if eval > max_eval:
                 max_eval = eval
+                best_move = move
             if max_eval > alpha:
                 alpha = max_eval
             # Cắt nhánh: nếu alpha ≥ beta thì không cần xét tiếp
             if alpha >= beta:
+                cutoffs += 1
+                if orderer is not None:
+                    orderer.record_cutoff(board, move, ply, depth)
                 break
-        return max_eval
+        best_eval = max_eval
     else:
         min_eval = INFINITY
-        for move in board.legal_moves:
+        for move in moves:
             board.push(move)
-            eval = minimax_ab(board, depth - 1, alpha, beta, True)
+            eval = minimax_ab(board, depth - 1, alpha, beta, True, tt, orderer, ply + 1)
             board.pop()
 
             if eval < min_eval:
                 min_eval = eval
+                best_move = move
             if min_eval < beta:
                 beta = min_eval
             # Cắt nhánh: nếu alpha ≥ beta thì không cần xét tiếp
             if alpha >= beta:
+                cutoffs += 1
+                if orderer is not None:
+                    orderer.record_cutoff(board, move, ply, depth)
                 break
-        return min_eval
+        best_eval = min_eval
+
+    if tt is not None:
+        # Loại bound tính theo cửa sổ ban đầu (góc nhìn White cho cả hai loại node)
+        if best_eval <= alpha_orig:
+            flag = UPPERBOUND
+        elif best_eval >= beta_orig:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        tt.store(key, depth, best_eval, flag, best_move)
+
+    return best_eval
+
+def get_best_move(board: chess.Board, depth: int = 3, tt: TranspositionTable = None,
+                  use_tt: bool = True, incremental: bool = True, use_ordering: bool = True,
+                  stats=None, orderer: MoveOrderer = None) -> chess.Move:
+    """
+    - tt: bảng chuyển vị dùng cho lần search này (mặc định: bảng TT của module).
+    - use_tt: False để tắt hoàn toàn bảng chuyển vị.
+    - incremental: search trên IncrementalBoard (điểm material + PST cập nhật O(1) ở lá).
+    - use_ordering: sắp xếp nước bằng MoveOrderer (MVV-LVA, killer, history).
+    - stats: engines.search_stats.SearchStats để nhận thống kê (nodes, cutoffs, TT, seldepth, PV,
+      thời gian movegen / eval); None = không thu thập.
+    - orderer: MoveOrderer giữ killer / history giữa các nước (mặc định ORDERER của module).
+      Hai engine chạy xen kẽ trong cùng process (hai bên một ván) cần tt và orderer riêng.
+    Sau khi search, hit rate đọc qua tt.hit_rate / tt.stats(), số node qua minimax.nodes.
+    """
+    if stats is not None:
+        return _search_with_stats(stats, board, depth, tt, use_tt, incremental, use_ordering, orderer)
+    global nodes, cutoffs, seldepth, best_value
+    nodes = cutoffs = seldepth = 0
+    orderer = (orderer if orderer is not None else ORDERER) if use_ordering else None
+    if orderer is not None:
+        orderer.new_search()
+    if incremental:
+        board = as_incremental(board)
+    if not use_tt:
+        tt = None
+    elif tt is None:
+        tt = TT
+    tt_move = None
+    if tt is not None:
+        tt.new_search()
+        key = compute_key(board)
+        entry = tt.probe(key)
+        if entry is not None:
+            tt_move = entry[3]
+
+    if orderer is not None:
+        moves = orderer.order(board, 0, tt_move)
+    else:
+        moves = order_moves(board, tt_move)
 
-def get_best_move(board: chess.Board, depth: int = 3) -> chess.Move:
     best_move = None
     alpha = -INFINITY
     beta = INFINITY
 
     if board.turn == chess.WHITE:
         max_eval = -INFINITY
-        for move in board.legal_moves:
+        for move in moves:
             board.push(move)
-            eval = minimax_ab(board, depth - 1, alpha, beta, False)
+            eval = minimax_ab(board, depth - 1, alpha, beta, False, tt, orderer, 1)
             board.pop()
 
             if eval > max_eval:
@@ -67,13 +194,13 @@ def get_best_move(board: chess.Board, depth: int = 3) -> chess.Move:
                 best_move = move
             if max_eval > alpha:
                 alpha = max_eval
-        return best_move
+        best_eval = max_eval
 
     else:  # đến lượt Đen (minimizer)
         min_eval = INFINITY
-        for move in board.legal_moves:
+        for move in moves:
             board.push(move)
-            eval = minimax_ab(board, depth - 1, alpha, beta, True)
+            eval = minimax_ab(board, depth - 1, alpha, beta, True, tt, orderer, 1)
             board.pop()
 
             if eval < min_eval:
@@ -84,4 +211,34 @@ def get_best_move(board: chess.Board, depth: int = 3) -> chess.Move:
 
             if alpha >= beta:
                 break
-        return best_move
+        best_eval = min_eval
+
+    if tt is not None and best_move is not None:
+        tt.store(key, depth, best_eval, EXACT, best_move)
+
+    best_value = best_eval
+    return best_move
+
+
+def _search_with_stats(stats, board, depth, tt, use_tt, incremental, use_ordering, orderer):
+    # get_best_move với stats: đo thời gian movegen / eval bằng cách tạm bọc các hàm của module
+    module = sys.modules[__name__]
+    tt_used = (tt if tt is not None else TT) if use_tt else None
+    phases = [(module, "evaluate_board", "eval"), (module, "order_moves", "movegen")]
+    if use_ordering:
+        phases.append((orderer if orderer is not None else ORDERER, "order", "movegen"))
+
+    stats.engine = stats.engine or "Minimax"
+    with collect(stats, tt_used, EVAL_CACHE, phases):
+        move = get_best_move(board, depth, tt, use_tt, incremental, use_ordering, orderer=orderer)
+    stats.nodes += nodes
+    stats.cutoffs += cutoffs
+    stats.depth = depth
+    stats.seldepth = max(stats.seldepth, seldepth)
+    stats.value = best_value
+    stats.pv = [move] if move is not None else []
+    if tt_used is not None and move is not None:
+        pv = principal_variation(board, tt_used)
+        if pv and pv[0] == move:
+            stats.pv = pv
+    return move
@@ -0,0 +1,114 @@
+# engines/model_registry.py
+
+# Nạp model mạng nơ-ron khi cần lần đầu (lazy) và cache lại theo (đường dẫn, device, kiến trúc).
+# torch chỉ được import khi thực sự nạp model, nên các engine cổ điển không phải trả giá
+# khởi động torch.
+
+import os
+
+DEFAULT_MODEL_PATH = "models/policy_supervised_final.pt"
+# File trọng số của các preset nhỏ (network_model.MODEL_PRESETS), ví dụ models/policy_6x64.pt
+PRESET_PATH = "models/policy_{}.pt"
+
+_models = {}
+
+
+def default_device():
+    import torch
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def _load_state_dict(path: str, device, mmap: bool):
+    import torch
+    if mmap:
+        try:
+            # Memory-mapped: tensor đọc thẳng từ file khi cần, không copy cả file vào RAM trước
+            return torch.load(path, map_location=device, mmap=True, weights_only=True)
+        except TypeError:
+            pass  # torch cũ chưa hỗ trợ mmap
+    return torch.load(path, map_location=device)
+
+
+def preset_path(preset: str) -> str:
+    """
+    Đường dẫn trọng số của preset: 20x256 là model gốc DEFAULT_MODEL_PATH, còn lại PRESET_PATH.
+    """
+    from engines.network_model import MODEL_PRESETS
+
+    if preset not in MODEL_PRESETS:
+        raise ValueError(f"Preset không hợp lệ: {preset!r} (chọn một trong {', '.join(MODEL_PRESETS)})")
+    return DEFAULT_MODEL_PATH if preset == "20x256" else PRESET_PATH.format(preset)
+
+
+def get_model(path: str = DEFAULT_MODEL_PATH, device=None, num_res_blocks: int = None,
+              num_channels: int = None, action_size: int = None, mmap: bool = False,
+              warmup: bool = True, value_head: bool = None):
+    """
+    Trả về PolicyNet (eval mode) đã nạp trọng số từ path, dùng lại nếu đã nạp trước đó.
+    - num_res_blocks / num_channels / action_size: None = suy ra từ checkpoint
+      (network_model.architecture), nên model cỡ nào cũng nạp được chỉ với đường dẫn.
+    - device: None = cuda nếu có, ngược lại cpu.
+    - mmap: nạp trọng số kiểu memory-mapped (torch >= 2.1).
+    - value_head: None = theo checkpoint (có trọng số value head hay không); False với checkpoint
+      có value head thì bỏ value head, chỉ nạp phần policy.
+    - warmup: chạy thử một lần forward để lần search đầu không chịu chi phí khởi tạo.
+    Raise FileNotFoundError nếu không có file trọng số.
+    """
+    import torch
+    from engines.network_model import PolicyNet, architecture
+
+    device = torch.device(device) if device is not None else default_device()
+    key = (os.path.abspath(path), str(device), num_res_blocks, num_channels, action_size, value_head)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Không tìm thấy trọng số model: {path}")
+    state_dict = _load_state_dict(path, device, mmap)
+    arch = architecture(state_dict)
+    with_value = arch["value_head"]
+    if value_head is None:
+        value_head = with_value
+    elif value_head and not with_value:
+        raise ValueError(f"{path} không có trọng số value head")
+    model = PolicyNet(num_res_blocks=num_res_blocks if num_res_blocks is not None else arch["num_res_blocks"],
+                      num_channels=num_channels if num_channels is not None else arch["num_channels"],
+                      action_size=action_size if action_size is not None else arch["action_size"],
+                      value_head=value_head, value_hidden=arch.get("value_hidden", 256)).to(device)
+    model.load_state_dict(state_dict, strict=value_head or not with_value)
+    model.eval()
+    if warmup:
+        with torch.no_grad():
+            model(torch.zeros((1, 12, 8, 8), dtype=torch.float32, device=device))
+    _models[key] = model
+    return model
+
+
+def model_device(model):
+    return next(model.parameters()).device
+
+
+def predict(model, batch):
+    """
+    batch: numpy (K,12,8,8) float32 → (logits numpy (K, action_size), value numpy (K,) theo góc nhìn
+    White, hoặc None nếu model không có value head) — một lần forward cho cả hai.
+    """
+    import torch
+    batch_tensor = torch.from_numpy(batch).to(model_device(model))
+    with torch.no_grad():
+        output = model(batch_tensor)
+    if isinstance(output, tuple):
+        return output[0].cpu().numpy(), output[1].cpu().numpy()
+    return output.cpu().numpy(), None
+
+
+def predict_logits(model, batch):
+    """
+    batch: numpy (K,12,8,8) float32 → numpy (K, action_size) logits.
+    """
+    return predict(model, batch)[0]
+
+
+def clear_cache():
+    _models.clear()
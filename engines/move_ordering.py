@@ -0,0 +1,132 @@
+# engines/move_ordering.py
+
+import chess
+from engines.helpers import PIECE_VALUES
+
+MAX_PLY = 128
+
+# Thứ tự ưu tiên: nước từ TT > bắt quân / phong cấp (MVV-LVA) > killer > history
+TT_MOVE_SCORE = 1_000_000
+CAPTURE_SCORE = 100_000
+KILLER_SCORES = (90_000, 80_000)
+HISTORY_MAX = 50_000
+
+# Giá trị nạn nhân / quân tấn công cho MVV-LVA (King tấn công coi như lớn nhất)
+MVV_LVA_VALUES = dict(PIECE_VALUES)
+MVV_LVA_VALUES[chess.KING] = 2_000
+
+
+def mvv_lva(board: chess.Board, move: chess.Move) -> int:
+    """
+    Most Valuable Victim - Least Valuable Attacker: ăn quân giá trị cao bằng quân giá trị thấp trước.
+    Trả về 0 nếu không phải nước bắt quân.
+    """
+    victim = board.piece_type_at(move.to_square)
+    if victim is None:
+        if move.to_square != board.ep_square or board.piece_type_at(move.from_square) != chess.PAWN:
+            return 0
+        victim = chess.PAWN
+    attacker = board.piece_type_at(move.from_square)
+    return 10 * MVV_LVA_VALUES[victim] - MVV_LVA_VALUES[attacker]
+
+
+class MoveOrderer:
+    """
+    Sắp xếp nước đi rẻ (không gọi gives_check) dùng chung cho negamax và minimax:
+    - nước đi từ bảng chuyển vị (TT) lên đầu
+    - bắt quân theo MVV-LVA, phong cấp
+    - 2 killer move cho mỗi ply (nước yên lặng gây cắt nhánh ở cùng ply)
+    - history table [màu][from][to] cộng depth^2 mỗi lần nước yên lặng gây cắt nhánh
+    """
+
+    def __init__(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]
+
+    def clear(self):
+        # Về trạng thái ban đầu (ván mới)
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]
+
+    def new_search(self):
+        # Killer của lần search trước không còn đúng ply; history giảm một nửa (aging)
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        for table in self.history:
+            for i in range(4096):
+                table[i] >>= 1
+
+    def score_move(self, board: chess.Board, move: chess.Move, ply: int = 0, tt_move=None) -> int:
+        if move == tt_move:
+            return TT_MOVE_SCORE
+        capture = mvv_lva(board, move)
+        if capture or move.promotion:
+            return CAPTURE_SCORE + capture + (MVV_LVA_VALUES[move.promotion] if move.promotion else 0)
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if move == killers[0]:
+                return KILLER_SCORES[0]
+            if move == killers[1]:
+                return KILLER_SCORES[1]
+        return self.history[board.turn][move.from_square * 64 + move.to_square]
+
+    def order(self, board: chess.Board, ply: int = 0, tt_move=None) -> list:
+        moves = list(board.legal_moves)
+        moves.sort(key=lambda mv: self.score_move(board, mv, ply, tt_move), reverse=True)
+        return moves
+
+    def record_cutoff(self, board: chess.Board, move: chess.Move, ply: int, depth: int):
+        """
+        Gọi khi move gây cắt nhánh beta (board ở trạng thái trước khi đi move).
+        Chỉ nước yên lặng mới được lưu vào killer / history.
+        """
+        if move.promotion or board.is_capture(move):
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        table = self.history[board.turn]
+        idx = move.from_square * 64 + move.to_square
+        table[idx] += depth * depth
+        if table[idx] > HISTORY_MAX:
+            # Giữ history luôn nhỏ hơn điểm killer
+            for color_table in self.history:
+                for i in range(4096):
+                    color_table[i] >>= 1
+
+
+# Bộ vị trí cố định để so sánh hiệu quả sắp xếp nước
+BENCH_FENS = [
+    chess.STARTING_FEN,
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+
+
+def benchmark(depth: int = 3, fens=BENCH_FENS):
+    """
+    So sánh số node và nodes/giây của negamax / minimax khi dùng MoveOrderer
+    với cách sắp xếp cũ (tắt TT để chỉ đo ảnh hưởng của move ordering).
+    """
+    import time
+    from engines import negamax, minimax
+
+    for module in (negamax, minimax):
+        for use_ordering in (False, True):
+            total_nodes, total_time = 0, 0.0
+            for fen in fens:
+                board = chess.Board(fen)
+                start = time.perf_counter()
+                module.get_best_move(board, depth=depth, use_tt=False, use_ordering=use_ordering)
+                total_time += time.perf_counter() - start
+                total_nodes += module.nodes
+            label = "MoveOrderer" if use_ordering else "kiểu cũ"
+            print(f"{module.__name__:16s} {label:12s} nodes={total_nodes:8d} "
+                  f"time={total_time:7.2f}s nps={total_nodes / total_time:8.0f}")
+
+
+if __name__ == "__main__":
+    benchmark()
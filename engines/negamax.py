@@ -1,12 +1,54 @@
 # engines/negamax.py
 
+import sys
+import time
 import chess
+from engines import bitbase
+from engines.search_stats import collect
 from engines.helpers import evaluate_board
+from engines.incremental import as_incremental
+from engines.move_ordering import MoveOrderer
+from engines.transposition import (TranspositionTable, compute_key, principal_variation, ENTRY_BYTES, EXACT,
+                                   LOWERBOUND, UPPERBOUND)
 
 INFINITY = 1_000_000
+DEFAULT_DEPTH = 3
+MAX_DEPTH = 64
 
+# Bảng chuyển vị mặc định, giữ lại giữa các nước đi của cùng một ván
+TT = TranspositionTable(max_mb=16)
+# Killer / history mặc định (dùng chung giữa các lần search)
+ORDERER = MoveOrderer()
+# Cache đánh giá (engines/eval_cache.py), None = không dùng; gán để bật (chỉ có tác dụng khi incremental=False)
+EVAL_CACHE = None
+# Cờ dừng dùng chung giữa các process (engines/parallel_search.py gán trong helper process): .value khác 0
+# thì search đang chạy dừng như hết giờ. Chỉ kiểm tra khi có deadline; None = không dùng
+STOP = None
 
-def negamax_ab(board: chess.Board, depth: int, alpha: int, beta: int, color: int) -> int:
+# Số node đã duyệt, số lần cắt beta và ply sâu nhất đã tới trong lần search gần nhất
+nodes = 0
+cutoffs = 0
+seldepth = 0
+
+
+class SearchTimeout(Exception):
+    """Hết thời gian cho phép (movetime) giữa chừng một vòng iterative deepening."""
+    pass
+
+
+def order_moves(board: chess.Board, tt_move=None) -> list:
+    """
+    Move Ordering cũ (khi không dùng MoveOrderer): nước đi lấy từ bảng chuyển vị
+    (nếu có) lên đầu, sau đó các nước bắt quân / chiếu.
+    """
+    legal_moves = list(board.legal_moves)
+    legal_moves.sort(key=lambda mv: (mv == tt_move, board.is_capture(mv), board.gives_check(mv)), reverse=True)
+    return legal_moves
+
+
+def negamax_ab(board: chess.Board, depth: int, alpha: int, beta: int, color: int,
+               tt: TranspositionTable = None, deadline: float = None,
+               orderer: MoveOrderer = None, ply: int = 0) -> int:
     """
     Negamax với cắt tỉa alpha-beta, sử dụng evaluate_board từ engines/helpers.py.
 
@@ -14,51 +56,112 @@ def negamax_ab(board: chess.Board, depth: int, alpha: int, beta: int, color: int
     - depth: số bước (plies) còn lại.
     - alpha, beta: giới hạn cắt tỉa (int, centipawn).
     - color: +1 nếu tính cho White, -1 nếu tính cho Black.
+    - tt: bảng chuyển vị (None = không dùng).
+    - deadline: mốc time.monotonic() phải dừng; quá hạn (hoặc STOP được bật) thì raise SearchTimeout.
+    - orderer: MoveOrderer (MVV-LVA, killer, history); None = sắp xếp kiểu cũ.
+    - ply: khoảng cách tới gốc (dùng cho killer move).
 
     Trả về: color * eval_centipawn (int).
     """
+    global nodes, cutoffs, seldepth
+    nodes += 1
+    if ply > seldepth:
+        seldepth = ply
+    if deadline is not None and (time.monotonic() >= deadline or (STOP is not None and STOP.value)):
+        raise SearchTimeout
+    # Tàn cuộc 3-4 quân có trong bitbase: giá trị chính xác, không cần search tiếp
+    if chess.popcount(board.occupied) <= bitbase.MAX_PIECES:
+        value = bitbase.score(board)
+        if value is not None:
+            return color * value
     # Điều kiện dừng: đã tới độ sâu 0 hoặc game kết thúc
     if depth == 0 or board.is_game_over():
-        return color * evaluate_board(board)
+        return color * evaluate_board(board, EVAL_CACHE)
+
+    # === Tra bảng chuyển vị: cắt sớm nếu entry đủ sâu, và lấy best move để thử trước ===
+    tt_move = None
+    if tt is not None:
+        alpha_orig = alpha
+        key = compute_key(board)
+        entry = tt.probe(key)
+        if entry is not None:
+            tt_depth, tt_score, tt_flag, tt_move = entry
+            if tt_depth >= depth:
+                if tt_flag == EXACT:
+                    return tt_score
+                if tt_flag == LOWERBOUND and tt_score > alpha:
+                    alpha = tt_score
+                elif tt_flag == UPPERBOUND and tt_score < beta:
+                    beta = tt_score
+                if alpha >= beta:
+                    return tt_score
 
     max_eval = -INFINITY
+    best_move = None
 
-    # === Move Ordering: xếp các nước bắt quân lên trước ===
-    legal_moves = list(board.legal_moves)
-    legal_moves.sort(key=lambda mv: (board.is_capture(mv), board.gives_check(mv)), reverse=True)
+    # === Move Ordering: nước từ TT, bắt quân (MVV-LVA), killer, history ===
+    if orderer is not None:
+        moves = orderer.order(board, ply, tt_move)
+    else:
+        moves = order_moves(board, tt_move)
 
-    for move in legal_moves:
+    for move in moves:
         board.push(move)
         # Hoán đổi vai trò alpha, beta và color
-        score = -negamax_ab(board, depth - 1, -beta, -alpha, -color)
-        board.pop()
+        try:
+            score = -negamax_ab(board, depth - 1, -beta, -alpha, -color, tt, deadline, orderer, ply + 1)
+        finally:
+            board.pop()
 
         if score > max_eval:
             max_eval = score
+            best_move = move
         if max_eval > alpha:
             alpha = max_eval
         # Cắt nhánh nếu alpha >= beta
         if alpha >= beta:
+            cutoffs += 1
+            if orderer is not None:
+                orderer.record_cutoff(board, move, ply, depth)
             break
 
+    if tt is not None:
+        if max_eval <= alpha_orig:
+            flag = UPPERBOUND
+        elif max_eval >= beta:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        tt.store(key, depth, max_eval, flag, best_move)
+
     return max_eval
 
 
-def get_best_move(board: chess.Board, depth: int = 3) -> chess.Move:
+def search_root(board: chess.Board, depth: int, tt: TranspositionTable = None,
+                first_move=None, deadline: float = None, orderer: MoveOrderer = None):
+    """
+    Search một vòng ở độ sâu cố định từ gốc.
+    - first_move: nước thử đầu tiên (best move của vòng trước / từ TT).
+    Trả về (best_move, best_value) theo góc nhìn bên đang đi.
+    """
     best_move = None
     alpha = -INFINITY
     beta = INFINITY
     color = 1 if board.turn == chess.WHITE else -1
     best_value = -INFINITY
 
-    # Sắp xếp trước các nước bắt quân để cắt nhánh sớm hơn
-    legal_moves = list(board.legal_moves)
-    legal_moves.sort(key=lambda mv: (board.is_capture(mv), board.gives_check(mv)), reverse=True)
+    # Sắp xếp trước các nước bắt quân để cắt nhánh sớm hơn (best move cũ lên đầu)
+    if orderer is not None:
+        moves = orderer.order(board, 0, first_move)
+    else:
+        moves = order_moves(board, first_move)
 
-    for move in legal_moves:
+    for move in moves:
         board.push(move)
-        value = -negamax_ab(board, depth - 1, -beta, -alpha, -color)
-        board.pop()
+        try:
+            value = -negamax_ab(board, depth - 1, -beta, -alpha, -color, tt, deadline, orderer, 1)
+        finally:
+            board.pop()
 
         if value > best_value:
             best_value = value
@@ -69,4 +172,123 @@ def get_best_move(board: chess.Board, depth: int = 3) -> chess.Move:
         if alpha >= beta:
             break
 
+    if tt is not None and best_move is not None:
+        tt.store(compute_key(board), depth, best_value, EXACT, best_move)
+
+    return best_move, best_value
+
+
+def get_best_move(board: chess.Board, depth: int = None, tt: TranspositionTable = None,
+                  use_tt: bool = True, movetime: float = None, incremental: bool = True,
+                  use_ordering: bool = True, workers: int = 1, on_iteration=None, stats=None,
+                  tt_mb: float = None, orderer: MoveOrderer = None) -> chess.Move:
+    """
+    - depth: độ sâu cố định (mặc định DEFAULT_DEPTH); nếu có movetime thì là
+      độ sâu tối đa của iterative deepening (mặc định MAX_DEPTH).
+    - tt: bảng chuyển vị dùng cho lần search này (mặc định: bảng TT của module).
+    - use_tt: False để tắt hoàn toàn bảng chuyển vị.
+    - movetime: ngân sách thời gian (giây). Khi có, search lần lượt depth 1, 2, 3...
+      và trả về best move của vòng cuối cùng đã hoàn tất. PV của vòng trước
+      (best move ở gốc + best move trong TT) được thử trước ở vòng sau.
+    - incremental: search trên IncrementalBoard (điểm material + PST cập nhật O(1) ở lá).
+    - use_ordering: sắp xếp nước bằng MoveOrderer (MVV-LVA, killer, history);
+      False = sắp xếp kiểu cũ theo bắt quân / gives_check.
+    - workers: > 1 để search song song nhiều process kiểu Lazy SMP (engines/parallel_search.py,
+      bảng chuyển vị dùng chung trong shared memory nên bỏ qua tt / use_tt; các tuỳ chọn khác giữ nguyên).
+      Thử nghiệm: mới đo trên máy một core (chậm hơn một process), chưa có số đo tăng tốc trên nhiều core.
+    - tt_mb: kích thước (MB) bảng chuyển vị dùng chung khi workers > 1; None = bằng kích thước tt (hoặc TT).
+    - orderer: MoveOrderer giữ killer / history giữa các nước (mặc định ORDERER của module).
+      Hai engine chạy xen kẽ trong cùng process (hai bên một ván) cần tt và orderer riêng.
+    - on_iteration: hàm on_iteration(depth, move, value) gọi sau mỗi vòng iterative deepening
+      hoàn tất (không có movetime: một lần sau vòng độ sâu cố định), để báo best move tạm thời ra ngoài.
+    - stats: engines.search_stats.SearchStats để nhận thống kê (nodes, cutoffs, TT, seldepth, PV,
+      thời gian movegen / eval); None = không thu thập.
+    Sau khi search, hit rate đọc qua tt.hit_rate / tt.stats(), số node qua negamax.nodes.
+    """
+    if stats is not None:
+        return _search_with_stats(stats, board, depth, tt, use_tt, movetime, incremental, use_ordering,
+                                  workers, on_iteration, tt_mb, orderer)
+    if workers > 1:
+        from engines import parallel_search
+        owner = tt if tt is not None else TT
+        if tt_mb is None:
+            tt_mb = owner.size * ENTRY_BYTES / (1024 * 1024)
+        return parallel_search.get_best_move(board, depth, workers, movetime, incremental, use_ordering,
+                                             on_iteration, tt_mb, orderer, owner)
+
+    global nodes, cutoffs, seldepth
+    nodes = cutoffs = seldepth = 0
+    orderer = (orderer if orderer is not None else ORDERER) if use_ordering else None
+    if orderer is not None:
+        orderer.new_search()
+    if incremental:
+        board = as_incremental(board)
+    if not use_tt:
+        tt = None
+    elif tt is None:
+        tt = TT
+    if tt is not None:
+        tt.new_search()
+
+    first_move = None
+    if tt is not None:
+        entry = tt.probe(compute_key(board))
+        if entry is not None:
+            first_move = entry[3]
+
+    if movetime is None:
+        best_move, value = search_root(board, depth or DEFAULT_DEPTH, tt, first_move, orderer=orderer)
+        if on_iteration is not None and best_move is not None:
+            on_iteration(depth or DEFAULT_DEPTH, best_move, value)
+        return best_move
+
+    # === Iterative deepening với giới hạn thời gian ===
+    deadline = time.monotonic() + movetime
+    max_depth = depth if depth else MAX_DEPTH
+    best_move = None
+    for d in range(1, max_depth + 1):
+        try:
+            # Vòng depth 1 luôn chạy hết để chắc chắn có nước đi trả về
+            move, value = search_root(board, d, tt, first_move, deadline if d > 1 else None, orderer)
+        except SearchTimeout:
+            break
+        if move is None:
+            break
+        best_move = first_move = move
+        if on_iteration is not None:
+            on_iteration(d, move, value)
+        if time.monotonic() >= deadline:
+            break
+
     return best_move
+
+
+def _search_with_stats(stats, board, depth, tt, use_tt, movetime, incremental, use_ordering, workers,
+                       on_iteration, tt_mb, orderer):
+    # get_best_move với stats: đo thời gian movegen / eval bằng cách tạm bọc các hàm của module
+    module = sys.modules[__name__]
+    if workers > 1 or not use_tt:
+        tt_used = None
+    else:
+        tt_used = tt if tt is not None else TT
+    phases = [(module, "evaluate_board", "eval"), (module, "order_moves", "movegen")]
+    if use_ordering:
+        phases.append((orderer if orderer is not None else ORDERER, "order", "movegen"))
+
+    def track(d, move, value):
+        stats.depth, stats.value, stats.pv = d, value, [move]
+        if on_iteration is not None:
+            on_iteration(d, move, value)
+
+    stats.engine = stats.engine or "Negamax"
+    with collect(stats, tt_used, EVAL_CACHE, phases):
+        move = get_best_move(board, depth, tt, use_tt, movetime, incremental, use_ordering, workers, track,
+                             tt_mb=tt_mb, orderer=orderer)
+    stats.nodes += nodes
+    stats.cutoffs += cutoffs
+    stats.seldepth = max(stats.seldepth, seldepth)
+    if tt_used is not None and move is not None:
+        pv = principal_variation(board, tt_used)
+        if pv and pv[0] == move:
+            stats.pv = pv
+    return move
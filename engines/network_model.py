@@ -1,3 +1,4 @@
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -19,13 +20,18 @@ class ResidualBlock(nn.Module):
 
 # PolicyNet dày hơn: 20 ResNet blocks, num_channels=256
 class PolicyNet(nn.Module):
-    def __init__(self, num_res_blocks=20, num_channels=256, action_size=4096):
+    def __init__(self, num_res_blocks=20, num_channels=256, action_size=4096, value_head=False,
+                 value_hidden=256):
         """
         - num_res_blocks: 20 (tăng rất sâu)
         - num_channels: 256 (tăng kênh)
         - action_size: 4096 (64×64 mapping)
+        - value_head: thêm value head dùng chung thân residual; forward trả về (logits, value),
+          value ∈ [-1, 1] theo góc nhìn White (12 plane đầu vào không có bên đi). False: chỉ policy,
+          forward trả về logits như cũ (checkpoint cũ nạp được nguyên vẹn).
         """
         super(PolicyNet, self).__init__()
+        self.has_value_head = value_head
         # Layer đầu vào: từ 12 plane → num_channels
         self.conv_in = nn.Conv2d(12, num_channels, kernel_size=3, padding=1, bias=False)
         self.bn_in = nn.BatchNorm2d(num_channels)
@@ -38,6 +44,13 @@ class PolicyNet(nn.Module):
         self.bn_policy = nn.BatchNorm2d(32)
         self.fc_policy = nn.Linear(32 * 8 * 8, action_size)
 
+        # Value head: 1×1 conv xuống 1 channel, FC → value_hidden → 1, tanh
+        if value_head:
+            self.conv_value = nn.Conv2d(num_channels, 1, kernel_size=1)
+            self.bn_value = nn.BatchNorm2d(1)
+            self.fc_value1 = nn.Linear(8 * 8, value_hidden)
+            self.fc_value2 = nn.Linear(value_hidden, 1)
+
     def forward(self, x):
         # x: (batch, 12, 8, 8)
         out = F.relu(self.bn_in(self.conv_in(x)))
@@ -46,4 +59,45 @@ class PolicyNet(nn.Module):
         p = F.relu(self.bn_policy(self.conv_policy(out)))  # (batch, 32, 8, 8)
         p = p.view(p.size(0), -1)                           # (batch, 32*8*8)
         p = self.fc_policy(p)                               # (batch, action_size)
-        return p
\ No newline at end of file
+        if not self.has_value_head:
+            return p
+        v = F.relu(self.bn_value(self.conv_value(out)))     # (batch, 1, 8, 8)
+        v = F.relu(self.fc_value1(v.view(v.size(0), -1)))   # (batch, value_hidden)
+        v = torch.tanh(self.fc_value2(v)).view(-1)          # (batch,)
+        return p, v
+
+
+# Cỡ mạng có sẵn: "số block x số kênh". 20x256 là model gốc; 6x64 / 10x128 nhẹ hơn cho chơi thời gian thực
+MODEL_PRESETS = {
+    "6x64": {"num_res_blocks": 6, "num_channels": 64},
+    "10x128": {"num_res_blocks": 10, "num_channels": 128},
+    "20x256": {"num_res_blocks": 20, "num_channels": 256},
+}
+
+
+def make_policy_net(preset: str = "20x256", value_head: bool = False) -> PolicyNet:
+    if preset not in MODEL_PRESETS:
+        raise ValueError(f"Preset không hợp lệ: {preset!r} (chọn một trong {', '.join(MODEL_PRESETS)})")
+    return PolicyNet(value_head=value_head, **MODEL_PRESETS[preset])
+
+
+def has_value_head(state_dict) -> bool:
+    # Checkpoint có value head hay không (checkpoint cũ chỉ có policy)
+    return "fc_value2.weight" in state_dict
+
+
+def architecture(state_dict) -> dict:
+    """
+    Tham số PolicyNet(...) suy ra từ shape các tensor trong state_dict, để nạp checkpoint
+    mà không phải biết trước cỡ mạng.
+    """
+    blocks = {int(key.split(".")[1]) for key in state_dict if key.startswith("res_blocks.")}
+    arch = {
+        "num_res_blocks": max(blocks) + 1 if blocks else 0,
+        "num_channels": state_dict["conv_in.weight"].shape[0],
+        "action_size": state_dict["fc_policy.weight"].shape[0],
+        "value_head": has_value_head(state_dict),
+    }
+    if arch["value_head"]:
+        arch["value_hidden"] = state_dict["fc_value1.weight"].shape[0]
+    return arch
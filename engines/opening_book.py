@@ -0,0 +1,301 @@
+# engines/opening_book.py
+
+import io
+import mmap
+import os
+import random
+import struct
+import time
+import chess
+import chess.pgn
+import chess.polyglot
+from engines.transposition import compute_key
+
+# === Sách khai cuộc dựng từ PGN, định dạng Polyglot (.bin) ===
+# Mỗi entry 16 byte big-endian: khoá Zobrist (uint64), nước đi (uint16), weight (uint16), learn (uint32),
+# sắp xếp theo khoá (cùng khoá thì weight giảm dần) → đọc bằng mmap + tìm kiếm nhị phân,
+# không phải nạp cả file vào RAM. File dùng được với mọi chương trình đọc sách Polyglot.
+
+DEFAULT_BOOK_PATH = "books/opening_book.bin"
+
+ENTRY_STRUCT = struct.Struct(">QHHI")
+MAX_WEIGHT = 0xFFFF
+
+
+def open_pgn(path: str):
+    """
+    Mở file PGN dạng text; file .zst được giải nén dạng stream (cần gói zstandard).
+    """
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("Đọc PGN .zst cần gói zstandard (pip install zstandard)") from e
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        return io.TextIOWrapper(stream, encoding="utf-8", errors="ignore")
+    return open(path, "r", encoding="utf-8", errors="ignore")
+
+
+def polyglot_move(board: chess.Board, move: chess.Move) -> int:
+    """
+    Mã hoá nước đi kiểu Polyglot: to | from << 6 | promotion << 12 (1 = N ... 4 = Q);
+    nhập thành ghi là vua đi tới ô xe.
+    """
+    to_square = move.to_square
+    if board.is_castling(move) and not board.chess960:
+        to_square = chess.square(7 if chess.square_file(to_square) > chess.square_file(move.from_square) else 0,
+                                 chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | (move.from_square << 6) | (promotion << 12)
+
+
+def decode_polyglot_move(board: chess.Board, raw: int) -> chess.Move:
+    """
+    Ngược với polyglot_move: nhập thành (vua đi tới ô xe) đổi về cách ghi của python-chess.
+    """
+    from_square, to_square = (raw >> 6) & 63, raw & 63
+    promotion = (raw >> 12) & 7
+    if not board.chess960 and board.kings & board.occupied_co[board.turn] & chess.BB_SQUARES[from_square] \
+            and board.rooks & board.occupied_co[board.turn] & chess.BB_SQUARES[to_square]:
+        to_square = chess.square(6 if to_square > from_square else 2, chess.square_rank(from_square))
+    return chess.Move(from_square, to_square, promotion + 1 if promotion else None)
+
+
+class _BookVisitor(chess.pgn.BaseVisitor):
+    """
+    Visitor cho chess.pgn.read_game: chỉ parse SAN của max_ply nửa nước đầu trên mainline,
+    bỏ qua biến (variation) và phần còn lại của ván → không tốn thời gian dựng cả ván.
+    Trả về list (key, polyglot_move, bên đi) cho các nước trong sách cùng kết quả ván.
+    """
+
+    def __init__(self, max_ply: int):
+        self.max_ply = max_ply
+
+    def begin_game(self):
+        self.moves = []
+        self.game_result = None
+        self.ply = 0
+        self.variant_ok = True
+
+    def visit_header(self, tagname: str, tagvalue: str):
+        if tagname == "Result":
+            self.game_result = tagvalue
+        elif tagname in ("Variant", "FEN", "SetUp") and tagvalue not in ("Standard", "0"):
+            self.variant_ok = False
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def begin_parse_san(self, board: chess.Board, san: str):
+        if self.ply >= self.max_ply or not self.variant_ok:
+            return chess.pgn.SKIP
+
+    def visit_move(self, board: chess.Board, move: chess.Move):
+        self.moves.append((compute_key(board), polyglot_move(board, move), board.turn))
+        self.ply += 1
+
+    def handle_error(self, error: Exception):
+        # Ván lỗi: bỏ các nước từ chỗ lỗi trở đi
+        self.ply = self.max_ply
+
+    def result(self):
+        return self.moves, self.game_result
+
+
+def build_book(pgn_path: str, out_path: str, max_ply: int = 16, min_games: int = 3,
+               max_games: int = None, weighting: str = "score", verbose: bool = True) -> dict:
+    """
+    Đọc PGN (stream, không nạp cả file), đếm các cặp (vị trí, nước đi) trong max_ply nửa nước đầu
+    rồi ghi sách Polyglot đã sắp xếp ra out_path.
+    - min_games: bỏ nước xuất hiện ít hơn min_games ván (giữ sách gọn, bỏ nước hiếm / lỗi).
+    - weighting: "games" = số ván; "score" = 2 * thắng + hoà của bên đi nước đó (giống polyglot make).
+    Trả về thống kê (games, positions, entries, bytes, seconds).
+    """
+    start = time.perf_counter()
+    counts = {}
+    weights = {}
+    n_games = 0
+    visitor = _BookVisitor(max_ply)
+    with open_pgn(pgn_path) as handle:
+        while max_games is None or n_games < max_games:
+            game = chess.pgn.read_game(handle, Visitor=lambda: visitor)
+            if game is None:
+                break
+            moves, result = game
+            n_games += 1
+            for key, move, turn in moves:
+                entry = (key, move)
+                counts[entry] = counts.get(entry, 0) + 1
+                if weighting == "games":
+                    points = 1
+                elif result == "1/2-1/2":
+                    points = 1
+                else:
+                    points = 2 if result == ("1-0" if turn == chess.WHITE else "0-1") else 0
+                weights[entry] = weights.get(entry, 0) + points
+            if verbose and n_games % 10000 == 0:
+                print(f"{n_games} ván, {len(counts)} cặp (vị trí, nước)")
+
+    entries = [(key, move, weights[key, move]) for (key, move), n in counts.items()
+               if n >= min_games and weights[key, move] > 0]
+    # Weight của cùng một vị trí được chia cùng tỉ lệ nếu vượt 16 bit
+    max_per_key = {}
+    for key, _, weight in entries:
+        max_per_key[key] = max(max_per_key.get(key, 0), weight)
+    entries.sort(key=lambda e: (e[0], -e[2], e[1]))
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "wb") as out:
+        for key, move, weight in entries:
+            top = max_per_key[key]
+            if top > MAX_WEIGHT:
+                weight = max(1, weight * MAX_WEIGHT // top)
+            out.write(ENTRY_STRUCT.pack(key, move, weight, 0))
+
+    stats = {
+        "games": n_games,
+        "positions": len(max_per_key),
+        "entries": len(entries),
+        "bytes": len(entries) * ENTRY_STRUCT.size,
+        "seconds": time.perf_counter() - start,
+    }
+    if verbose:
+        print(f"Sách {out_path}: {stats['games']} ván → {stats['entries']} entry, "
+              f"{stats['positions']} vị trí, {stats['bytes']} byte, {stats['seconds']:.1f}s")
+    return stats
+
+
+class OpeningBook:
+    """
+    Đọc sách Polyglot bằng mmap: mỗi lần tra là một lần tìm kiếm nhị phân trên file
+    (struct.unpack_from thẳng trên mmap), chỉ các trang được chạm tới mới nằm trong RAM.
+    Chỉ nước được chọn mới được kiểm tra hợp lệ (phòng trùng khoá Zobrist).
+    """
+
+    def __init__(self, path: str = DEFAULT_BOOK_PATH, min_weight: int = 1):
+        self.path = path
+        self.min_weight = min_weight
+        self._file = open(path, "rb")
+        size = os.path.getsize(path)
+        if size % ENTRY_STRUCT.size:
+            self._file.close()
+            raise ValueError(f"{path} không phải sách Polyglot (kích thước {size} byte)")
+        self.size = size // ENTRY_STRUCT.size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if hasattr(self._mmap, "madvise"):
+            self._mmap.madvise(mmap.MADV_RANDOM)
+
+    def __len__(self):
+        return self.size
+
+    def _bisect(self, key: int) -> int:
+        lo, hi = 0, self.size
+        unpack_from, entry_size, data = ENTRY_STRUCT.unpack_from, ENTRY_STRUCT.size, self._mmap
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if unpack_from(data, mid * entry_size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entries(self, key: int) -> list:
+        """
+        [(polyglot_move, weight), ...] của khoá key theo thứ tự trong file (weight giảm dần).
+        """
+        result = []
+        i = self._bisect(key)
+        while i < self.size:
+            entry_key, move, weight, _ = ENTRY_STRUCT.unpack_from(self._mmap, i * ENTRY_STRUCT.size)
+            if entry_key != key:
+                break
+            if weight >= self.min_weight:
+                result.append((move, weight))
+            i += 1
+        return result
+
+    def moves(self, board: chess.Board) -> list:
+        """
+        [(move, weight), ...] hợp lệ cho vị trí, weight giảm dần; [] nếu ngoài sách.
+        """
+        moves = []
+        for raw, weight in self.entries(compute_key(board)):
+            move = decode_polyglot_move(board, raw)
+            if board.is_legal(move):
+                moves.append((move, weight))
+        return moves
+
+    def choose(self, board: chess.Board, rng=random, best: bool = False):
+        """
+        Nước đi từ sách (chọn ngẫu nhiên theo weight, hoặc weight cao nhất nếu best=True),
+        None nếu vị trí không có trong sách.
+        """
+        entries = self.entries(compute_key(board))
+        while entries:
+            if best:
+                index = 0
+            else:
+                r = rng.randrange(sum(weight for _, weight in entries))
+                for index, (_, weight) in enumerate(entries):
+                    if r < weight:
+                        break
+                    r -= weight
+            move = decode_polyglot_move(board, entries[index][0])
+            if board.is_legal(move):
+                return move
+            del entries[index]
+        return None
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+
+def open_book(path: str = DEFAULT_BOOK_PATH):
+    """
+    OpeningBook nếu file sách tồn tại, ngược lại None (chơi không dùng sách).
+    """
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def benchmark(path: str = DEFAULT_BOOK_PATH, n_lookups: int = 20000, seed: int = 0):
+    """
+    Đo thời gian tra sách (µs / lần) trên các vị trí có trong sách và vị trí ngoài sách.
+    """
+    book = OpeningBook(path)
+    rng = random.Random(seed)
+    in_book, board = [], chess.Board()
+    while len(in_book) < 200:
+        move = book.choose(board, rng)
+        if move is None:
+            board = chess.Board()
+            continue
+        in_book.append(board.copy(stack=False))
+        board.push(move)
+    out_of_book = [chess.Board("8/8/8/4k3/8/8/8/4K2R w K - 0 1")] * len(in_book)
+
+    for label, boards in (("trong sách", in_book), ("ngoài sách", out_of_book)):
+        start = time.perf_counter()
+        for i in range(n_lookups):
+            book.choose(boards[i % len(boards)], rng)
+        print(f"{label}: {(time.perf_counter() - start) / n_lookups * 1e6:6.1f} µs / lần tra "
+              f"({len(book)} entry, {os.path.getsize(path)} byte)")
+    book.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dựng sách khai cuộc Polyglot từ PGN (.pgn / .pgn.zst)")
+    parser.add_argument("pgn")
+    parser.add_argument("out", nargs="?", default=DEFAULT_BOOK_PATH)
+    parser.add_argument("--max-ply", type=int, default=16)
+    parser.add_argument("--min-games", type=int, default=3)
+    parser.add_argument("--max-games", type=int, default=None)
+    parser.add_argument("--weighting", choices=("score", "games"), default="score")
+    args = parser.parse_args()
+    build_book(args.pgn, args.out, args.max_ply, args.min_games, args.max_games, args.weighting)
+    benchmark(args.out)
@@ -0,0 +1,252 @@
+# engines/parallel_search.py
+
+import atexit
+import math
+import multiprocessing
+import time
+import chess
+from concurrent.futures import ProcessPoolExecutor
+from engines import negamax
+from engines.incremental import IncrementalBoard
+from engines.move_ordering import MoveOrderer
+from engines.transposition import SharedTranspositionTable, compute_key, entries_for
+
+# === Search nhiều process kiểu Lazy SMP cho negamax ===
+# GIL không cho phép chạy song song bằng thread, nên mỗi helper là một process riêng.
+# Mọi process search cả cây từ gốc và dùng chung một bảng chuyển vị trong shared memory:
+#   - process chính search độ sâu d như negamax.search_root; kết quả của nó là kết quả của vòng d
+#   - workers - 1 helper search cùng lúc với độ sâu so le (d + 1, d, d + 1, ...) chỉ để lấp TT: entry
+#     helper ghi trước (best move, cận trên / dưới) giúp process chính cắt nhánh và sắp xếp nước sớm hơn
+#   - process chính xong thì bật cờ STOP, helper dừng như hết giờ (SearchTimeout) và trả về ngay.
+# Không có bước nào process chính chạy một mình trong khi helper ngồi chờ.
+# Best move có thể khác search một process khi TT chứa entry sâu hơn từ helper (vẫn đúng ở độ sâu >= d).
+# Chưa có số đo tăng tốc trên máy nhiều core (benchmark() mới chạy trên một core), nên negamax vẫn mặc định
+# workers=1 và get_best_move ở đây không có giá trị workers mặc định.
+
+# Kích thước mặc định của bảng chuyển vị dùng chung (bằng negamax.TT)
+DEFAULT_TT_MB = 16
+
+_pool = None
+_pool_workers = 0
+_shared_tt = None
+_stop = None
+# Engine (khoá owner) dùng bảng dùng chung ở lần search gần nhất
+_owner = None
+
+# Trạng thái riêng của mỗi helper process
+_worker_tt = None
+_worker_orderer = None
+
+
+def _init_worker(tt_name: str, tt_size: int, stop):
+    global _worker_tt, _worker_orderer
+    _worker_tt = SharedTranspositionTable(name=tt_name, size=tt_size)
+    _worker_orderer = MoveOrderer()
+    negamax.STOP = stop
+
+
+def _board_args(board: chess.Board):
+    # FEN từ nước bắt quân / đi tốt gần nhất + các nước sau đó: đủ lịch sử cho luật lặp lại
+    n = min(board.halfmove_clock, len(board.move_stack))
+    tail = board.move_stack[len(board.move_stack) - n:]
+    return board.copy(stack=n).root().fen(), [mv.uci() for mv in tail]
+
+
+def _helper_search(fen: str, moves_uci: list, depth: int, first_move_uci: str, generation: int,
+                   deadline: float, incremental: bool, use_ordering: bool):
+    """
+    Task chạy trong helper: search_root độ sâu depth trên TT dùng chung tới khi xong hoặc bị dừng.
+    Trả về (nodes, tt_probes, tt_hits).
+    """
+    board = IncrementalBoard(fen) if incremental else chess.Board(fen)
+    for uci in moves_uci:
+        board.push_uci(uci)
+    orderer = _worker_orderer if use_ordering else None
+    if orderer is not None and generation != _worker_tt.generation:
+        # Lần get_best_move mới (generation của TT đổi): killer / history làm lại như process chính
+        orderer.new_search()
+    _worker_tt.generation = generation
+    _worker_tt.reset_stats()
+    negamax.nodes = 0
+    first_move = chess.Move.from_uci(first_move_uci) if first_move_uci else None
+    try:
+        # deadline vô hạn vẫn bật kiểm tra cờ STOP trong negamax_ab
+        negamax.search_root(board, depth, _worker_tt, first_move,
+                            deadline if deadline is not None else math.inf, orderer)
+    except negamax.SearchTimeout:
+        pass
+    return negamax.nodes, _worker_tt.probes, _worker_tt.hits
+
+
+def get_pool(workers: int, tt_mb: float = None):
+    """
+    Pool process dùng lại giữa các lần search (tạo process tốn thời gian).
+    tt_mb: kích thước bảng chuyển vị dùng chung (None = giữ bảng hiện có, hoặc DEFAULT_TT_MB);
+    đổi kích thước thì tạo lại bảng và pool.
+    Trả về (pool, shared_tt).
+    """
+    global _pool, _pool_workers, _shared_tt, _stop
+    if tt_mb is not None and _shared_tt is not None and _shared_tt.size != entries_for(tt_mb):
+        _cleanup()
+    if _pool is not None and _pool_workers == workers:
+        return _pool, _shared_tt
+    shutdown_pool()
+    if _shared_tt is None:
+        _shared_tt = SharedTranspositionTable(max_mb=tt_mb or DEFAULT_TT_MB)
+    if _stop is None:
+        _stop = multiprocessing.RawValue("b", 0)
+    # workers - 1 helper: process chính là process search thứ workers
+    _pool = ProcessPoolExecutor(max_workers=max(1, workers - 1), initializer=_init_worker,
+                                initargs=(_shared_tt.name, _shared_tt.size, _stop))
+    _pool_workers = workers
+    return _pool, _shared_tt
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+    _pool, _pool_workers = None, 0
+
+
+def _cleanup():
+    global _shared_tt
+    shutdown_pool()
+    if _shared_tt is not None:
+        _shared_tt.close()
+        _shared_tt = None
+
+
+atexit.register(_cleanup)
+
+
+def search_root_parallel(board: chess.Board, depth: int, workers: int, first_move=None,
+                         deadline: float = None, orderer: MoveOrderer = None, incremental: bool = True):
+    """
+    Một vòng search độ sâu cố định: process chính search như negamax.search_root trong khi
+    workers - 1 helper search cùng vị trí (độ sâu so le) trên TT dùng chung.
+    Trả về (best_move, best_value, nodes) với nodes là tổng của mọi process;
+    raise negamax.SearchTimeout nếu hết giờ.
+    """
+    pool, tt = get_pool(workers)
+    fen, moves_uci = _board_args(board)
+    first_uci = first_move.uci() if first_move is not None else None
+    _stop.value = 0
+    futures = [pool.submit(_helper_search, fen, moves_uci, depth + (i % 2), first_uci, tt.generation,
+                           deadline, incremental, orderer is not None)
+               for i in range(1, workers)]
+    negamax.nodes = 0
+    helper_nodes = 0
+    try:
+        best_move, best_value = negamax.search_root(board, depth, tt, first_move, deadline, orderer)
+    finally:
+        # Dừng helper và chờ chúng trả về trước vòng sau (cờ STOP được đặt lại ở vòng sau)
+        _stop.value = 1
+        for fut in futures:
+            nodes, probes, hits = fut.result()
+            helper_nodes += nodes
+            tt.probes += probes
+            tt.hits += hits
+    return best_move, best_value, negamax.nodes + helper_nodes
+
+
+def get_best_move(board: chess.Board, depth: int, workers: int, movetime: float = None,
+                  incremental: bool = True, use_ordering: bool = True, on_iteration=None,
+                  tt_mb: float = DEFAULT_TT_MB, orderer: MoveOrderer = None, owner=None) -> chess.Move:
+    """
+    Phiên bản nhiều process của negamax.get_best_move (dùng bởi negamax.get_best_move(workers=...)).
+    - depth: độ sâu cố định, hoặc độ sâu tối đa khi có movetime.
+    - movetime: ngân sách thời gian (giây) cho iterative deepening.
+    - incremental / use_ordering / on_iteration: như negamax.get_best_move (áp dụng cho mọi process;
+      on_iteration gọi ở process chính sau mỗi vòng).
+    - tt_mb: kích thước (MB) bảng chuyển vị dùng chung.
+    - orderer: MoveOrderer của process chính (mặc định negamax.ORDERER).
+    - owner: khoá của engine gọi (negamax truyền bảng tt riêng của engine). Bảng dùng chung chỉ có một
+      trong mỗi process: owner khác lần search trước thì bảng được xoá, để hai engine chạy xen kẽ
+      (hai bên một ván) không đọc entry của nhau.
+    Tổng số node của mọi process trong lần search gần nhất ghi vào negamax.nodes.
+    """
+    global _owner
+    board = IncrementalBoard.from_board(board) if incremental else board.copy()
+    pool, tt = get_pool(workers, tt_mb)
+    if owner is not _owner:
+        tt.clear()
+        _owner = owner
+    tt.new_search()
+    orderer = (orderer if orderer is not None else negamax.ORDERER) if use_ordering else None
+    if orderer is not None:
+        orderer.new_search()
+
+    first_move = None
+    entry = tt.probe(compute_key(board))
+    if entry is not None:
+        first_move = entry[3]
+
+    if movetime is None:
+        d = depth or negamax.DEFAULT_DEPTH
+        best_move, value, nodes = search_root_parallel(board, d, workers, first_move, None, orderer, incremental)
+        negamax.nodes = nodes
+        if on_iteration is not None and best_move is not None:
+            on_iteration(d, best_move, value)
+        return best_move
+
+    deadline = time.monotonic() + movetime
+    max_depth = depth if depth else negamax.MAX_DEPTH
+    best_move, total_nodes = None, 0
+    for d in range(1, max_depth + 1):
+        try:
+            # Vòng depth 1 luôn chạy hết để chắc chắn có nước đi trả về
+            move, value, nodes = search_root_parallel(board, d, workers, first_move,
+                                                      deadline if d > 1 else None, orderer, incremental)
+        except negamax.SearchTimeout:
+            break
+        total_nodes += nodes
+        if move is None:
+            break
+        best_move = first_move = move
+        if on_iteration is not None:
+            on_iteration(d, move, value)
+        if time.monotonic() >= deadline:
+            break
+    negamax.nodes = total_nodes
+    return best_move
+
+
+def benchmark(depth: int = 4, worker_counts=(2, 4, 8), fens=None):
+    """
+    Đo time-to-depth của search song song theo số worker (so với một process).
+    Ngoài thời gian thực còn in thời gian CPU của process chính. Khi số process vượt số core
+    (os.cpu_count()), thời gian thực bị helper chiếm CPU làm chậm; thời gian CPU của process chính
+    chỉ là ước lượng lạc quan cho trường hợp mỗi process một core (helper còn chạy cả lúc process chính
+    bị dừng chờ CPU nên lấp TT được nhiều hơn thực tế).
+    """
+    import os
+    from engines.move_ordering import BENCH_FENS
+    fens = fens or BENCH_FENS
+
+    print(f"{os.cpu_count()} core, depth {depth}")
+    start = time.perf_counter()
+    serial_moves = []
+    for fen in fens:
+        negamax.TT.clear()
+        serial_moves.append(negamax.get_best_move(chess.Board(fen), depth=depth))
+    serial_time = time.perf_counter() - start
+    print(f"1 process     : {serial_time:7.2f}s")
+
+    for workers in worker_counts:
+        get_pool(workers)
+        start, cpu_start = time.perf_counter(), time.process_time()
+        same = nodes = 0
+        for fen, serial_move in zip(fens, serial_moves):
+            _shared_tt.clear()
+            same += get_best_move(chess.Board(fen), depth=depth, workers=workers) == serial_move
+            nodes += negamax.nodes
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+        print(f"{workers:2d} worker(s)  : {elapsed:7.2f}s  speedup x{serial_time / elapsed:5.2f}  "
+              f"CPU process chính {cpu:6.2f}s (x{serial_time / cpu:4.2f})  {nodes} node  "
+              f"cùng nước đi {same}/{len(fens)}")
+    shutdown_pool()
+
+
+if __name__ == "__main__":
+    benchmark()
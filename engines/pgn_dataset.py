@@ -0,0 +1,303 @@
+# engines/pgn_dataset.py
+
+import collections
+import io
+import json
+import os
+import time
+import chess
+import chess.pgn
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from engines.opening_book import open_pgn
+
+# === PGN (.pgn / .pgn.zst) → dataset supervised dạng gọn, chia shard ===
+# Notebook cũ giải nén cả file, parse tuần tự và lưu mỗi mẫu là planes (12,8,8) float32 + policy one-hot
+# 4096 float32 = 19456 byte. Ở đây mỗi mẫu là một bản ghi SAMPLE_DTYPE 100 byte:
+#   bitboards: 12 uint64 theo PLANE_ORDER (engines/batch_eval.py) → encoding.bitboards_to_planes ra lại planes
+#   turn: bên đi (1 = White), move: from * 64 + to (int16, giống move_to_index), result: kết quả ván theo
+#   góc nhìn bên đi (+1 / 0 / -1; ván "*" tính là 0). Value head học theo góc nhìn White (value_targets).
+# Process chính đọc stream (file .zst giải nén dần, không ghi ra đĩa), cắt thành text từng ván và gửi từng
+# lô ván sang các process con parse; kết quả trả về theo đúng thứ tự và ghi ra các shard .npy
+# (np.load(mmap_mode="r") được) cùng file index.json liệt kê shard và số mẫu.
+
+SAMPLE_DTYPE = np.dtype([
+    ("bitboards", "<u8", (12,)),
+    ("turn", "u1"),
+    ("result", "i1"),
+    ("move", "<i2"),
+])
+
+# Kích thước một mẫu theo định dạng của notebook (planes float32 + policy one-hot float32)
+NOTEBOOK_SAMPLE_BYTES = 12 * 8 * 8 * 4 + 4096 * 4
+
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 1
+
+DEFAULT_SHARD_SIZE = 1 << 20
+GAMES_PER_TASK = 256
+
+RESULTS = {"1-0": 1, "0-1": -1}
+
+
+class _SampleVisitor(chess.pgn.BaseVisitor):
+    """
+    Visitor cho chess.pgn.read_game: với mỗi nước trên mainline ghi 12 bitboard của vị trí trước nước đi,
+    bên đi và chỉ số nước; bỏ qua biến, không dựng cây GameNode. Ván biến thể / có FEN bị bỏ.
+    """
+
+    def __init__(self, max_plies: int = None):
+        self.max_plies = max_plies
+
+    def begin_game(self):
+        self.bitboards = []
+        self.turns = []
+        self.moves = []
+        self.game_result = 0
+        self.ok = True
+
+    def visit_header(self, tagname: str, tagvalue: str):
+        if tagname == "Result":
+            self.game_result = RESULTS.get(tagvalue, 0)
+        elif tagname in ("Variant", "FEN", "SetUp") and tagvalue not in ("Standard", "0"):
+            self.ok = False
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def begin_parse_san(self, board: chess.Board, san: str):
+        if not self.ok or (self.max_plies is not None and len(self.moves) >= self.max_plies):
+            return chess.pgn.SKIP
+
+    def visit_move(self, board: chess.Board, move: chess.Move):
+        black, white = board.occupied_co  # chỉ số theo màu: BLACK = 0, WHITE = 1
+        masks = (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings)
+        self.bitboards.extend([m & white for m in masks])
+        self.bitboards.extend([m & black for m in masks])
+        self.turns.append(board.turn)
+        self.moves.append(move.from_square * 64 + move.to_square)
+
+    def handle_error(self, error: Exception):
+        # Ván lỗi: giữ các nước trước chỗ lỗi, bỏ phần còn lại
+        self.ok = False
+
+    def result(self):
+        return self
+
+
+def iter_game_texts(handle):
+    """
+    Cắt stream PGN thành text từng ván (header + movetext) mà không parse: ván mới bắt đầu
+    ở dòng "[" đầu tiên sau phần movetext của ván trước.
+    """
+    lines = []
+    in_moves = False
+    for line in handle:
+        if line.startswith("["):
+            if in_moves:
+                yield "".join(lines)
+                lines = []
+                in_moves = False
+        elif line.strip():
+            in_moves = True
+        lines.append(line)
+    if in_moves:
+        yield "".join(lines)
+
+
+def games_to_samples(texts, max_plies: int = None):
+    """
+    Parse các ván (text PGN) thành mảng SAMPLE_DTYPE. Chạy trong process con.
+    Trả về (samples, số ván có ít nhất một nước).
+    """
+    bitboards, turns, moves, results = [], [], [], []
+    n_games = 0
+    for text in texts:
+        visitor = chess.pgn.read_game(io.StringIO(text), Visitor=lambda: _SampleVisitor(max_plies))
+        if visitor is None or not visitor.moves:
+            continue
+        n_games += 1
+        bitboards.extend(visitor.bitboards)
+        turns.extend(visitor.turns)
+        moves.extend(visitor.moves)
+        # Kết quả theo góc nhìn bên đi: White giữ dấu, Black đổi dấu
+        results.extend(visitor.game_result if turn else -visitor.game_result for turn in visitor.turns)
+
+    samples = np.empty(len(moves), dtype=SAMPLE_DTYPE)
+    samples["bitboards"] = np.array(bitboards, dtype=np.uint64).reshape(-1, 12)
+    samples["turn"] = turns
+    samples["result"] = results
+    samples["move"] = moves
+    return samples, n_games
+
+
+def _convert_task(task):
+    texts, max_plies = task
+    return games_to_samples(texts, max_plies)
+
+
+class ShardWriter:
+    """
+    Gom mẫu và ghi ra out_dir/shard-00000.npy, shard-00001.npy, ... mỗi shard shard_size mẫu
+    (shard cuối có thể ít hơn); close() ghi index.json.
+    """
+
+    def __init__(self, out_dir: str, shard_size: int = DEFAULT_SHARD_SIZE):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.shards = []
+        self.bytes = 0
+        self._pending = []
+        self._pending_len = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+    def add(self, samples: np.ndarray):
+        if len(samples):
+            self._pending.append(samples)
+            self._pending_len += len(samples)
+        while self._pending_len >= self.shard_size:
+            self._flush(self.shard_size)
+
+    def _flush(self, n: int):
+        data = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+        rest = data[n:]
+        self._pending = [rest] if len(rest) else []
+        self._pending_len = len(rest)
+        name = f"shard-{len(self.shards):05d}.npy"
+        path = os.path.join(self.out_dir, name)
+        np.save(path, data[:n])
+        self.shards.append({"file": name, "samples": n})
+        self.bytes += os.path.getsize(path)
+
+    def close(self, **info) -> dict:
+        if self._pending_len:
+            self._flush(self._pending_len)
+        index = {
+            "format": FORMAT_VERSION,
+            "dtype": SAMPLE_DTYPE.descr,
+            "samples": sum(s["samples"] for s in self.shards),
+            "shards": self.shards,
+            **info,
+        }
+        with open(os.path.join(self.out_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2)
+        return index
+
+
+def value_targets(samples: np.ndarray) -> np.ndarray:
+    """
+    Target của value head (float32): kết quả ván theo góc nhìn White. Trường result lưu theo góc nhìn bên đi,
+    mà planes (encoding) không có thông tin bên đi, nên mạng chỉ học được giá trị không phụ thuộc bên đi.
+    """
+    return np.where(samples["turn"] != 0, samples["result"], -samples["result"]).astype(np.float32)
+
+
+def read_index(out_dir: str) -> dict:
+    """
+    Nội dung index.json của một thư mục dataset; raise ValueError nếu sai phiên bản định dạng.
+    """
+    with open(os.path.join(out_dir, INDEX_FILE), encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{out_dir}: định dạng dataset {index.get('format')!r} không hỗ trợ")
+    return index
+
+
+def open_shards(out_dir: str) -> list:
+    """
+    Các shard của dataset dạng memmap chỉ đọc (mảng SAMPLE_DTYPE), theo thứ tự trong index.json.
+    """
+    index = read_index(out_dir)
+    return [np.load(os.path.join(out_dir, s["file"]), mmap_mode="r") for s in index["shards"]]
+
+
+def convert(pgn_path: str, out_dir: str, workers: int = None, shard_size: int = DEFAULT_SHARD_SIZE,
+            max_games: int = None, max_plies: int = None, games_per_task: int = GAMES_PER_TASK,
+            verbose: bool = True) -> dict:
+    """
+    Đọc PGN dạng stream và ghi dataset dạng shard vào out_dir.
+    - workers: số process parse (mặc định os.cpu_count()); 1 = parse ngay trong process chính.
+    - max_games: dừng sau ngần ấy ván đọc được; max_plies: chỉ lấy max_plies nửa nước đầu mỗi ván
+      (notebook dùng 40).
+    Số lô đang xử lý bị chặn ở 2 * workers nên RAM không phụ thuộc kích thước file.
+    Trả về thống kê (games, positions, bytes, seconds, positions_per_s, bytes_per_position).
+    """
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    writer = ShardWriter(out_dir, shard_size)
+    n_games = n_read = 0
+    last_report = start
+
+    def tasks(handle):
+        nonlocal n_read
+        batch = []
+        for text in iter_game_texts(handle):
+            if max_games is not None and n_read >= max_games:
+                break
+            batch.append(text)
+            n_read += 1
+            if len(batch) == games_per_task:
+                yield batch, max_plies
+                batch = []
+        if batch:
+            yield batch, max_plies
+
+    def consume(samples, games):
+        nonlocal n_games, last_report
+        writer.add(samples)
+        n_games += games
+        now = time.perf_counter()
+        if verbose and now - last_report >= 10:
+            last_report = now
+            positions = sum(s["samples"] for s in writer.shards) + writer._pending_len
+            print(f"{n_games} ván, {positions} vị trí, {positions / (now - start):.0f} vị trí/s")
+
+    with open_pgn(pgn_path) as handle:
+        if workers == 1:
+            for task in tasks(handle):
+                consume(*_convert_task(task))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = collections.deque()
+                for task in tasks(handle):
+                    pending.append(pool.submit(_convert_task, task))
+                    if len(pending) >= 2 * workers:
+                        consume(*pending.popleft().result())
+                while pending:
+                    consume(*pending.popleft().result())
+
+    seconds = time.perf_counter() - start
+    index = writer.close(source=os.path.basename(pgn_path), games=n_games, max_plies=max_plies)
+    positions = index["samples"]
+    stats = {
+        "games": n_games,
+        "positions": positions,
+        "shards": len(index["shards"]),
+        "bytes": writer.bytes,
+        "seconds": seconds,
+        "positions_per_s": positions / seconds if seconds > 0 else 0.0,
+        "bytes_per_position": writer.bytes / positions if positions else 0.0,
+    }
+    if verbose:
+        print(f"{out_dir}: {n_games} ván → {positions} vị trí trong {stats['shards']} shard, "
+              f"{stats['seconds']:.1f}s ({stats['positions_per_s']:.0f} vị trí/s), "
+              f"{stats['bytes_per_position']:.1f} byte/vị trí "
+              f"(notebook: {NOTEBOOK_SAMPLE_BYTES} byte, nhỏ hơn "
+              f"{NOTEBOOK_SAMPLE_BYTES / max(stats['bytes_per_position'], 1):.0f} lần)")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PGN (.pgn / .pgn.zst) → dataset supervised dạng shard .npy")
+    parser.add_argument("pgn")
+    parser.add_argument("out_dir")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="số mẫu mỗi shard")
+    parser.add_argument("--max-games", type=int, default=None)
+    parser.add_argument("--max-plies", type=int, default=None, help="số nửa nước đầu lấy từ mỗi ván")
+    parser.add_argument("--games-per-task", type=int, default=GAMES_PER_TASK)
+    args = parser.parse_args()
+    convert(args.pgn, args.out_dir, args.workers, args.shard_size, args.max_games, args.max_plies,
+            args.games_per_task)
@@ -0,0 +1,227 @@
+# engines/playout.py
+
+import random
+import time
+import chess
+from engines import bitbase
+from engines.incremental import SCORE_TABLES
+
+# === Rollout nhanh cho MCTS ===
+# So với mcts.simulate:
+#   - chạy trên bản sao chess.Board không có move stack (snapshot), nên không có kiểm tra lặp
+#     lại nước / claim hoà theo lịch sử (những kiểm tra này quét cả stack ở mỗi ply)
+#   - chọn nước ngẫu nhiên đều trong các nước pseudo-legal mà không dựng list(board.legal_moves):
+#     quân thường đếm ô đích bằng bitboard, chỉ tạo đúng một chess.Move rồi kiểm tra không tự chiếu;
+#     nước không hợp lệ bị loại khỏi tập và bốc lại (vẫn là phân phối đều trên nước hợp lệ)
+#   - chiếu hết / hết nước / không đủ quân chiếu hết cho kết quả giống hệt is_game_over()
+
+# Các ngưỡng luật 50 / 75 nước (tính theo nửa nước) không phụ thuộc lịch sử nên vẫn giữ
+FIFTY_MOVE_PLIES = 100
+SEVENTY_FIVE_MOVE_PLIES = 150
+
+
+PROMOTIONS = (chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT)
+
+
+def snapshot(board: chess.Board) -> chess.Board:
+    """
+    chess.Board thường, không có move stack, cùng vị trí với board
+    (rẻ hơn board.copy(stack=False): không dựng lại lớp con như IncrementalBoard).
+    """
+    b = chess.Board(None, chess960=board.chess960)
+    b.pawns, b.knights, b.bishops = board.pawns, board.knights, board.bishops
+    b.rooks, b.queens, b.kings = board.rooks, board.queens, board.kings
+    b.occupied_co[chess.WHITE] = board.occupied_co[chess.WHITE]
+    b.occupied_co[chess.BLACK] = board.occupied_co[chess.BLACK]
+    b.occupied = board.occupied
+    b.promoted = board.promoted
+    b.turn = board.turn
+    b.castling_rights = board.castling_rights
+    b.ep_square = board.ep_square
+    b.halfmove_clock = board.halfmove_clock
+    b.fullmove_number = board.fullmove_number
+    return b
+
+
+def _pawn_groups(board: chess.Board, pawns: int, them: int) -> list:
+    """
+    Nước đi thường của tốt theo nhóm [bitboard ô đích, None, độ lệch to - from, số nước mỗi ô].
+    Ô đích ở hàng cuối tính 4 nước (phong Q/R/B/N). En passant không nằm ở đây.
+    """
+    empty = ~board.occupied & chess.BB_ALL
+    if board.turn == chess.WHITE:
+        single = (pawns << 8) & empty
+        double = ((single & chess.BB_RANK_3) << 8) & empty
+        left = ((pawns & ~chess.BB_FILE_A) << 7) & them
+        right = ((pawns & ~chess.BB_FILE_H) << 9) & them
+        deltas, last_rank = (8, 16, 7, 9), chess.BB_RANK_8
+    else:
+        single = (pawns >> 8) & empty
+        double = ((single & chess.BB_RANK_6) >> 8) & empty
+        left = ((pawns & ~chess.BB_FILE_A) >> 9) & them
+        right = ((pawns & ~chess.BB_FILE_H) >> 7) & them
+        deltas, last_rank = (-8, -16, -9, -7), chess.BB_RANK_1
+    groups = []
+    for mask, delta in zip((single, double, left, right), deltas):
+        if mask & ~last_rank:
+            groups.append([mask & ~last_rank, None, delta, 1])
+        if mask & last_rank:
+            groups.append([mask & last_rank, None, delta, 4])
+    return groups
+
+
+def sample_move(board: chess.Board, rng=random):
+    """
+    Một nước hợp lệ ngẫu nhiên (phân phối đều), None nếu không còn nước nào.
+    """
+    if board.is_check():
+        # Thoát chiếu: ít nước, dùng bộ sinh nước hợp lệ sẵn có
+        moves = list(board.generate_legal_moves())
+        return rng.choice(moves) if moves else None
+
+    us = board.occupied_co[board.turn]
+    them = board.occupied_co[not board.turn]
+    pawns = board.pawns & us
+    # Mỗi nhóm: [bitboard ô đích, ô xuất phát (None với tốt), độ lệch to - from, số nước mỗi ô]
+    groups = _pawn_groups(board, pawns, them) if pawns else []
+    for sq in chess.scan_reversed(us & ~pawns):
+        targets = board.attacks_mask(sq) & ~us
+        if targets:
+            groups.append([targets, sq, 0, 1])
+    counts = [chess.popcount(g[0]) * g[3] for g in groups]
+    # En passant hiếm gặp: list nước riêng, kiểm tra bằng is_legal
+    special = list(board.generate_pseudo_legal_ep()) if board.ep_square is not None else []
+    # Nhập thành: mỗi quân xe còn quyền nhập thành là một ứng viên, chỉ sinh nước khi bốc trúng
+    backrank = chess.BB_RANK_1 if board.turn == chess.WHITE else chess.BB_RANK_8
+    special.extend(chess.scan_reversed(board.castling_rights & us & backrank))
+    n_normal = sum(counts)
+    total = n_normal + len(special)
+
+    while total:
+        r = rng.randrange(total)
+        if r < n_normal:
+            for i, n in enumerate(counts):
+                if r < n:
+                    break
+                r -= n
+            group = groups[i]
+            mask, from_sq, delta, per_square = group
+            to_sq = _nth_square(mask, r // per_square)
+            if from_sq is None:
+                from_sq = to_sq - delta
+            move = chess.Move(from_sq, to_sq, PROMOTIONS[r % per_square] if per_square == 4 else None)
+            if not board.is_into_check(move):
+                return move
+            # Cả ô đích (mọi kiểu phong cấp) đều tự chiếu như nhau → loại khỏi tập
+            group[0] = mask & ~chess.BB_SQUARES[to_sq]
+            counts[i] -= per_square
+            n_normal -= per_square
+            total -= per_square
+        else:
+            move = special[r - n_normal]
+            if isinstance(move, int):
+                castling = list(board.generate_castling_moves(chess.BB_ALL, chess.BB_SQUARES[move]))
+                if castling:
+                    return castling[0]
+            elif board.is_legal(move):
+                return move
+            special.remove(move)
+            total -= 1
+    return None
+
+
+def _nth_square(mask: int, n: int) -> int:
+    # Bỏ n bit thấp nhất rồi lấy bit thấp nhất còn lại
+    for _ in range(n):
+        mask &= mask - 1
+    return (mask & -mask).bit_length() - 1
+
+
+def material_score(board: chess.Board) -> int:
+    """
+    Điểm material + PST (White perspective), bằng material_pst_score nhưng duyệt bitboard
+    của từng loại quân thay vì 64 ô.
+    """
+    value = 0
+    for color in chess.COLORS:
+        tables = SCORE_TABLES[color]
+        for piece_type in chess.PIECE_TYPES:
+            table = tables[piece_type]
+            for sq in chess.scan_forward(board.pieces_mask(piece_type, color)):
+                value += table[sq]
+    return value
+
+
+def outcome_value(board: chess.Board):
+    """
+    +1 / -1 / 0 nếu vị trí đã kết thúc theo luật không phụ thuộc lịch sử
+    (chiếu hết, hết nước, không đủ quân chiếu hết, luật 75 nước), ngược lại None.
+    """
+    if not any(board.generate_legal_moves()):
+        if board.is_check():
+            return -1 if board.turn == chess.WHITE else +1
+        return 0
+    if board.is_insufficient_material() or board.halfmove_clock >= SEVENTY_FIVE_MOVE_PLIES:
+        return 0
+    return None
+
+
+def fast_simulate(node_board: chess.Board, max_depth: int = 20, rng=random) -> float:
+    """
+    Rollout ngẫu nhiên tối đa max_depth ply từ node_board (không thay đổi node_board).
+    Trả về kết quả trong [-1, 1] theo White perspective, cùng thang với mcts.simulate:
+    ±1 / 0 nếu ván kết thúc, ngược lại điểm material + PST / 1000 (cắt về [-1, 1]).
+    """
+    b = snapshot(node_board)
+    for _ in range(max_depth):
+        if b.halfmove_clock >= SEVENTY_FIVE_MOVE_PLIES:
+            return 0
+        move = sample_move(b, rng)
+        if move is None:
+            # Không còn nước hợp lệ: chiếu hết hoặc hết nước (stalemate)
+            if b.is_check():
+                return -1 if b.turn == chess.WHITE else +1
+            return 0
+        capture_or_promotion = move.promotion or b.is_capture(move)
+        b.push(move)
+        # Chỉ bắt quân / phong cấp mới làm thay đổi vật chất
+        if capture_or_promotion:
+            if b.is_insufficient_material():
+                return 0
+            if chess.popcount(b.occupied) <= bitbase.MAX_PIECES:
+                exact = bitbase.outcome(b)
+                if exact is not None:
+                    return exact
+
+    result = outcome_value(b)
+    if result is not None:
+        return result
+    if b.halfmove_clock >= FIFTY_MOVE_PLIES:
+        return 0  # có thể claim hoà theo luật 50 nước
+    score_cp = material_score(b)
+    return max(-1.0, min(1.0, score_cp / 1000.0))
+
+
+def benchmark(n_playouts: int = 300, max_depth: int = 20, seed: int = 0, fens=None):
+    """
+    So sánh ply / giây của fast_simulate với mcts.simulate trên cùng các vị trí.
+    """
+    from engines.mcts import simulate
+    from engines.incremental import IncrementalBoard
+    from engines.move_ordering import BENCH_FENS
+
+    fens = fens or BENCH_FENS
+    boards = [IncrementalBoard(fen) for fen in fens]
+    for name, func in (("mcts.simulate", simulate), ("fast_simulate", fast_simulate)):
+        rng = random.Random(seed)
+        plies, start = 0, time.perf_counter()
+        for i in range(n_playouts):
+            board = boards[i % len(boards)]
+            func(board, max_depth, rng)
+            plies += max_depth
+        elapsed = time.perf_counter() - start
+        print(f"{name:14s}: {n_playouts / elapsed:8.1f} playout/s  ~{plies / elapsed:9.0f} ply/s (tối đa)")
+
+
+if __name__ == "__main__":
+    benchmark()
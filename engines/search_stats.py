@@ -0,0 +1,262 @@
+# engines/search_stats.py
+
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from engines import helpers
+
+# Một khối timed_phases trong mỗi process tại một thời điểm (RLock: cho phép lồng nhau trong cùng thread)
+_PHASES_LOCK = threading.RLock()
+
+# === Thống kê search và profiling (tuỳ chọn) ===
+# Mọi engine nhận tham số stats=SearchStats(): sau khi search, stats chứa nodes, số lần đánh giá lá,
+# cutoff, hit bảng chuyển vị / eval cache, depth / seldepth, PV và thời gian theo phase
+# (movegen / eval / inference / rollout). stats=None (mặc định) thì engine chạy đúng đường cũ:
+# thời gian phase được đo bằng cách tạm thay hàm của module bằng bản có bấm giờ (timed_phases)
+# chỉ trong lúc search có stats, nên không tốn gì khi tắt.
+# Hàm được thay ở mức module / object dùng chung của cả process, nên mỗi process chỉ chạy một search có stats
+# tại một thời điểm: _PHASES_LOCK xếp hàng các search có stats ở các thread khác nhau (nếu không, hai khối
+# chồng nhau trả lại hàm sai thứ tự và bản bấm giờ còn lại mãi). Search không có stats chạy ở thread khác
+# trong lúc đó cũng đi qua bản bấm giờ và thời gian của nó cộng vào stats đang đo; cần số đo đúng thì đừng
+# chạy search khác song song trong cùng process.
+#
+# profile_call chạy một lần search dưới cProfile hoặc SamplingProfiler và ghi kết quả ra file.
+
+
+class SearchStats:
+    """
+    Thống kê của một (hoặc nhiều, cộng dồn) lần search.
+    - nodes: node đã duyệt (Minimax / Negamax), simulation (MCTS), nước đã thử (Greedy)
+    - evals: số lần evaluate_board; cutoffs: số lần cắt beta
+    - tt_probes / tt_hits, cache_probes / cache_hits: bảng chuyển vị và eval cache (nếu dùng)
+    - depth: độ sâu đã search xong; seldepth: ply sâu nhất đã tới
+    - pv: biến chính (list chess.Move); value: điểm của nước tốt nhất theo engine
+    - time_total và timings {phase: giây}; các phase có thể lồng nhau (ví dụ eval nằm trong rollout)
+    """
+
+    def __init__(self, engine: str = ""):
+        self.engine = engine
+        self.nodes = 0
+        self.evals = 0
+        self.cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.cache_probes = 0
+        self.cache_hits = 0
+        self.depth = 0
+        self.seldepth = 0
+        self.pv = []
+        self.value = None
+        self.time_total = 0.0
+        self.timings = {}
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.time_total if self.time_total > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "engine": self.engine,
+            "nodes": self.nodes,
+            "nps": self.nps,
+            "evals": self.evals,
+            "cutoffs": self.cutoffs,
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "cache_probes": self.cache_probes,
+            "cache_hits": self.cache_hits,
+            "depth": self.depth,
+            "seldepth": self.seldepth,
+            "pv": [mv.uci() for mv in self.pv],
+            "value": self.value,
+            "time_total": self.time_total,
+            "timings": dict(self.timings),
+        }
+
+    def __str__(self):
+        # Dạng gần với dòng "info" của UCI
+        parts = [f"depth {self.depth}", f"seldepth {self.seldepth}", f"nodes {self.nodes}",
+                 f"nps {self.nps:.0f}", f"evals {self.evals}", f"cutoffs {self.cutoffs}"]
+        if self.tt_probes:
+            parts.append(f"tt {self.tt_hits}/{self.tt_probes}")
+        if self.cache_probes:
+            parts.append(f"cache {self.cache_hits}/{self.cache_probes}")
+        parts.append(f"time {self.time_total * 1000:.0f}ms")
+        parts += [f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.timings.items()]
+        if self.value is not None:
+            parts.append(f"value {self.value}")
+        if self.pv:
+            parts.append("pv " + " ".join(mv.uci() for mv in self.pv))
+        return (self.engine + ": " if self.engine else "") + " ".join(parts)
+
+
+def _timed(func, timings: dict, phase: str):
+    perf_counter = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[phase] = timings.get(phase, 0.0) + perf_counter() - start
+    return wrapper
+
+
+@contextmanager
+def timed_phases(stats: SearchStats, targets):
+    """
+    targets: [(owner, tên thuộc tính, phase)], owner là module, lớp hoặc object.
+    Trong khối with, owner.<tên> được thay bằng bản bấm giờ cộng vào stats.timings[phase];
+    ra khỏi khối thì trả lại như cũ. Việc thay áp dụng cho cả process (mọi thread), nên khối with giữ
+    _PHASES_LOCK: thread khác vào timed_phases phải chờ khối này xong.
+    """
+    saved = []
+    with _PHASES_LOCK:
+        try:
+            for owner, attr, phase in targets:
+                own = attr in vars(owner)
+                saved.append((owner, attr, own, vars(owner).get(attr)))
+                setattr(owner, attr, _timed(getattr(owner, attr), stats.timings, phase))
+            yield stats
+        finally:
+            for owner, attr, own, original in reversed(saved):
+                if own:
+                    setattr(owner, attr, original)
+                else:
+                    delattr(owner, attr)  # thuộc tính lấy từ lớp (ví dụ method): xoá bản gắn lên instance
+
+
+@contextmanager
+def collect(stats: SearchStats, tt=None, cache=None, phases=()):
+    """
+    Bao một lần search: cộng vào stats thời gian tổng, số lần evaluate_board, probe / hit của
+    bảng chuyển vị tt và eval cache cache (đo theo chênh lệch bộ đếm trước / sau) và thời gian các phase.
+    Bộ đếm và hàm bấm giờ là của cả process: chỉ đúng khi không có search khác chạy song song trong
+    process; cả khối giữ _PHASES_LOCK nên search có stats ở thread khác phải chờ (xem timed_phases).
+    """
+    with _PHASES_LOCK:
+        evals = helpers.evaluations
+        tt_before = (tt.probes, tt.hits) if tt is not None else None
+        cache_before = (cache.hits, cache.misses) if cache is not None else None
+        start = time.perf_counter()
+        try:
+            with timed_phases(stats, phases):
+                yield stats
+        finally:
+            stats.time_total += time.perf_counter() - start
+            stats.evals += helpers.evaluations - evals
+            if tt_before is not None:
+                stats.tt_probes += tt.probes - tt_before[0]
+                stats.tt_hits += tt.hits - tt_before[1]
+            if cache_before is not None:
+                hits, misses = cache.hits - cache_before[0], cache.misses - cache_before[1]
+                stats.cache_hits += hits
+                stats.cache_probes += hits + misses
+
+
+# --- Profiling ---
+class SamplingProfiler:
+    """
+    Profiler lấy mẫu thuần Python: một thread đọc stack của thread đang search mỗi `interval` giây
+    (sys._current_frames). Ít làm méo thời gian hơn cProfile với code gọi nhiều hàm nhỏ.
+    Thread lấy mẫu cần GIL nên switch interval của interpreter được hạ xuống bằng interval trong lúc đo.
+    Kết quả: số mẫu theo stack (định dạng "collapsed" của flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+
+    def __enter__(self):
+        self._target = threading.get_ident()
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def top(self, limit: int = 20) -> list:
+        """
+        [(hàm, % mẫu có hàm ở đỉnh stack (self), % mẫu có hàm trong stack (inclusive)), ...]
+        """
+        own, inclusive = {}, {}
+        for key, count in self.stacks.items():
+            frames = key.split(";")
+            own[frames[-1]] = own.get(frames[-1], 0) + count
+            for name in set(frames):
+                inclusive[name] = inclusive.get(name, 0) + count
+        total = self.samples or 1
+        rows = sorted(own, key=own.get, reverse=True)[:limit]
+        return [(name, 100 * own[name] / total, 100 * inclusive[name] / total) for name in rows]
+
+    def dump(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for key, count in sorted(self.stacks.items()):
+                f.write(f"{key} {count}\n")
+
+
+def new_profiler(kind: str = "cprofile"):
+    """
+    Profiler dùng được nhiều lần với `with prof:` (kết quả cộng dồn), để chỉ đo phần search
+    mà bỏ qua phần chuẩn bị giữa các lần (reset bảng chuyển vị, dựng bàn cờ, ...).
+    kind: "cprofile" (cProfile.Profile) hoặc "sampling" (SamplingProfiler).
+    """
+    if kind == "cprofile":
+        return cProfile.Profile()
+    if kind == "sampling":
+        return SamplingProfiler()
+    raise ValueError(f"profiler không hợp lệ: {kind!r} (cprofile / sampling)")
+
+
+def report_profile(prof, output: str = None, limit: int = 25):
+    """
+    In các hàm tốn thời gian nhất của prof và ghi ra output nếu có:
+    file .prof (pstats / snakeviz) với cProfile, file stack dạng collapsed (flamegraph) với SamplingProfiler.
+    """
+    if isinstance(prof, SamplingProfiler):
+        if output:
+            prof.dump(output)
+        print(f"{prof.samples} mẫu")
+        for name, own, inclusive in prof.top(limit):
+            print(f"{own:6.1f}% self {inclusive:6.1f}% incl  {name}")
+        return
+    if output:
+        prof.dump_stats(output)
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(limit)
+    print(buf.getvalue())
+
+
+def profile_call(func, *args, profiler: str = "cprofile", output: str = None, limit: int = 25, **kwargs):
+    """
+    Chạy func(*args, **kwargs) dưới profiler ("cprofile" / "sampling") rồi in các hàm tốn thời gian nhất
+    (report_profile); trả về kết quả của func.
+    """
+    prof = new_profiler(profiler)
+    with prof:
+        result = func(*args, **kwargs)
+    report_profile(prof, output, limit)
+    return result
@@ -0,0 +1,271 @@
+# engines/selfplay.py
+
+import json
+import os
+import random
+import time
+import chess
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from engines import mcts_supervised
+from engines.batch_eval import board_to_bitboards
+from engines.model_registry import DEFAULT_MODEL_PATH, get_model
+
+# === Sinh dữ liệu self-play bằng run_mcts_supervised ===
+# Mỗi process trong pool chơi trọn một ván (model nạp một lần mỗi process), process chính ghi nối (append-only)
+# vào out_dir:
+#   positions.bin: bản ghi POSITION_DTYPE mỗi vị trí (bitboards / turn / result / move giống
+#                  pgn_dataset.SAMPLE_DTYPE, thêm n_visits = số nước có visit > 0 ở gốc)
+#   visits.bin:    các cặp (move = from * 64 + to, visits) của từng vị trí, nối liền theo thứ tự positions.bin
+#   games.jsonl:   một dòng cho mỗi ván đã ghi xong (id, số vị trí, kết quả, thời gian) — ghi SAU dữ liệu
+# games.jsonl là "commit log": khi resume, positions.bin / visits.bin được cắt về đúng phần của các ván
+# đã có trong games.jsonl, nên ván đang ghi dở lúc bị ngắt không làm hỏng dữ liệu.
+
+POSITION_DTYPE = np.dtype([
+    ("bitboards", "<u8", (12,)),
+    ("turn", "u1"),
+    ("result", "i1"),
+    ("move", "<i2"),
+    ("n_visits", "<u2"),
+])
+VISIT_DTYPE = np.dtype([("move", "<i2"), ("visits", "<u2")])
+
+POSITIONS_FILE = "positions.bin"
+VISITS_FILE = "visits.bin"
+GAMES_FILE = "games.jsonl"
+
+DEFAULT_SIMULATIONS = 200
+DEFAULT_MAX_PLIES = 300
+# Số nửa nước đầu chọn nước ngẫu nhiên theo phân bố visit (đa dạng khai cuộc), sau đó chọn nhiều visit nhất
+TEMPERATURE_PLIES = 30
+
+
+def _init_worker():
+    import torch
+    # Mỗi process một luồng torch: nhiều process song song, tránh tranh CPU
+    torch.set_num_threads(1)
+
+
+def play_game(game_id: int, seed: int = 0, n_simulations: int = DEFAULT_SIMULATIONS, c_puct: float = 1.4,
+              batch_size: int = 8, max_plies: int = DEFAULT_MAX_PLIES,
+              temperature_plies: int = TEMPERATURE_PLIES, model_path: str = DEFAULT_MODEL_PATH) -> dict:
+    """
+    Chơi một ván self-play (cây MCTS giữ giữa các nước). Ván quá max_plies nửa nước tính là hoà.
+    Trả về {"id", "positions" (POSITION_DTYPE), "visits" (VISIT_DTYPE), "result" (góc nhìn White),
+    "plies", "seconds", "termination"}.
+    """
+    start = time.perf_counter()
+    rng = random.Random(seed * 1_000_003 + game_id)
+    random.seed(rng.random())  # expand_from_logits xáo nước bằng module random
+    model = get_model(model_path)
+    mcts_supervised.reset_tree()
+
+    board = chess.Board()
+    bitboards, turns, moves, counts, visits = [], [], [], [], []
+    while not board.is_game_over() and board.ply() < max_plies:
+        _, pi_vec = mcts_supervised.run_mcts_supervised(board, n_simulations, c_puct, reuse_tree=True,
+                                                         batch_size=batch_size, model=model)
+        played = [(m, n) for m, n in pi_vec.items() if n > 0]
+        if board.ply() < temperature_plies:
+            move = rng.choices([m for m, _ in played], weights=[n for _, n in played])[0]
+        else:
+            move = max(played, key=lambda item: item[1])[0]
+        bitboards.extend(board_to_bitboards(board))
+        turns.append(board.turn)
+        moves.append(mcts_supervised.move_to_index(move))
+        counts.append(len(played))
+        visits.extend((mcts_supervised.move_to_index(m), min(n, 0xFFFF)) for m, n in played)
+        board.push(move)
+    mcts_supervised.reset_tree()
+
+    outcome = board.outcome()
+    result = 0
+    if outcome is not None and outcome.winner is not None:
+        result = 1 if outcome.winner == chess.WHITE else -1
+    positions = np.empty(len(moves), dtype=POSITION_DTYPE)
+    positions["bitboards"] = np.array(bitboards, dtype=np.uint64).reshape(-1, 12)
+    positions["turn"] = turns
+    positions["result"] = [result if turn else -result for turn in turns]
+    positions["move"] = moves
+    positions["n_visits"] = counts
+    return {
+        "id": game_id,
+        "positions": positions,
+        "visits": np.array(visits, dtype=VISIT_DTYPE),
+        "result": result,
+        "plies": board.ply(),
+        "seconds": time.perf_counter() - start,
+        "termination": outcome.termination.name.lower() if outcome is not None else "max_plies",
+    }
+
+
+def _committed(out_dir: str):
+    """
+    (các ván trong games.jsonl, số byte của phần log hợp lệ): dừng ở dòng đầu tiên ghi dở / hỏng.
+    """
+    path = os.path.join(out_dir, GAMES_FILE)
+    games, size = [], 0
+    if not os.path.exists(path):
+        return games, size
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                games.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+            size += len(line)
+    return games, size
+
+
+def _truncate(path: str, size: int):
+    with open(path, "ab") as f:
+        f.truncate(size)
+
+
+def read_selfplay(out_dir: str):
+    """
+    (positions, visits, offsets): memmap POSITION_DTYPE / VISIT_DTYPE của các ván đã commit và
+    offsets (N+1,) để visits của vị trí i là visits[offsets[i]:offsets[i + 1]].
+    """
+    games, _ = _committed(out_dir)
+    n_positions = sum(g["positions"] for g in games)
+    n_visits = sum(g["visits"] for g in games)
+    positions = np.memmap(os.path.join(out_dir, POSITIONS_FILE), POSITION_DTYPE, "r", shape=(n_positions,)) \
+        if n_positions else np.empty(0, POSITION_DTYPE)
+    visits = np.memmap(os.path.join(out_dir, VISITS_FILE), VISIT_DTYPE, "r", shape=(n_visits,)) \
+        if n_visits else np.empty(0, VISIT_DTYPE)
+    offsets = np.zeros(n_positions + 1, dtype=np.int64)
+    np.cumsum(positions["n_visits"], out=offsets[1:])
+    return positions, visits, offsets
+
+
+def visit_distribution(visits: np.ndarray, offsets: np.ndarray, indices, action_size: int = 4096) -> np.ndarray:
+    """
+    Phân bố visit (B, action_size) float32 (mỗi hàng tổng = 1) của các vị trí indices — target policy
+    cho huấn luyện kiểu AlphaZero.
+    """
+    indices = np.asarray(indices)
+    starts, stops = offsets[indices], offsets[indices + 1]
+    lengths = stops - starts
+    rows = np.repeat(np.arange(len(indices)), lengths)
+    flat = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)]) if len(indices) else np.empty(0, int)
+    counts = visits["visits"][flat].astype(np.float32)
+    out = np.zeros((len(indices), action_size), dtype=np.float32)
+    np.add.at(out, (rows, visits["move"][flat].astype(np.int64)), counts)
+    out /= np.maximum(out.sum(axis=1, keepdims=True), 1.0)
+    return out
+
+
+def generate(out_dir: str, games: int = None, hours: float = None, workers: int = None, seed: int = 0,
+             n_simulations: int = DEFAULT_SIMULATIONS, c_puct: float = 1.4, batch_size: int = 8,
+             max_plies: int = DEFAULT_MAX_PLIES, temperature_plies: int = TEMPERATURE_PLIES,
+             model_path: str = DEFAULT_MODEL_PATH, verbose: bool = True) -> dict:
+    """
+    Chơi self-play song song và ghi nối vào out_dir; chạy tiếp (resume) nếu out_dir đã có dữ liệu.
+    - games: tổng số ván cần có trong out_dir (kể cả các ván từ lần chạy trước); hours: giới hạn thời gian
+      của lần chạy này. Không có cả hai thì chạy tới khi Ctrl+C (các ván đã xong vẫn được giữ).
+    - workers: số process (mặc định os.cpu_count()).
+    Trả về thống kê của lần chạy: games, positions, seconds, positions_per_hour_per_core, ...
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    done, log_size = _committed(out_dir)
+    positions_path, visits_path = os.path.join(out_dir, POSITIONS_FILE), os.path.join(out_dir, VISITS_FILE)
+    # Bỏ phần ghi dở của ván chưa commit
+    _truncate(os.path.join(out_dir, GAMES_FILE), log_size)
+    _truncate(positions_path, sum(g["positions"] for g in done) * POSITION_DTYPE.itemsize)
+    _truncate(visits_path, sum(g["visits"] for g in done) * VISIT_DTYPE.itemsize)
+    next_id = max((g["id"] for g in done), default=-1) + 1
+    if verbose and done:
+        print(f"Resume {out_dir}: {len(done)} ván đã có, bắt đầu từ ván #{next_id}")
+
+    params = dict(seed=seed, n_simulations=n_simulations, c_puct=c_puct, batch_size=batch_size,
+                  max_plies=max_plies, temperature_plies=temperature_plies, model_path=model_path)
+    deadline = time.monotonic() + hours * 3600 if hours is not None else None
+    start = time.perf_counter()
+    n_games = n_positions = 0
+    results = {1: 0, 0: 0, -1: 0}
+    last_report = start
+
+    def more():
+        if games is not None and len(done) + n_games + len(pending) >= games:
+            return False
+        return deadline is None or time.monotonic() < deadline
+
+    pending = set()
+    with open(positions_path, "ab") as pos_file, open(visits_path, "ab") as vis_file, \
+            open(os.path.join(out_dir, GAMES_FILE), "a", encoding="utf-8") as log, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        try:
+            while True:
+                while len(pending) < workers and more():
+                    pending.add(pool.submit(play_game, next_id, **params))
+                    next_id += 1
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    game = future.result()
+                    pos_file.write(game["positions"].tobytes())
+                    vis_file.write(game["visits"].tobytes())
+                    pos_file.flush()
+                    vis_file.flush()
+                    entry = {key: game[key] for key in ("id", "result", "plies", "seconds", "termination")}
+                    entry.update(positions=len(game["positions"]), visits=len(game["visits"]))
+                    log.write(json.dumps(entry) + "\n")
+                    log.flush()
+                    n_games += 1
+                    n_positions += len(game["positions"])
+                    results[game["result"]] += 1
+                now = time.perf_counter()
+                if verbose and now - last_report >= 30:
+                    last_report = now
+                    print(f"{len(done) + n_games} ván, {n_positions / ((now - start) / 3600) / workers:.0f} "
+                          f"vị trí/giờ/core")
+        except KeyboardInterrupt:
+            # Bỏ các ván đang chơi, giữ các ván đã ghi
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    seconds = time.perf_counter() - start
+    hours_used = seconds / 3600
+    stats = {
+        "games": n_games,
+        "total_games": len(done) + n_games,
+        "positions": n_positions,
+        "seconds": seconds,
+        "workers": workers,
+        "results": {"1-0": results[1], "1/2-1/2": results[0], "0-1": results[-1]},
+        "positions_per_hour": n_positions / hours_used if seconds > 0 else 0.0,
+        "positions_per_hour_per_core": n_positions / hours_used / workers if seconds > 0 else 0.0,
+        "bytes_per_position": (os.path.getsize(positions_path) + os.path.getsize(visits_path))
+                              / max(sum(g["positions"] for g in done) + n_positions, 1),
+    }
+    if verbose:
+        print(f"{n_games} ván mới ({stats['total_games']} tổng), {n_positions} vị trí trong {seconds:.1f}s, "
+              f"{stats['positions_per_hour_per_core']:.0f} vị trí/giờ/core ({workers} process), "
+              f"{stats['bytes_per_position']:.0f} byte/vị trí, kết quả {stats['results']}")
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu self-play (append-only, resume được)")
+    parser.add_argument("out_dir")
+    parser.add_argument("--games", type=int, default=None, help="tổng số ván cần có trong out_dir")
+    parser.add_argument("--hours", type=float, default=None, help="giới hạn thời gian lần chạy này")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--simulations", type=int, default=DEFAULT_SIMULATIONS)
+    parser.add_argument("--c-puct", type=float, default=1.4)
+    parser.add_argument("--batch-size", type=int, default=8, help="batch lá mỗi lần gọi model")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES)
+    parser.add_argument("--temperature-plies", type=int, default=TEMPERATURE_PLIES)
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.out_dir, args.games, args.hours, args.workers, args.seed, args.simulations, args.c_puct,
+             args.batch_size, args.max_plies, args.temperature_plies, args.model)
@@ -0,0 +1,468 @@
+# engines/train.py
+
+import math
+import os
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+from engines.encoding import bitboards_to_planes, boards_to_planes
+from engines.model_registry import DEFAULT_MODEL_PATH, default_device, get_model, predict
+from engines.network_model import MODEL_PRESETS, PolicyNet, make_policy_net
+from engines.pgn_dataset import games_to_samples, read_index, value_targets
+
+# === Huấn luyện PolicyNet từ dataset dạng shard (engines/pgn_dataset.py) ===
+# Notebook cũ np.load cả dataset vào RAM (19 KB / mẫu) và mỗi worker của DataLoader giữ một bản copy.
+# Ở đây shard được mở bằng memmap trong từng worker (chỉ đường dẫn đi qua pickle), dữ liệu đọc theo block
+# nằm trong page cache dùng chung giữa các process; RAM mỗi worker chỉ là buffer xáo trộn (buffer_size mẫu
+# x 100 byte) + một batch đã giải mã, không phụ thuộc kích thước dataset.
+# Xáo trộn hai mức: thứ tự block (block_size mẫu liên tiếp, lấy từ mọi shard) đổi theo từng epoch, rồi
+# các block được trộn trong buffer trước khi cắt batch. Planes (B,12,8,8) giải mã vector hoá từ bitboard
+# (encoding.bitboards_to_planes), target là chỉ số nước int64 → CrossEntropyLoss, không cần policy one-hot.
+# PolicyNet có value head: thêm target kết quả ván theo góc nhìn White (-1 / 0 / +1, pgn_dataset.value_targets:
+# planes không có plane bên đi nên không học được góc nhìn bên đi), loss = cross entropy + value_weight * MSE.
+# check_value_sign (--check-value-sign) kiểm tra dấu của target và của giá trị lá trong MCTS.
+# Distillation (teacher=...): mạng nhỏ (preset 6x64 / 10x128) học phân bố logits của mạng lớn trên cùng dataset,
+# loss policy = alpha * T² * KL(softmax(teacher / T) || softmax(student / T)) + (1 - alpha) * cross entropy.
+# Logits của teacher tính ngay trong vòng train (không lưu ra đĩa: 4096 số mỗi mẫu).
+
+BLOCK_SIZE = 4096
+BUFFER_SIZE = 1 << 18
+BATCH_SIZE = 128
+
+LEARNING_RATE = 0.0005
+WEIGHT_DECAY = 1e-4
+VALUE_WEIGHT = 1.0
+DISTILL_TEMPERATURE = 2.0
+DISTILL_ALPHA = 0.9
+
+
+class ShardedDataset(IterableDataset):
+    """
+    Dataset lặp qua các shard (memmap) theo batch: mỗi phần tử là (planes float32 (B,12,8,8),
+    moves int64 (B,)), thêm results float32 (B,) (góc nhìn White) nếu values=True. Dùng với DataLoader(dataset, batch_size=None).
+    - shards: danh sách file shard (.npy); mặc định mọi shard trong index.json của data_dir.
+    - shuffle=False: đọc tuần tự (đánh giá); drop_last: bỏ batch cuối thiếu.
+    Gọi set_epoch(epoch) trước mỗi epoch để đổi thứ tự xáo trộn (cùng seed + epoch → cùng thứ tự).
+    """
+
+    def __init__(self, data_dir: str, shards: list = None, batch_size: int = BATCH_SIZE,
+                 shuffle: bool = True, block_size: int = BLOCK_SIZE, buffer_size: int = BUFFER_SIZE,
+                 seed: int = 0, drop_last: bool = False, values: bool = False):
+        index = read_index(data_dir)
+        sizes = {s["file"]: s["samples"] for s in index["shards"]}
+        self.files = list(shards) if shards is not None else list(sizes)
+        self.paths = [os.path.join(data_dir, f) for f in self.files]
+        self.sizes = [sizes[f] for f in self.files]
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.block_size = block_size
+        self.buffer_size = max(buffer_size, batch_size)
+        self.seed = seed
+        self.drop_last = drop_last
+        self.values = values
+        self.epoch = 0
+
+    @property
+    def samples(self) -> int:
+        return sum(self.sizes)
+
+    def __len__(self):
+        # Số batch (xấp xỉ khi nhiều worker: mỗi worker có thể dư một batch thiếu)
+        if self.drop_last:
+            return self.samples // self.batch_size
+        return math.ceil(self.samples / self.batch_size)
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _blocks(self) -> list:
+        # (shard, start, stop) của mọi block; mọi worker tính cùng một thứ tự rồi lấy phần của mình
+        blocks = [(i, start, min(start + self.block_size, size))
+                  for i, size in enumerate(self.sizes) for start in range(0, size, self.block_size)]
+        if self.shuffle:
+            order = np.random.default_rng((self.seed, self.epoch)).permutation(len(blocks))
+            blocks = [blocks[j] for j in order]
+        worker = get_worker_info()
+        if worker is not None:
+            blocks = blocks[worker.id::worker.num_workers]
+        return blocks
+
+    def _decode(self, batch: np.ndarray):
+        planes = torch.from_numpy(bitboards_to_planes(batch["bitboards"]))
+        moves = torch.from_numpy(batch["move"].astype(np.int64))
+        if self.values:
+            return planes, moves, torch.from_numpy(value_targets(batch))
+        return planes, moves
+
+    def __iter__(self):
+        worker = get_worker_info()
+        rng = np.random.default_rng((self.seed, self.epoch, worker.id if worker is not None else 0, 1))
+        shards = [None] * len(self.paths)
+        pending, pending_len = [], 0
+        blocks = self._blocks()
+        for k, (i, start, stop) in enumerate(blocks):
+            if shards[i] is None:
+                shards[i] = np.load(self.paths[i], mmap_mode="r")
+            pending.append(np.array(shards[i][start:stop]))
+            pending_len += stop - start
+            last = k == len(blocks) - 1
+            if pending_len < self.buffer_size and not last:
+                continue
+            buffer = np.concatenate(pending)
+            if self.shuffle:
+                buffer = buffer[rng.permutation(len(buffer))]
+            # Phần dư (< batch_size) được giữ lại để trộn tiếp với các block sau
+            n_full = len(buffer) // self.batch_size * self.batch_size
+            for b in range(0, n_full, self.batch_size):
+                yield self._decode(buffer[b:b + self.batch_size])
+            rest = buffer[n_full:]
+            pending, pending_len = ([rest], len(rest)) if len(rest) else ([], 0)
+        if pending_len and not self.drop_last:
+            yield self._decode(np.concatenate(pending))
+
+
+def split_shards(data_dir: str, val_shards: int = 0):
+    """
+    (shard huấn luyện, shard kiểm tra): val_shards shard cuối làm tập kiểm tra.
+    """
+    files = [s["file"] for s in read_index(data_dir)["shards"]]
+    if val_shards <= 0:
+        return files, []
+    if val_shards >= len(files):
+        raise ValueError(f"Cần nhiều hơn {val_shards} shard để tách tập kiểm tra ({len(files)} shard)")
+    return files[:-val_shards], files[-val_shards:]
+
+
+def make_loader(dataset: ShardedDataset, workers: int = 2) -> DataLoader:
+    return DataLoader(dataset, batch_size=None, num_workers=workers,
+                      pin_memory=torch.cuda.is_available(), persistent_workers=False)
+
+
+def _split_output(output):
+    # forward của PolicyNet: logits, hoặc (logits, value) nếu có value head
+    return output if isinstance(output, tuple) else (output, None)
+
+
+def evaluate(model, loader, device=None) -> dict:
+    """
+    Loss (cross entropy) và độ chính xác top-1 / top-5 của model trên loader;
+    thêm value_mse nếu model có value head và loader trả về kết quả ván.
+    """
+    device = device or next(model.parameters()).device
+    criterion = nn.CrossEntropyLoss(reduction="sum")
+    model.eval()
+    total = loss = top1 = top5 = value_se = 0
+    with torch.no_grad():
+        for planes, moves, *results in loader:
+            planes, moves = planes.to(device, non_blocking=True), moves.to(device, non_blocking=True)
+            logits, value = _split_output(model(planes))
+            loss += criterion(logits, moves).item()
+            if value is not None and results:
+                value_se += ((value - results[0].to(device)) ** 2).sum().item()
+            best = logits.topk(5, dim=1).indices
+            top1 += (best[:, 0] == moves).sum().item()
+            top5 += (best == moves[:, None]).any(dim=1).sum().item()
+            total += len(moves)
+    total = max(total, 1)
+    metrics = {"loss": loss / total, "top1": top1 / total, "top5": top5 / total, "samples": total}
+    if getattr(model, "has_value_head", False) and getattr(loader.dataset, "values", False):
+        metrics["value_mse"] = value_se / total
+    return metrics
+
+
+def _rss_mb() -> float:
+    # RSS hiện tại của process (Linux); 0 nếu không đọc được
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return 0.0
+
+
+def train(data_dir: str, epochs: int = 20, batch_size: int = BATCH_SIZE, lr: float = LEARNING_RATE,
+          weight_decay: float = WEIGHT_DECAY, num_res_blocks: int = 20, num_channels: int = 256,
+          model=None, out_path: str = DEFAULT_MODEL_PATH, checkpoint_dir: str = None,
+          checkpoint_every: int = 5, resume: str = None, workers: int = 2, val_shards: int = 0,
+          buffer_size: int = BUFFER_SIZE, device=None, seed: int = 0, value_head: bool = False,
+          value_weight: float = VALUE_WEIGHT, init_from: str = None, preset: str = None, teacher=None,
+          distill_temperature: float = DISTILL_TEMPERATURE, distill_alpha: float = DISTILL_ALPHA,
+          verbose: bool = True):
+    """
+    Huấn luyện PolicyNet (Adam + CrossEntropyLoss trên chỉ số nước, giống notebook) từ dataset shard.
+    - model: PolicyNet có sẵn; None = PolicyNet(num_res_blocks, num_channels, value_head) mới,
+      preset ("6x64" / "10x128" / "20x256", network_model.MODEL_PRESETS) thay cho num_res_blocks / num_channels.
+    - teacher: đường dẫn checkpoint hoặc PolicyNet để distill (mục đầu file), với distill_temperature /
+      distill_alpha.
+    - value_head: (với model mới) thêm value head, học kết quả ván với trọng số value_weight.
+    - init_from: state_dict để khởi tạo (strict=False: ví dụ thân + policy từ checkpoint cũ,
+      value head khởi tạo ngẫu nhiên).
+    - checkpoint_dir: lưu {epoch, model_state_dict, optimizer_state_dict, loss} mỗi checkpoint_every epoch;
+      resume: đường dẫn checkpoint để train tiếp.
+    - val_shards: số shard cuối dùng làm tập kiểm tra (loss / top-1 in sau mỗi epoch).
+    Lưu state_dict cuối vào out_path (đọc lại được bằng model_registry.get_model). Trả về model.
+    """
+    device = torch.device(device) if device is not None else default_device()
+    torch.manual_seed(seed)
+    if model is None and preset is not None:
+        model = make_policy_net(preset, value_head)
+    elif model is None:
+        model = PolicyNet(num_res_blocks=num_res_blocks, num_channels=num_channels, value_head=value_head)
+    if init_from:
+        missing, _ = model.load_state_dict(torch.load(init_from, map_location="cpu"), strict=False)
+        if verbose and missing:
+            print(f"Khởi tạo từ {init_from}, {len(missing)} tensor mới: {', '.join(missing)}")
+    model = model.to(device)
+    with_value = model.has_value_head
+    if isinstance(teacher, str):
+        teacher = get_model(teacher, device=device, warmup=False)
+    if teacher is not None:
+        teacher.eval()
+
+    train_files, val_files = split_shards(data_dir, val_shards)
+    dataset = ShardedDataset(data_dir, train_files, batch_size, buffer_size=buffer_size, seed=seed,
+                             drop_last=True, values=with_value)
+    loader = make_loader(dataset, workers)
+    val_loader = None
+    if val_files:
+        val_loader = make_loader(ShardedDataset(data_dir, val_files, 1024, shuffle=False, values=with_value),
+                                 workers)
+
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr, weight_decay=weight_decay)
+    criterion = nn.CrossEntropyLoss()
+    value_criterion = nn.MSELoss()
+    start_epoch = 0
+    if resume:
+        checkpoint = torch.load(resume, map_location=device)
+        model.load_state_dict(checkpoint["model_state_dict"])
+        optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
+        start_epoch = checkpoint["epoch"]
+
+    if verbose:
+        print(f"{dataset.samples} mẫu huấn luyện ({len(train_files)} shard), "
+              f"{len(dataset)} batch / epoch, device {device}")
+    for epoch in range(start_epoch, epochs):
+        dataset.set_epoch(epoch)
+        model.train()
+        running_loss, batches, samples = 0.0, 0, 0
+        start = time.perf_counter()
+        for planes, moves, *results in loader:
+            planes, moves = planes.to(device, non_blocking=True), moves.to(device, non_blocking=True)
+            optimizer.zero_grad()
+            logits, value = _split_output(model(planes))
+            loss = criterion(logits, moves)
+            if teacher is not None:
+                with torch.no_grad():
+                    teacher_logits, _ = _split_output(teacher(planes))
+                t = distill_temperature
+                kl = F.kl_div(F.log_softmax(logits / t, dim=1), F.softmax(teacher_logits / t, dim=1),
+                              reduction="batchmean") * t * t
+                loss = distill_alpha * kl + (1 - distill_alpha) * loss
+            if value is not None:
+                loss = loss + value_weight * value_criterion(value, results[0].to(device, non_blocking=True))
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item()
+            batches += 1
+            samples += len(moves)
+        avg_loss = running_loss / max(batches, 1)
+        seconds = time.perf_counter() - start
+        if verbose:
+            line = (f"Epoch [{epoch + 1}/{epochs}], Loss: {avg_loss:.4f}, "
+                    f"{samples / seconds:.0f} mẫu/s, RSS {_rss_mb():.0f} MB")
+            if val_loader is not None:
+                val = evaluate(model, val_loader, device)
+                line += f", val loss {val['loss']:.4f}, top-1 {val['top1']:.3f}"
+                if "value_mse" in val:
+                    line += f", value MSE {val['value_mse']:.4f}"
+            print(line)
+
+        if checkpoint_dir and (epoch + 1) % checkpoint_every == 0:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            ckpt_path = os.path.join(checkpoint_dir, f"ckpt_epoch_{epoch + 1}.pt")
+            torch.save({
+                "epoch": epoch + 1,
+                "model_state_dict": model.state_dict(),
+                "optimizer_state_dict": optimizer.state_dict(),
+                "loss": avg_loss,
+            }, ckpt_path)
+            if verbose:
+                print("Đã lưu checkpoint:", ckpt_path)
+
+    if out_path:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        torch.save(model.state_dict(), out_path)
+        if verbose:
+            print("Đã lưu model cuối:", out_path)
+    return model
+
+
+def benchmark(data_dir: str, batch_size: int = BATCH_SIZE, workers: int = 0, max_batches: int = 2000):
+    """
+    Tốc độ nạp + giải mã batch (không train) và RSS trước / sau, so với kích thước dataset trên đĩa
+    và dung lượng nếu nạp theo định dạng notebook (19456 byte / mẫu).
+    """
+    from engines.pgn_dataset import NOTEBOOK_SAMPLE_BYTES
+
+    dataset = ShardedDataset(data_dir, batch_size=batch_size)
+    rss_before = _rss_mb()
+    start = time.perf_counter()
+    samples = 0
+    for i, (planes, _) in enumerate(make_loader(dataset, workers)):
+        samples += len(planes)
+        if i + 1 >= max_batches:
+            break
+    seconds = time.perf_counter() - start
+    disk = sum(os.path.getsize(p) for p in dataset.paths)
+    print(f"{samples} mẫu trong {seconds:.2f}s ({samples / seconds:.0f} mẫu/s), "
+          f"RSS {rss_before:.0f} → {_rss_mb():.0f} MB; dataset {disk / 2 ** 20:.1f} MB trên đĩa, "
+          f"{dataset.samples * NOTEBOOK_SAMPLE_BYTES / 2 ** 20:.0f} MB theo định dạng notebook")
+
+
+def compare_models(data_dir: str, paths: list, teacher: str = None, shards: list = None,
+                   max_samples: int = 20000, batch_sizes=(1, 8), repeat: int = 20, device="cpu") -> list:
+    """
+    Bảng chọn preset: với mỗi checkpoint — số tham số, latency một lần gọi model (ms / vị trí) với từng
+    batch size trong batch_sizes (giống cách MCTS gọi: batch 1 hoặc batch lá), top-1 / top-5 trên tối đa
+    max_samples mẫu đầu của shards (mặc định mọi shard) và tỉ lệ top-1 trùng với teacher nếu có.
+    In bảng Markdown và trả về list dict.
+    """
+    torch.set_grad_enabled(False)
+    dataset = ShardedDataset(data_dir, shards, batch_size=256, shuffle=False)
+    batches = []
+    for planes, moves in dataset:
+        batches.append((planes, moves))
+        if sum(len(m) for _, m in batches) >= max_samples:
+            break
+    teacher_top1 = None
+    if teacher is not None:
+        teacher_model = get_model(teacher, device=device, warmup=False)
+        teacher_top1 = [_split_output(teacher_model(p.to(device)))[0].argmax(dim=1) for p, _ in batches]
+
+    rows = []
+    for path in paths:
+        model = get_model(path, device=device)
+        sample = np.ascontiguousarray(batches[0][0].numpy())
+        latency = {}
+        for size in batch_sizes:
+            batch = np.ascontiguousarray(np.resize(sample, (size, *sample.shape[1:])))
+            predict(model, batch)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                predict(model, batch)
+                times.append(time.perf_counter() - start)
+            latency[size] = float(np.median(times)) * 1000 / size
+        total = top1 = top5 = agree = 0
+        for k, (planes, moves) in enumerate(batches):
+            logits, _ = _split_output(model(planes.to(device)))
+            best = logits.topk(5, dim=1).indices.cpu()
+            top1 += (best[:, 0] == moves).sum().item()
+            top5 += (best == moves[:, None]).any(dim=1).sum().item()
+            if teacher_top1 is not None:
+                agree += (best[:, 0] == teacher_top1[k].cpu()).sum().item()
+            total += len(moves)
+        row = {
+            "model": path,
+            "params": sum(p.numel() for p in model.parameters()),
+            "latency_ms": latency,
+            "top1": top1 / max(total, 1),
+            "top5": top5 / max(total, 1),
+            "samples": total,
+        }
+        if teacher_top1 is not None:
+            row["teacher_agreement"] = agree / max(total, 1)
+        rows.append(row)
+    torch.set_grad_enabled(True)
+
+    header = ["model", "params"] + [f"ms/vị trí (batch {b})" for b in batch_sizes] + ["top-1", "top-5"]
+    if teacher_top1 is not None:
+        header.append("trùng teacher")
+    print("| " + " | ".join(header) + " |")
+    print("|" + "---|" * len(header))
+    for row in rows:
+        cells = [row["model"], f"{row['params'] / 1e6:.2f}M"] + \
+                [f"{row['latency_ms'][b]:.2f}" for b in batch_sizes] + [f"{row['top1']:.3f}", f"{row['top5']:.3f}"]
+        if teacher_top1 is not None:
+            cells.append(f"{row['teacher_agreement']:.3f}")
+        print("| " + " | ".join(cells) + " |")
+    print(f"({rows[0]['samples'] if rows else 0} mẫu, device {device})")
+    return rows
+
+
+def check_value_sign(model=None):
+    """
+    Kiểm tra quy ước dấu của value head (raise AssertionError nếu sai):
+    - target: ván 0-1 cho -1 ở mọi vị trí của ván, dù bên đi là White hay Black;
+    - MCTS: giá trị lá (mcts_supervised.leaf_reward) bằng đúng đầu ra value head, cùng một vị trí với
+      White đi và Black đi (planes giống nhau) cho cùng giá trị.
+    model: PolicyNet có value head; None = mạng nhỏ khởi tạo ngẫu nhiên (chỉ kiểm tra đường dữ liệu, không
+    kiểm tra chất lượng).
+    """
+    import chess
+    from engines import mcts_supervised
+
+    samples, _ = games_to_samples(["[Result \"0-1\"]\n\n1. f3 e5 2. g4 Qh4# 0-1\n"])
+    targets = value_targets(samples)
+    assert set(samples["turn"]) == {0, 1} and (targets == -1).all(), f"value target sai dấu: {targets}"
+
+    model = model if model is not None else PolicyNet(num_res_blocks=1, num_channels=8, value_head=True).eval()
+    fen = "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R {} KQkq - 2 3"
+    leaves = [mcts_supervised.MCTSNode(chess.Board(fen.format(side))) for side in "wb"]
+    mcts_supervised.expand_batch(leaves, model)
+    raw = predict(model, boards_to_planes([n.board for n in leaves]))[1]
+    rewards = [mcts_supervised.leaf_reward(n) for n in leaves]
+    assert np.allclose(rewards, raw, atol=1e-6), f"giá trị lá {rewards} khác đầu ra value head {raw}"
+    assert math.isclose(rewards[0], rewards[1], abs_tol=1e-6), f"giá trị lá phụ thuộc bên đi: {rewards}"
+    print(f"value head: target ván 0-1 = -1 ở {len(targets)} vị trí, giá trị lá White / Black đi "
+          f"{rewards[0]:+.4f} / {rewards[1]:+.4f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Huấn luyện PolicyNet từ dataset shard (engines/pgn_dataset.py)")
+    parser.add_argument("data_dir", nargs="?", help="thư mục dataset (không cần với --check-value-sign)")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--lr", type=float, default=LEARNING_RATE)
+    parser.add_argument("--blocks", type=int, default=20, help="số residual block")
+    parser.add_argument("--channels", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=2, help="số worker của DataLoader")
+    parser.add_argument("--buffer-size", type=int, default=BUFFER_SIZE, help="số mẫu trong buffer xáo trộn")
+    parser.add_argument("--val-shards", type=int, default=0)
+    parser.add_argument("--out", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--checkpoint-dir", default=None)
+    parser.add_argument("--resume", default=None)
+    parser.add_argument("--value-head", action="store_true", help="thêm value head (học kết quả ván)")
+    parser.add_argument("--value-weight", type=float, default=VALUE_WEIGHT)
+    parser.add_argument("--init", default=None, help="state_dict khởi tạo (strict=False), ví dụ model cũ")
+    parser.add_argument("--preset", choices=sorted(MODEL_PRESETS), default=None,
+                        help="cỡ mạng (thay cho --blocks / --channels)")
+    parser.add_argument("--teacher", default=None, help="checkpoint mạng lớn để distill")
+    parser.add_argument("--temperature", type=float, default=DISTILL_TEMPERATURE)
+    parser.add_argument("--alpha", type=float, default=DISTILL_ALPHA, help="trọng số phần distill trong loss")
+    parser.add_argument("--benchmark", action="store_true", help="chỉ đo tốc độ nạp dữ liệu")
+    parser.add_argument("--compare", nargs="+", default=None, metavar="MODEL",
+                        help="in bảng latency / độ chính xác của các checkpoint (dùng --teacher, --val-shards)")
+    parser.add_argument("--check-value-sign", nargs="?", const="", default=None, metavar="MODEL",
+                        help="kiểm tra quy ước dấu của value head (MODEL: checkpoint có value head, mặc định mạng nhỏ)")
+    args = parser.parse_args()
+    if args.check_value_sign is not None:
+        check_value_sign(get_model(args.check_value_sign) if args.check_value_sign else None)
+    elif args.data_dir is None:
+        parser.error("cần data_dir")
+    elif args.benchmark:
+        benchmark(args.data_dir, args.batch_size, args.workers)
+    elif args.compare:
+        shards = split_shards(args.data_dir, args.val_shards)[1] or None
+        compare_models(args.data_dir, args.compare, args.teacher, shards)
+    else:
+        train(args.data_dir, args.epochs, args.batch_size, args.lr, num_res_blocks=args.blocks,
+              num_channels=args.channels, out_path=args.out, checkpoint_dir=args.checkpoint_dir,
+              resume=args.resume, workers=args.workers, val_shards=args.val_shards,
+              buffer_size=args.buffer_size, value_head=args.value_head, value_weight=args.value_weight,
+              init_from=args.init, preset=args.preset, teacher=args.teacher,
+              distill_temperature=args.temperature, distill_alpha=args.alpha)
@@ -0,0 +1,260 @@
+# engines/transposition.py
+
+import chess
+import chess.polyglot
+from array import array
+from multiprocessing import shared_memory
+
+# === 1. Loại bound lưu trong bảng ===
+EXACT = 0        # giá trị chính xác (alpha < score < beta)
+LOWERBOUND = 1   # fail-high: giá trị thật >= score
+UPPERBOUND = 2   # fail-low: giá trị thật <= score
+
+# Mỗi entry gồm 2 số uint64: (key ^ data) và data → 16 byte / entry
+ENTRY_BYTES = 16
+
+# Bố cục 64 bit của data:
+#   bit  0..31 : score + SCORE_OFFSET (int32 có dấu)
+#   bit 32..47 : nước đi (from | to << 6 | promotion << 12), 0 = không có
+#   bit 48..55 : depth (0..255)
+#   bit 56..57 : loại bound
+#   bit 58..63 : generation (tuổi của lần search, 0..63)
+SCORE_OFFSET = 1 << 31
+GENERATION_MASK = 63
+
+
+_RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+_HASHER = chess.polyglot.ZobristHasher(_RANDOM)
+# Khoá Polyglot của từng quân: _PIECE_KEYS[color][piece_type][square], chỉ số quân = (type - 1) * 2 + color
+_PIECE_KEYS = [[None] + [_RANDOM[64 * ((pt - 1) * 2 + color):64 * ((pt - 1) * 2 + color) + 64]
+                         for pt in chess.PIECE_TYPES]
+               for color in chess.COLORS[::-1]]
+# Khoá phần quyền nhập thành theo (quyền đã chuẩn hoá, vị trí vua ở hàng cuối)
+_castling_keys = {}
+
+
+def compute_key(board: chess.Board) -> int:
+    """
+    Khoá Zobrist 64 bit của vị trí (chuẩn Polyglot, đã gồm lượt đi, quyền nhập thành, en passant).
+    Bằng chess.polyglot.zobrist_hash(board) nhưng duyệt bitboard của từng loại quân
+    thay vì gọi piece_type_at() cho từng ô.
+    """
+    key = 0
+    for color in chess.COLORS:
+        tables = _PIECE_KEYS[color]
+        occupied = board.occupied_co[color]
+        for piece_type, bb in ((chess.PAWN, board.pawns), (chess.KNIGHT, board.knights),
+                               (chess.BISHOP, board.bishops), (chess.ROOK, board.rooks),
+                               (chess.QUEEN, board.queens), (chess.KING, board.kings)):
+            table = tables[piece_type]
+            for square in chess.scan_forward(bb & occupied):
+                key ^= table[square]
+    if board.castling_rights:
+        castling = (board.clean_castling_rights(), board.kings & chess.BB_BACKRANKS)
+        castling_key = _castling_keys.get(castling)
+        if castling_key is None:
+            castling_key = _castling_keys[castling] = _HASHER.hash_castling(board)
+        key ^= castling_key
+    if board.ep_square:
+        key ^= _HASHER.hash_ep_square(board)
+    if board.turn == chess.WHITE:
+        key ^= _RANDOM[780]
+    return key
+
+
+def encode_move(move: chess.Move) -> int:
+    if move is None:
+        return 0
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code: int):
+    if code == 0:
+        return None
+    return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+
+
+def entries_for(max_mb: float) -> int:
+    """
+    Số entry (luỹ thừa của 2 lớn nhất) vừa với giới hạn max_mb.
+    """
+    n_entries = max(1, int(max_mb * 1024 * 1024) // ENTRY_BYTES)
+    return 1 << (n_entries.bit_length() - 1)
+
+
+class TranspositionTable:
+    """
+    Bảng chuyển vị (transposition table) kích thước cố định, đánh chỉ số bằng khoá Zobrist.
+
+    - max_mb: giới hạn bộ nhớ (MB). Số entry = luỹ thừa của 2 lớn nhất vừa với giới hạn.
+    - Chính sách thay thế: depth-preferred + aging — ghi đè nếu cùng vị trí,
+      entry cũ thuộc lần search trước, hoặc depth mới >= depth cũ.
+    - Mỗi entry lưu depth, score, loại bound và best move.
+    """
+
+    def __init__(self, max_mb: float = 16):
+        # Làm tròn xuống luỹ thừa của 2 để dùng phép & thay cho %
+        self.size = entries_for(max_mb)
+        self.mask = self.size - 1
+        self.keys, self.data = self._allocate()
+        self.generation = 0
+        self.reset_stats()
+
+    def _allocate(self):
+        return array('Q', bytes(8 * self.size)), array('Q', bytes(8 * self.size))
+
+    # --- Thống kê ---
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "memory_bytes": self.size * ENTRY_BYTES,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.hit_rate,
+            "stores": self.stores,
+            "overwrites": self.overwrites,
+        }
+
+    # --- Quản lý ---
+    def new_search(self):
+        """
+        Gọi trước mỗi lần search: tăng generation để entry cũ được ưu tiên thay thế,
+        và reset bộ đếm hit rate.
+        """
+        self.generation = (self.generation + 1) & GENERATION_MASK
+        self.reset_stats()
+
+    def clear(self):
+        zeros = array('Q', bytes(8 * self.size))
+        self.keys[:] = zeros
+        self.data[:] = zeros
+        self.generation = 0
+        self.reset_stats()
+
+    # --- Đọc / ghi ---
+    def probe(self, key: int):
+        """
+        Trả về (depth, score, flag, best_move) nếu có entry cho key, ngược lại None.
+        """
+        self.probes += 1
+        idx = key & self.mask
+        data = self.data[idx]
+        # Kiểm tra kiểu "lockless": keys lưu key ^ data, nên entry bị ghi dở sẽ không khớp
+        if data == 0 or (self.keys[idx] ^ data) != key:
+            return None
+        self.hits += 1
+        score = (data & 0xFFFFFFFF) - SCORE_OFFSET
+        move = decode_move((data >> 32) & 0xFFFF)
+        depth = (data >> 48) & 0xFF
+        flag = (data >> 56) & 3
+        return depth, score, flag, move
+
+    def store(self, key: int, depth: int, score: int, flag: int, move=None):
+        idx = key & self.mask
+        old = self.data[idx]
+        if old != 0:
+            same_key = (self.keys[idx] ^ old) == key
+            old_gen = old >> 58
+            old_depth = (old >> 48) & 0xFF
+            if not same_key and old_gen == self.generation and depth < old_depth:
+                # Giữ entry sâu hơn của cùng lần search
+                return
+            if same_key and move is None:
+                # Không làm mất best move đã biết của vị trí này
+                move_code = (old >> 32) & 0xFFFF
+            else:
+                move_code = encode_move(move)
+            if not same_key:
+                self.overwrites += 1
+        else:
+            move_code = encode_move(move)
+
+        data = ((score + SCORE_OFFSET) & 0xFFFFFFFF) \
+            | (move_code << 32) \
+            | (min(depth, 255) << 48) \
+            | (flag << 56) \
+            | (self.generation << 58)
+        self.keys[idx] = key ^ data
+        self.data[idx] = data
+        self.stores += 1
+
+
+def principal_variation(board: chess.Board, tt: TranspositionTable, max_len: int = 64) -> list:
+    """
+    Dựng lại biến chính (PV) bằng cách đi theo best move lưu trong bảng chuyển vị.
+    """
+    pv = []
+    b = board.copy(stack=False)
+    seen = set()
+    while len(pv) < max_len:
+        key = compute_key(b)
+        if key in seen:
+            break
+        seen.add(key)
+        entry = tt.probe(key)
+        if entry is None or entry[3] is None or not b.is_legal(entry[3]):
+            break
+        pv.append(entry[3])
+        b.push(entry[3])
+    return pv
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """
+    Bảng chuyển vị nằm trong shared memory, dùng chung giữa nhiều process (parallel search).
+    Cùng bố cục entry với TranspositionTable; entry ghi dở bởi process khác bị loại nhờ
+    kiểm tra key ^ data nên không cần khoá.
+
+    - name=None: tạo vùng nhớ mới (process chủ, chịu trách nhiệm unlink()).
+    - name=...: gắn vào vùng nhớ đã có (process worker), size phải khớp.
+    Bộ đếm thống kê và generation là riêng của từng process.
+    """
+
+    def __init__(self, max_mb: float = 16, name: str = None, size: int = None):
+        self.name = name
+        self._size_hint = size
+        super().__init__(max_mb)
+
+    def _allocate(self):
+        if self._size_hint is not None:
+            self.size = self._size_hint
+            self.mask = self.size - 1
+        nbytes = 2 * 8 * self.size
+        if self.name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.name = self.shm.name
+            self.owner = True
+        else:
+            # Worker của pool dùng chung resource tracker với process chủ nên gắn trực tiếp
+            self.shm = shared_memory.SharedMemory(name=self.name)
+            self.owner = False
+        buf = self.shm.buf
+        return buf[:8 * self.size].cast('Q'), buf[8 * self.size:nbytes].cast('Q')
+
+    def clear(self):
+        self.shm.buf[:2 * 8 * self.size] = bytes(2 * 8 * self.size)
+        self.generation = 0
+        self.reset_stats()
+
+    def close(self):
+        """
+        Giải phóng view vào shared memory; process chủ đồng thời unlink vùng nhớ.
+        """
+        self.keys.release()
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __getstate__(self):
+        raise TypeError("Truyền (tt.name, tt.size) sang process khác rồi tạo SharedTranspositionTable(name=..., size=...)")
@@ -0,0 +1,121 @@
+# game/engine_specs.py
+
+import ast
+import functools
+import sys
+from engines import greedy, minimax, negamax, mcts
+from engines.move_ordering import MoveOrderer
+from engines.transposition import TranspositionTable
+
+# === Dựng engine từ tên + tham số (dùng chung cho GUI main.py và tournament.py, không cần pygame) ===
+# Spec dạng chuỗi "Tên" hoặc "Tên:k=v,k=v", ví dụ "Negamax:depth=4,movetime=0.5", "MCTS:n_simulations=200".
+# Giá trị đọc bằng ast.literal_eval (số, True/False, chuỗi có nháy); tham số không ghi thì lấy DEFAULT_PARAMS.
+# Engine trả về là functools.partial (pickle được, gửi sang process khác được).
+# Mỗi engine dựng ra có trạng thái riêng giữ giữa các nước (bảng chuyển vị + killer / history, hoặc cây MCTS)
+# thay cho biến của module, để hai bên của một ván (GUI, tournament.py) không dùng chung bảng / cây.
+
+# Kích thước bảng chuyển vị riêng của mỗi engine Minimax / Negamax (bằng negamax.TT / minimax.TT)
+ENGINE_TT_MB = 16
+
+# Danh sách tên các engine
+ENGINE_NAMES = [
+    "Human",
+    "Greedy",
+    "Minimax",
+    "Negamax",
+    "MCTS",
+    "MCTS_supervised"
+]
+
+# Tham số mặc định của từng engine (giống các lựa chọn trong GUI)
+DEFAULT_PARAMS = {
+    "Greedy": {},
+    "Minimax": {"depth": 3},
+    "Negamax": {"depth": 3},
+    "MCTS": {"n_simulations": 10, "reuse_tree": True},
+    "MCTS_supervised": {"n_simulations": 10, "c_puct": 1.44, "reuse_tree": True},
+}
+
+
+def mcts_supervised_move(board, model=None, should_stop=None, **params):
+    from engines import mcts_supervised
+    return mcts_supervised.run_mcts_supervised(board, model=model, should_stop=should_stop, **params)[0]
+
+
+def parse_spec(spec: str):
+    """
+    "Negamax:depth=4,movetime=0.5" -> ("Negamax", {"depth": 4, "movetime": 0.5}).
+    Raise ValueError nếu tên engine không có trong ENGINE_NAMES.
+    """
+    name, _, args = spec.partition(":")
+    name = name.strip()
+    if name not in ENGINE_NAMES:
+        raise ValueError(f"Engine không hợp lệ: {name!r} (chọn một trong {', '.join(ENGINE_NAMES)})")
+    params = {}
+    for item in filter(None, (a.strip() for a in args.split(","))):
+        key, _, value = item.partition("=")
+        try:
+            params[key.strip()] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            params[key.strip()] = value.strip()
+    return name, params
+
+
+def make_engine(name: str, **params):
+    """
+    Hàm engine(board) -> chess.Move của engine name với tham số params (ghi đè DEFAULT_PARAMS),
+    None nếu là "Human". MCTS_supervised nạp model một lần khi dựng (FileNotFoundError nếu thiếu file);
+    chọn mạng bằng model_path=... hoặc preset="6x64" / "10x128" / "20x256" (model_registry.preset_path).
+    """
+    if name == "Human":
+        return None
+    params = {**DEFAULT_PARAMS[name], **params}
+    if name in ("Minimax", "Negamax"):
+        params.setdefault("tt", TranspositionTable(max_mb=ENGINE_TT_MB))
+        params.setdefault("orderer", MoveOrderer())
+    elif name in ("MCTS", "MCTS_supervised"):
+        params.setdefault("tree", mcts.SearchTree())
+    if name == "Greedy":
+        return functools.partial(greedy.greedy_move, **params)
+    elif name == "Minimax":
+        return functools.partial(minimax.get_best_move, **params)
+    elif name == "Negamax":
+        return functools.partial(negamax.get_best_move, **params)
+    elif name == "MCTS":
+        return functools.partial(mcts.run_mcts, **params)
+    else:
+        # Chỉ import torch / nạp trọng số khi engine này được chọn
+        from engines import mcts_supervised
+        from engines.model_registry import preset_path
+        preset = params.pop("preset", None)
+        path = params.pop("model_path", None) or (preset_path(preset) if preset else None)
+        model = mcts_supervised.load_model(path)
+        return functools.partial(mcts_supervised_move, model=model, **params)
+
+
+def engine_from_spec(spec: str):
+    name, params = parse_spec(spec)
+    return make_engine(name, **params)
+
+
+def reset_engines(*engines):
+    """
+    Xoá trạng thái giữ giữa các nước (bảng chuyển vị, killer / history, cây reuse_tree) để ván mới
+    độc lập với ván trước: trạng thái mặc định của các module và trạng thái riêng của engines
+    (engine do make_engine dựng).
+    """
+    negamax.TT.clear()
+    minimax.TT.clear()
+    negamax.ORDERER.clear()
+    minimax.ORDERER.clear()
+    mcts.reset_tree()
+    if "engines.mcts_supervised" in sys.modules:
+        sys.modules["engines.mcts_supervised"].reset_tree()
+    for engine in engines:
+        state = engine.keywords if isinstance(engine, functools.partial) else {}
+        if state.get("tt") is not None:
+            state["tt"].clear()
+        if state.get("orderer") is not None:
+            state["orderer"].clear()
+        if state.get("tree") is not None:
+            state["tree"].reset()
@@ -0,0 +1,227 @@
+# game/engine_worker.py
+
+import atexit
+import inspect
+import multiprocessing
+import queue
+import threading
+import time
+import chess
+from engines import greedy
+
+# === Chạy engine ở nền để vòng lặp pygame không bị treo khi engine đang nghĩ ===
+# - mode="process": engine thuần Python (Greedy, Minimax, Negamax, MCTS) chạy trong một process riêng,
+#   vì GIL không cho search bằng thread chạy song song với vòng vẽ. Process được giữ lại giữa các nước
+#   nên TT / cây MCTS của engine vẫn dùng lại được. Huỷ = terminate, lần start sau tạo process mới.
+# - mode="thread": engine dùng torch (MCTS_supervised) chạy trong thread: model đã nạp dùng chung được,
+#   torch nhả GIL khi tính. Thread không dừng cưỡng bức được → huỷ bằng should_stop nếu engine hỗ trợ,
+#   không thì kết quả của lần search đã huỷ bị bỏ qua khi về.
+# Engine là hàm engine(board) -> chess.Move; nếu nhận thêm tham số
+#   on_iteration(depth, move, value): best move tạm thời được gửi về sau mỗi vòng (xem best_move),
+#   should_stop(): engine tự dừng sớm khi bị huỷ / hết giờ (chỉ mode="thread").
+# Với mode="process", engine phải pickle được (hàm cấp module hoặc functools.partial, không dùng lambda).
+
+# Hết time_limit mà engine có should_stop: chờ thêm chừng này để engine trả best move của nó
+STOP_GRACE = 0.25
+
+
+def _board_args(board: chess.Board):
+    # FEN gốc + danh sách nước để giữ lịch sử (luật lặp lại) khi dựng lại board ở process khác
+    return board.root().fen(), [mv.uci() for mv in board.move_stack]
+
+
+def _process_main(engine, progress: bool, requests, results):
+    """
+    Vòng lặp của process engine: nhận (job_id, root_fen, moves_uci), gửi về
+    (job_id, "info", (depth, uci, value)) và cuối cùng (job_id, "bestmove", uci | None).
+    None = thoát.
+    """
+    while True:
+        job = requests.get()
+        if job is None:
+            return
+        job_id, root_fen, moves_uci = job
+        board = chess.Board(root_fen)
+        for uci in moves_uci:
+            board.push_uci(uci)
+        kwargs = {}
+        if progress:
+            kwargs["on_iteration"] = lambda depth, move, value: \
+                results.put((job_id, "info", (depth, move.uci(), value)))
+        try:
+            move = engine(board, **kwargs)
+        except Exception as e:
+            results.put((job_id, "error", repr(e)))
+            continue
+        results.put((job_id, "bestmove", move.uci() if move is not None else None))
+
+
+class EngineWorker:
+    """
+    Một engine chạy ở nền, dùng từ vòng lặp UI:
+        worker.start(board)      # bắt đầu nghĩ cho vị trí board (không chặn)
+        move = worker.poll()     # gọi mỗi frame: chess.Move khi xong, None khi còn đang nghĩ
+        worker.cancel()          # huỷ lần search hiện tại
+        worker.close()           # dừng hẳn (khi thoát)
+    Trong lúc nghĩ: worker.best_move / worker.depth là best move tạm thời (nếu engine báo về),
+    worker.elapsed là thời gian đã nghĩ.
+    time_limit (giây): giới hạn cứng. Quá hạn thì poll() trả về best move tạm thời, hoặc nước
+    của greedy nếu engine chưa báo gì, rồi huỷ search.
+    """
+
+    def __init__(self, engine, mode: str = "process", time_limit: float = None):
+        if mode not in ("process", "thread"):
+            raise ValueError(f"mode không hợp lệ: {mode!r} (process / thread)")
+        self.engine = engine
+        self.mode = mode
+        self.time_limit = time_limit
+        params = inspect.signature(engine).parameters
+        self.progress = "on_iteration" in params
+        self.stoppable = mode == "thread" and "should_stop" in params
+
+        # mode="process": hai queue được tạo lại cùng process (terminate có thể làm hỏng queue đang ghi)
+        self.results = None if mode == "process" else queue.Queue()
+        self._requests = None
+        self._process = None
+        self._thread = None
+        self._stop = None
+        self._job_id = 0
+        self.board = None
+        self._reset_job()
+        atexit.register(self.close)
+
+    def _reset_job(self):
+        self.thinking = False
+        self.best_move = None
+        self.depth = 0
+        self.value = None
+        self.started = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started if self.thinking else 0.0
+
+    # --- Bắt đầu / huỷ ---
+    def start(self, board: chess.Board):
+        """
+        Bắt đầu search cho vị trí board (lần search trước, nếu còn, bị huỷ).
+        """
+        if self.thinking:
+            self.cancel()
+        self._job_id += 1
+        self.board = board.copy()
+        self._reset_job()
+        self.thinking = True
+        self.started = time.monotonic()
+        if self.mode == "process":
+            self._ensure_process()
+            self._requests.put((self._job_id, *_board_args(self.board)))
+        else:
+            self._stop = threading.Event()
+            previous = self._thread
+            self._thread = threading.Thread(target=self._thread_main,
+                                            args=(self._job_id, self.board.copy(), self._stop, previous),
+                                            daemon=True)
+            self._thread.start()
+
+    def cancel(self):
+        """
+        Huỷ search đang chạy (không chặn). Kết quả về muộn của lần search này bị bỏ qua.
+        """
+        if not self.thinking:
+            return
+        self._reset_job()
+        if self.mode == "process":
+            self._kill_process()
+        elif self._stop is not None:
+            self._stop.set()
+
+    def close(self):
+        self.cancel()
+        if self._process is not None:
+            self._requests.put(None)
+            self._process.join(timeout=1)
+            self._kill_process()
+
+    # --- Kết quả ---
+    def poll(self):
+        """
+        Nhận các cập nhật đã có (không chặn). Trả về chess.Move khi search xong
+        (hoặc khi hết time_limit), None nếu còn đang nghĩ / không có search nào.
+        """
+        if not self.thinking:
+            return None
+        while True:
+            try:
+                job_id, kind, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if job_id != self._job_id:
+                continue  # kết quả muộn của search đã huỷ
+            if kind == "info":
+                depth, uci, value = payload
+                self.depth, self.best_move, self.value = depth, chess.Move.from_uci(uci), value
+            elif kind == "bestmove":
+                move = chess.Move.from_uci(payload) if payload is not None else None
+                return self._finish(move)
+            else:
+                print(f"Engine lỗi: {payload}")
+                return self._finish(None)
+
+        if self.time_limit is not None and self.elapsed >= self.time_limit:
+            if self.stoppable and self.elapsed < self.time_limit + STOP_GRACE:
+                self._stop.set()  # để engine tự dừng và trả best move của nó
+                return None
+            move = self.best_move
+            self.cancel()
+            return self._fallback(move)
+        return None
+
+    def _finish(self, move):
+        self.thinking = False
+        return self._fallback(move)
+
+    def _fallback(self, move):
+        # Nước không hợp lệ / không có nước: dùng greedy (nhanh) để ván vẫn tiếp tục
+        if move is not None and self.board.is_legal(move):
+            return move
+        if self.board.is_game_over():
+            return None
+        return greedy.greedy_move(self.board.copy())
+
+    # --- Process ---
+    def _ensure_process(self):
+        if self._process is not None and self._process.is_alive():
+            return
+        self._requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target=_process_main,
+                                                args=(self.engine, self.progress, self._requests, self.results))
+        self._process.start()
+
+    def _kill_process(self):
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.terminate()
+            self._process.join(timeout=1)
+            self._process = None
+
+    # --- Thread ---
+    def _thread_main(self, job_id: int, board: chess.Board, stop: threading.Event, previous):
+        # Chờ search trước (đã huỷ) dừng hẳn: engine có thể giữ trạng thái chung (cây reuse_tree)
+        if previous is not None:
+            previous.join()
+        if stop.is_set():
+            return
+        kwargs = {}
+        if self.stoppable:
+            kwargs["should_stop"] = stop.is_set
+        if self.progress:
+            kwargs["on_iteration"] = lambda depth, move, value: \
+                self.results.put((job_id, "info", (depth, move.uci(), value)))
+        try:
+            move = self.engine(board, **kwargs)
+        except Exception as e:
+            self.results.put((job_id, "error", repr(e)))
+            return
+        self.results.put((job_id, "bestmove", move.uci() if move is not None else None))
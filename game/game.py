@@ -6,7 +6,7 @@ from game.constants import WHITE, BLACK
 
 
 class Game:
-    def __init__(self, choose_engine_white=None, choose_engine_black=None):
+    def __init__(self, choose_engine_white=None, choose_engine_black=None, book=None):
         # create a python-chess Board (khởi đầu chuẩn)
         self.board = chess.Board()
 
@@ -14,6 +14,9 @@ class Game:
         self.engine_white = choose_engine_white
         self.engine_black = choose_engine_black
 
+        # sách khai cuộc (engines.opening_book.OpeningBook), None => luôn search
+        self.book = book
+
     def reset(self):
         self.board.reset()
 
@@ -32,10 +35,24 @@ class Game:
         """
         self.board.push(move)
 
+    def book_move(self):
+        """
+        Nước đi từ sách khai cuộc cho vị trí hiện tại, None nếu không có sách / ngoài sách
+        """
+        if self.book is None:
+            return None
+        return self.book.choose(self.board)
+
     def engine_move(self):
         """
         Nếu đến lượt 1 trong 2 người chơi là AI, trả về nước đi do AI tính
+        (lấy từ sách khai cuộc nếu vị trí có trong sách, không cần search)
         """
+        engine = self.engine_white if self.board.turn == chess.WHITE else self.engine_black
+        if engine:
+            move = self.book_move()
+            if move is not None:
+                return move
         if self.board.turn == chess.WHITE and self.engine_white:
             return self.engine_white(self.board.copy())  # Pass bản sao để bảo toàn trạng thái
         elif self.board.turn == chess.BLACK and self.engine_black:
@@ -2,9 +2,11 @@ import sys
 import pygame
 import chess
 from game.game import Game
+from game.engine_worker import EngineWorker
+from game.engine_specs import ENGINE_NAMES, make_engine
 from gui.board_renderer import BoardRenderer
 from gui.gui_utils import pixel_to_square, square_to_pixel
-from engines import greedy, minimax, negamax, mcts, mcts_supervised
+from engines import opening_book
 from game.constants import WIDTH, HEIGHT, SQUARE_SIZE, WHITE as COLOR_LIGHT, BLACK as COLOR_DARK
 
 # Thiết lập thông số cho menu
@@ -15,34 +17,36 @@ FONT_SIZE = 24
 
 PROMO_BG = (240, 240, 200)
 PROMO_TEXT = (0, 0, 0)
+# Ô đi / ô đến của best move tạm thời khi engine đang nghĩ
+THINKING_COLOR = (60, 120, 220)
 
-# Danh sách tên các engine
-ENGINE_NAMES = [
-    "Human",
-    "Greedy",
-    "Minimax",
-    "Negamax",
-    "MCTS",
-    "MCTS_supervised"
-]
-
-# Tạo hàm ánh xạ lựa chọn sang hàm tương ứng
+# Giới hạn cứng thời gian nghĩ của engine (giây); hết giờ thì đi best move tạm thời
+ENGINE_TIME_LIMIT = 10.0
+# Engine dùng torch chạy trong thread, các engine thuần Python chạy trong process riêng
+THREAD_ENGINES = {"MCTS_supervised"}
+
+# Tạo hàm ánh xạ lựa chọn sang hàm tương ứng (game/engine_specs.py, tham số mặc định DEFAULT_PARAMS)
 def get_engine_function(choice, color):
-    if choice == "Human":
+    if choice not in ENGINE_NAMES:
         return None
-    elif choice == "Greedy":
-        return lambda board: greedy.greedy_move(board)
-    elif choice == "Minimax":
-        return lambda board: minimax.get_best_move(board, depth=3)
-    elif choice == "Negamax":
-        return lambda board: negamax.get_best_move(board, depth=3)
-    elif choice == "MCTS":
-        return lambda board: mcts.run_mcts(board, n_simulations = 10)
-    elif choice == "MCTS_supervised":
-            return lambda board: mcts_supervised.run_mcts_supervised(board, n_simulations=10, c_puct=1.44)[0]
-    else:
+    if choice == "Negamax":
+        # Iterative deepening tới depth 3: mỗi vòng xong báo best move tạm thời về UI
+        return make_engine(choice, movetime=ENGINE_TIME_LIMIT)
+    try:
+        return make_engine(choice)
+    except FileNotFoundError as e:
+        print(f"Không dùng được {choice}:", e)
         return None
 
+def get_engine_worker(choice, engine):
+    """
+    EngineWorker chạy engine ở nền (None nếu là người chơi)
+    """
+    if engine is None:
+        return None
+    mode = "thread" if choice in THREAD_ENGINES else "process"
+    return EngineWorker(engine, mode=mode, time_limit=ENGINE_TIME_LIMIT)
+
 # Lớp Button đơn giản để hiển thị và kiểm tra click
 class Button:
     def __init__(self, rect, text, font, callback=None):
@@ -200,9 +204,12 @@ def main():
     choice_w, choice_b = show_menu(screen)
     engine_w = get_engine_function(choice_w, chess.WHITE)
     engine_b = get_engine_function(choice_b, chess.BLACK)
+    workers = {chess.WHITE: get_engine_worker(choice_w, engine_w),
+               chess.BLACK: get_engine_worker(choice_b, engine_b)}
+    names = {chess.WHITE: choice_w, chess.BLACK: choice_b}
 
     # Khởi tạo game
-    game = Game(choose_engine_white=engine_w, choose_engine_black=engine_b)
+    game = Game(choose_engine_white=engine_w, choose_engine_black=engine_b, book=opening_book.open_book())
     renderer = BoardRenderer(screen)
     selected_square = None
     running = True
@@ -210,12 +217,22 @@ def main():
 
     pending_promotion = None
     selected_square = None
+    # ESC: huỷ search đang chạy và tạm dừng engine; ESC lần nữa để engine nghĩ lại
+    paused = False
+    caption = None
 
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
 
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                paused = not paused
+                if paused:
+                    for worker in workers.values():
+                        if worker is not None:
+                            worker.cancel()
+
             if event.type == pygame.MOUSEBUTTONDOWN:
                 pos = pygame.mouse.get_pos()
                 sq = pixel_to_square(pos[0], pos[1])
@@ -264,12 +281,26 @@ def main():
                                 # Nước đi không hợp lệ → reset selection để chọn lại
                                 selected_square = None
 
-        # Lượt AI
-        if not game.is_game_over():
-            if (game.board.turn == chess.WHITE and engine_w) or (game.board.turn == chess.BLACK and engine_b):
-                ai_move = game.engine_move()
-                if ai_move:
-                    game.apply_move(ai_move)
+        # Lượt AI: engine nghĩ ở nền, vòng lặp vẫn nhận sự kiện và vẽ 30 fps
+        worker = workers[game.board.turn]
+        if running and worker is not None and not paused and not game.is_game_over():
+            if not worker.thinking:
+                ai_move = game.book_move()
+                if ai_move is None:
+                    worker.start(game.board)
+            else:
+                ai_move = worker.poll()
+            if ai_move:
+                game.apply_move(ai_move)
+
+        if worker is not None and worker.thinking:
+            best = f", best {worker.best_move.uci()} (depth {worker.depth})" if worker.best_move else ""
+            new_caption = f"Chess AI - {names[game.board.turn]} đang nghĩ {worker.elapsed:.0f}s{best} (ESC: dừng)"
+        else:
+            new_caption = "Chess AI - tạm dừng (ESC: tiếp tục)" if paused else "Chess AI"
+        if new_caption != caption:
+            caption = new_caption
+            pygame.display.set_caption(caption)
 
         # Vẽ lại bàn cờ
         renderer.draw_board()
@@ -280,6 +311,12 @@ def main():
             x, y = square_to_pixel(selected_square)
             pygame.draw.rect(screen, (0, 255, 0), (x, y, SQUARE_SIZE, SQUARE_SIZE), 3)
 
+        # Best move tạm thời của engine đang nghĩ
+        if worker is not None and worker.thinking and worker.best_move is not None:
+            for sq in (worker.best_move.from_square, worker.best_move.to_square):
+                x, y = square_to_pixel(sq)
+                pygame.draw.rect(screen, THINKING_COLOR, (x, y, SQUARE_SIZE, SQUARE_SIZE), 3)
+
         # Nếu đang chờ popup, vẽ popup (đã lưu popup_rects từ lúc set promotion)
         if pending_promotion is not None:
             for rect, p_char in popup_rects:
@@ -298,6 +335,10 @@ def main():
             pygame.time.wait(3000)
             running = False
 
+    # Dừng engine đang nghĩ trước khi thoát
+    for worker in workers.values():
+        if worker is not None:
+            worker.close()
     pygame.quit()
     sys.exit()
 
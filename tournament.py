@@ -0,0 +1,329 @@
+# tournament.py
+
+import math
+import os
+import random
+import sys
+import time
+import chess
+import chess.pgn
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from game.engine_specs import engine_from_spec, parse_spec, reset_engines
+
+# === Đấu engine với engine, không cần GUI ===
+# Mỗi vị trí khai cuộc được chơi 2 ván (đổi màu) giữa engine A và engine B, các ván chạy song song
+# trên process pool. Kết quả ghi ra PGN (mỗi ván xong ghi ngay), cuối cùng báo:
+#   - W/D/L của A, chênh lệch Elo A - B kèm khoảng tin cậy 95%
+#   - thời gian trung bình mỗi nước và nodes / giây của từng engine (MCTS: simulation / giây)
+#   - SPRT (tuỳ chọn): dừng sớm khi đủ bằng chứng Elo >= elo1 (H1) hoặc Elo <= elo0 (H0)
+#
+# Spec engine: xem game/engine_specs.py, ví dụ "Negamax:depth=4" hay "MCTS:n_simulations=200".
+
+# Khai cuộc mặc định (UCI từ vị trí đầu): mở đầu phổ biến, cân bằng
+DEFAULT_OPENINGS = [
+    "",
+    "e2e4 e7e5 g1f3 b8c6",
+    "e2e4 c7c5 g1f3 d7d6",
+    "e2e4 e7e6 d2d4 d7d5",
+    "e2e4 c7c6 d2d4 d7d5",
+    "d2d4 d7d5 c2c4 e7e6",
+    "d2d4 g8f6 c2c4 g7g6",
+    "d2d4 g8f6 c2c4 e7e6 g1f3 b7b6",
+    "c2c4 e7e5 b1c3 g8f6",
+    "g1f3 d7d5 g2g3 g8f6",
+    "e2e4 e7e5 f1c4 g8f6",
+    "d2d4 d7d5 c2c4 c7c6",
+]
+
+# Ván dài quá số nửa nước này thì xử hoà
+DEFAULT_MAX_PLIES = 200
+
+# Engine có bộ đếm node (biến module `nodes` sau mỗi lần search; với MCTS là số simulation)
+NODE_COUNTERS = {"Minimax": "engines.minimax", "Negamax": "engines.negamax", "MCTS": "engines.mcts",
+                 "MCTS_supervised": "engines.mcts_supervised"}
+
+
+def load_openings(path: str = None) -> list:
+    """
+    Danh sách vị trí khai cuộc dạng (fen, [uci...]).
+    - path=None: DEFAULT_OPENINGS.
+    - file .pgn: mainline của từng ván.
+    - file khác (.epd / .fen): mỗi dòng một vị trí (EPD 4 trường hoặc FEN đủ 6 trường).
+    """
+    start = chess.STARTING_FEN
+    if path is None:
+        return [(start, line.split()) for line in DEFAULT_OPENINGS]
+    openings = []
+    if path.endswith(".pgn"):
+        with open(path, encoding="utf-8", errors="ignore") as handle:
+            while (game := chess.pgn.read_game(handle)) is not None:
+                openings.append((game.board().fen(), [mv.uci() for mv in game.mainline_moves()]))
+        return openings
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split()
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                fen = " ".join(fields[:6])
+            else:
+                fen = " ".join(fields[:4]) + " 0 1"  # EPD: bỏ các opcode phía sau
+            openings.append((chess.Board(fen).fen(), []))
+    return openings
+
+
+# --- Chạy trong worker ---
+_engines = {}
+
+
+def _get_engine(spec: str, color: bool):
+    # Mỗi process dựng engine một lần cho mỗi màu (MCTS_supervised nạp model một lần):
+    # hai bên có bảng chuyển vị / killer / cây MCTS riêng, kể cả khi cùng spec
+    key = (spec, color)
+    if key not in _engines:
+        _engines[key] = engine_from_spec(spec)
+    return _engines[key]
+
+
+def play_game(round_no: int, white_spec: str, black_spec: str, fen: str, opening_moves: list,
+              max_plies: int = DEFAULT_MAX_PLIES) -> dict:
+    """
+    Chơi một ván white_spec (Trắng) vs black_spec (Đen) từ vị trí khai cuộc.
+    Trả về dict: result ("1-0" / "0-1" / "1/2-1/2"), termination, pgn, và theo màu:
+    moves / seconds / nodes (nodes = None nếu engine không đếm node; MCTS: số simulation).
+    """
+    board = chess.Board(fen)
+    for uci in opening_moves:
+        board.push_uci(uci)
+    engines = {chess.WHITE: _get_engine(white_spec, chess.WHITE), chess.BLACK: _get_engine(black_spec, chess.BLACK)}
+    reset_engines(*engines.values())
+    # Module của engine đã được import khi dựng engine
+    counters = {color: sys.modules.get(NODE_COUNTERS.get(parse_spec(spec)[0], ""))
+                for color, spec in ((chess.WHITE, white_spec), (chess.BLACK, black_spec))}
+    stats = {color: {"moves": 0, "seconds": 0.0, "nodes": 0 if counters[color] else None}
+             for color in chess.COLORS}
+
+    termination = "normal"
+    while True:
+        outcome = board.outcome(claim_draw=True)
+        if outcome is not None:
+            result = outcome.result()
+            break
+        if board.ply() >= max_plies:
+            result, termination = "1/2-1/2", "adjudication"
+            break
+        color = board.turn
+        start = time.perf_counter()
+        move = engines[color](board.copy())
+        elapsed = time.perf_counter() - start
+        if move is None or not board.is_legal(move):
+            # Nước không hợp lệ: xử thua
+            result, termination = ("0-1" if color == chess.WHITE else "1-0"), "illegal move"
+            break
+        stats[color]["moves"] += 1
+        stats[color]["seconds"] += elapsed
+        if counters[color] is not None:
+            stats[color]["nodes"] += counters[color].nodes
+        board.push(move)
+
+    game = chess.pgn.Game.from_board(board)
+    game.headers["Event"] = "Engine tournament"
+    game.headers["Round"] = str(round_no)
+    game.headers["White"] = white_spec
+    game.headers["Black"] = black_spec
+    game.headers["Result"] = result
+    game.headers["Termination"] = termination
+    return {
+        "round": round_no,
+        "white": white_spec,
+        "black": black_spec,
+        "result": result,
+        "termination": termination,
+        "pgn": str(game),
+        "stats": {"white": stats[chess.WHITE], "black": stats[chess.BLACK]},
+    }
+
+
+# --- Thống kê ---
+def expected_score(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_from_score(score: float) -> float:
+    # Thắng / thua toàn bộ: Elo không xác định được → ±inf
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_estimate(wins: int, draws: int, losses: int):
+    """
+    (elo, margin) của bên có W/D/L: Elo từ điểm trung bình, margin là nửa khoảng tin cậy 95%
+    (phân phối chuẩn của điểm trung bình mỗi ván). (0, inf) nếu chưa có ván nào;
+    elo = ±inf nếu thắng / thua hết.
+    """
+    n = wins + draws + losses
+    if n == 0:
+        return 0.0, math.inf
+    score = (wins + 0.5 * draws) / n
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n
+    stderr = math.sqrt(variance / n)
+    if stderr == 0:
+        return elo_from_score(score), math.inf
+    low, high = elo_from_score(score - 1.96 * stderr), elo_from_score(score + 1.96 * stderr)
+    return elo_from_score(score), (high - low) / 2
+
+
+def sprt_llr(wins: int, draws: int, losses: int, elo0: float, elo1: float) -> float:
+    """
+    Log-likelihood ratio H1 (Elo = elo1) so với H0 (Elo = elo0), xấp xỉ chuẩn theo W/D/L
+    (như GSPRT của fishtest / cutechess). Phương sai ước lượng với thêm 0.5 ván mỗi loại
+    để không bằng 0 khi mọi ván cùng kết quả.
+    """
+    n = wins + draws + losses
+    if n == 0:
+        return 0.0
+    score = (wins + 0.5 * draws) / n
+    w, d, l = wins + 0.5, draws + 0.5, losses + 0.5
+    m = (w + 0.5 * d) / (w + d + l)
+    variance = (w + 0.25 * d) / (w + d + l) - m ** 2
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return (s1 - s0) * (2 * score - s0 - s1) / (2 * variance / n)
+
+
+def sprt_bounds(alpha: float, beta: float):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run_tournament(engine_a: str, engine_b: str, openings: list = None, rounds: int = 1,
+                   workers: int = None, pgn_path: str = "tournament.pgn", max_plies: int = DEFAULT_MAX_PLIES,
+                   sprt: tuple = None, shuffle_seed: int = None, verbose: bool = True) -> dict:
+    """
+    A vs B: mỗi vị trí trong openings chơi 2 ván đổi màu, lặp rounds lần.
+    - workers: số process (mặc định os.cpu_count()).
+    - sprt: (elo0, elo1, alpha, beta) để dừng sớm khi LLR vượt ngưỡng; các ván chưa bắt đầu bị huỷ.
+    - shuffle_seed: xáo thứ tự các cặp ván (các cặp đổi màu vẫn đi liền nhau).
+    Trả về dict thống kê (W/D/L của A, elo, margin, sprt, theo engine: ms / nước và nodes / giây).
+    """
+    openings = openings if openings is not None else load_openings()
+    pairs = [opening for _ in range(rounds) for opening in openings]
+    if shuffle_seed is not None:
+        random.Random(shuffle_seed).shuffle(pairs)
+    jobs = []
+    for i, (fen, moves) in enumerate(pairs):
+        jobs.append((2 * i + 1, engine_a, engine_b, fen, moves))
+        jobs.append((2 * i + 2, engine_b, engine_a, fen, moves))
+
+    workers = workers or os.cpu_count() or 1
+    wins = draws = losses = 0
+    totals = {spec: {"moves": 0, "seconds": 0.0, "nodes": None} for spec in (engine_a, engine_b)}
+    if engine_a == engine_b:
+        totals = {engine_a: totals[engine_a]}
+    bounds = sprt_bounds(sprt[2], sprt[3]) if sprt else None
+    decision = None
+    start = time.perf_counter()
+
+    os.makedirs(os.path.dirname(pgn_path) or ".", exist_ok=True)
+    with open(pgn_path, "w", encoding="utf-8") as pgn, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_game, *job, max_plies) for job in jobs]
+        for fut in as_completed(futures):
+            if fut.cancelled():
+                continue
+            game = fut.result()
+            pgn.write(game["pgn"] + "\n\n")
+            pgn.flush()
+
+            a_white = game["white"] == engine_a
+            result = game["result"]
+            if result == "1/2-1/2":
+                draws += 1
+            elif (result == "1-0") == a_white:
+                wins += 1
+            else:
+                losses += 1
+            for side in ("white", "black"):
+                spec, s = game[side], game["stats"][side]
+                total = totals[spec]
+                total["moves"] += s["moves"]
+                total["seconds"] += s["seconds"]
+                if s["nodes"] is not None:
+                    total["nodes"] = (total["nodes"] or 0) + s["nodes"]
+
+            n = wins + draws + losses
+            if verbose:
+                elo, margin = elo_estimate(wins, draws, losses)
+                print(f"Ván {n}/{len(jobs)}: {game['white']} - {game['black']} {result} ({game['termination']})"
+                      f" | A +{wins} ={draws} -{losses}, Elo {elo:+.0f} ± {margin:.0f}")
+            if sprt:
+                llr = sprt_llr(wins, draws, losses, sprt[0], sprt[1])
+                if llr <= bounds[0] or llr >= bounds[1]:
+                    decision = "H1" if llr >= bounds[1] else "H0"
+                    for f in futures:
+                        f.cancel()
+                    if verbose:
+                        print(f"SPRT dừng: chấp nhận {decision} (LLR {llr:.2f}, ngưỡng {bounds[0]:.2f} .. {bounds[1]:.2f})")
+                    break
+
+    elapsed = time.perf_counter() - start
+    elo, margin = elo_estimate(wins, draws, losses)
+    report = {
+        "engine_a": engine_a,
+        "engine_b": engine_b,
+        "games": wins + draws + losses,
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+        "elo": elo,
+        "elo_margin": margin,
+        "seconds": elapsed,
+        "engines": {},
+    }
+    if sprt:
+        report["sprt"] = {"elo0": sprt[0], "elo1": sprt[1], "alpha": sprt[2], "beta": sprt[3],
+                          "llr": sprt_llr(wins, draws, losses, sprt[0], sprt[1]),
+                          "bounds": bounds, "decision": decision}
+    for spec, total in totals.items():
+        moves, seconds = total["moves"], total["seconds"]
+        report["engines"][spec] = {
+            "moves": moves,
+            "ms_per_move": 1000 * seconds / moves if moves else 0.0,
+            "nps": total["nodes"] / seconds if total["nodes"] is not None and seconds > 0 else None,
+        }
+    if verbose:
+        print_report(report)
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n{report['engine_a']} vs {report['engine_b']}: {report['games']} ván "
+          f"(+{report['wins']} ={report['draws']} -{report['losses']}), {report['seconds']:.1f}s")
+    print(f"Elo A - B: {report['elo']:+.1f} ± {report['elo_margin']:.1f} (95%)")
+    if "sprt" in report:
+        s = report["sprt"]
+        print(f"SPRT [{s['elo0']}, {s['elo1']}] LLR {s['llr']:.2f} "
+              f"({s['bounds'][0]:.2f} .. {s['bounds'][1]:.2f}): {s['decision'] or 'chưa kết luận'}")
+    for spec, e in report["engines"].items():
+        unit = "sim/s  " if parse_spec(spec)[0].startswith("MCTS") else "nodes/s"
+        nps = f"{e['nps']:10.0f} {unit}" if e["nps"] is not None else f"         - {unit}"
+        print(f"  {spec:30s} {e['ms_per_move']:8.1f} ms/nước {nps}  ({e['moves']} nước)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Đấu engine với engine không cần GUI (process pool), ghi PGN")
+    parser.add_argument("engine_a", help='spec engine A, ví dụ "Negamax:depth=4"')
+    parser.add_argument("engine_b", help='spec engine B, ví dụ "Minimax:depth=3"')
+    parser.add_argument("--openings", default=None, help="file .pgn / .epd vị trí khai cuộc (mặc định: danh sách có sẵn)")
+    parser.add_argument("--rounds", type=int, default=1, help="số lần lặp lại danh sách khai cuộc")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--pgn", default="tournament.pgn")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES)
+    parser.add_argument("--sprt", type=float, nargs=4, metavar=("ELO0", "ELO1", "ALPHA", "BETA"), default=None)
+    parser.add_argument("--seed", type=int, default=None, help="xáo thứ tự khai cuộc")
+    args = parser.parse_args()
+    run_tournament(args.engine_a, args.engine_b, load_openings(args.openings), args.rounds, args.workers,
+                   args.pgn, args.max_plies, tuple(args.sprt) if args.sprt else None, args.seed)